@@ -1,10 +1,33 @@
 import os
-import numpy as np
+from concurrent.futures import Future, ThreadPoolExecutor
+
 import pandas as pd
 import streamlit as st
 import altair as alt
 from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode
 
+from fluxo import compartilhado, consulta, ingest
+from fluxo.alertas import (
+    baseline_alertas, classificar_alertas, filtrar_alertas, filtrar_sequencias, sequencias_zero, ultimo_dia,
+)
+from fluxo.ao_vivo import Acompanhamento
+from fluxo.cache import CacheLRU, chave_do_filtro
+from fluxo.comparacao import (
+    EIXOS_PODIO, comparar_grupos, comparar_por_dia, comparar_por_hora, diferenca, longo_ab, lojas_por_fluxo,
+    matrizes, normalizar_por_hora, paginar_lojas, placar_horas, podio, semelhantes, similaridade,
+    soma_grupos, soma_hora_lojas, totais,
+)
+from fluxo.cubo import (
+    heatmap_data_hora, kpis, ranking_lojas, recortar,
+    serie_diaria,
+)
+from fluxo.exportar import FORMATOS_EXPORT, gerar_export
+from fluxo.historico import Historico
+from fluxo.indice import indexar
+from fluxo.perf import Medidor
+from fluxo.series import reamostrar_serie
+from fluxo.tabela import filtrar_linhas, linhas_do_recorte, ordem_grid, pagina
+
 # Altair: remove limite padrão de linhas (evita warning/corte)
 alt.data_transformers.disable_max_rows()
 
@@ -195,8 +218,28 @@ st.caption("Filtro → KPIs → Gráficos → Grid → Alertas → Comparar Loja
 # ---------- Sidebar ----------
 st.sidebar.header("⚙️ Configurações")
 
-uploaded = st.sidebar.file_uploader("Envie o Excel (opcional)", type=["xlsx", "xls"])
+uploaded = st.sidebar.file_uploader("Envie Excel/CSV (opcional, um ou vários)", type=["xlsx", "xlsm", "csv"],
+                                    accept_multiple_files=True)
 use_clean_csv = st.sidebar.checkbox("Usar CSV já limpo (fluxo_seed_limpo.csv)", value=True)
+pasta_dados = st.sidebar.text_input("Pasta com exportações (opcional)", value=os.environ.get("FLUXO_PASTA_DADOS", ""),
+                                    help="Ingere todos os CSV/Excel da pasta; recargas leem só os arquivos novos.").strip()
+arquivo_vivo = st.sidebar.text_input(
+    "Arquivo ao vivo (CSV que cresce, opcional)", value=os.environ.get("FLUXO_ARQUIVO_VIVO", ""),
+    help="Acompanha o CSV a partir do último byte lido: só as linhas novas são lidas e aplicadas. "
+         "Tem prioridade sobre as outras fontes."
+).strip()
+intervalo_vivo = st.sidebar.number_input("Verificar o arquivo a cada (s)", 5, 3600, 30, 5,
+                                         disabled=not arquivo_vivo)
+base_duckdb = st.sidebar.text_input(
+    "Base DuckDB (Parquet/CSV grande, opcional)", value=os.environ.get("FLUXO_DUCKDB", ""),
+    help="Arquivo, pasta ou curinga (ex.: dados/*.parquet). Filtros e agregações rodam como SQL num DuckDB "
+         "embutido e só os resultados agregados vão para a memória — para históricos maiores que a RAM."
+).strip()
+historico_sqlite = st.sidebar.text_input(
+    "Histórico SQLite (arquivo .sqlite, opcional)", value=os.environ.get("FLUXO_SQLITE", ""),
+    help="Grava a fonte carregada num SQLite local (upsert por Loja, Data, Hora), acumulando as exportações; "
+         "o dashboard consulta o histórico pelo índice e reabrir lê só as páginas do filtro."
+).strip()
 
 # Alertas
 st.sidebar.markdown("### 🚨 Alertas (queda vs baseline)")
@@ -204,205 +247,278 @@ baseline_window = st.sidebar.slider("Janela da média móvel (dias)", 5, 30, 7,
 pct_alerta = st.sidebar.slider("Alerta (queda ≥ X%)", 5, 60, 20, 5)
 pct_critico = st.sidebar.slider("Crítico (queda ≥ Y%)", 10, 90, 40, 5)
 
-# Zero prolongado (opcional) — listagem detalhada ativaremos depois
+# Zero prolongado: N+ horas seguidas com fluxo 0 ou sem registro (possível falha de sensor)
 min_consecutive_zero = st.sidebar.slider("Horas consecutivas com fluxo = 0 (sinalizar)", 2, 8, 4, 1)
 
+# Séries longas (evolução diária, A vs B diário, grupos diário)
+st.sidebar.markdown("### 📉 Séries longas")
+resolucao_series = st.sidebar.selectbox(
+    "Resolução", ["Automática", "Dia", "Semana", "Mês", "LTTB"], index=0,
+    help="Automática agrega por dia/semana/mês conforme o período; LTTB mantém os N dias mais representativos."
+)
+pontos_alvo = st.sidebar.slider("Pontos por série (alvo)", 100, 2000, 500, 100)
+
+formato_export = st.sidebar.selectbox("Formato de exportação", ["CSV", "CSV (gzip)", "Parquet"], index=0,
+                                      help="Os arquivos só são gerados ao clicar no botão de download de cada seção.")
+
 st.sidebar.markdown("---")
-st.sidebar.caption("Dica: na grid, use a **sidebar do AgGrid** para pinar colunas, filtrar e agrupar.")
+st.sidebar.caption("Dica: na grid, use a **sidebar do AgGrid** para pinar colunas e agrupar; ordenação e filtro ficam acima da tabela.")
+info_cache = st.sidebar.empty()  # estatísticas do cache de agregados (preenchido após os cálculos)
+
+# Painel de desempenho (opt-in): tempo por seção, RSS, tamanho dos frames, cache, cProfile
+debug_perf = st.sidebar.checkbox("🔧 Painel de desempenho (debug)", value=os.environ.get("FLUXO_DEBUG") == "1")
+perfilar = debug_perf and st.sidebar.checkbox(
+    "Gravar cProfile (guarda o rerun mais lento)", value=False,
+    help="O cProfile deixa o rerun mais lento; use só para investigar."
+)
+painel_perf = st.sidebar.empty()
+# Seções independentes calculadas ao mesmo tempo num pool de threads (numpy/pandas soltam o GIL)
+paralelo = st.sidebar.checkbox(
+    "⚡ Calcular seções em paralelo", value=os.environ.get("FLUXO_PARALELO") == "1",
+    help="KPIs, gráficos, ranking, heatmap, grid, alertas e comparação são calculados juntos; "
+         "cada seção aparece assim que o seu cálculo termina."
+)
+med = Medidor(debug_perf, perfilar)
 
 # ---------- Helpers ----------
-@st.cache_data(show_spinner=False)
-def read_clean_or_raw(uploaded_file, use_clean=True):
+# Limite de memória do cache LRU de agregados por estado de filtro (MB)
+CACHE_AGREGADOS_MB = float(os.environ.get("FLUXO_CACHE_AGREGADOS_MB", "256"))
+# Facetas por página nos small multiples (seleções grandes geram specs enormes no navegador)
+FACETAS_POR_PAGINA = 12
+# Threads do pool das seções (modo paralelo), compartilhado por todas as sessões
+TRABALHADORES_SECOES = int(os.environ.get("FLUXO_TRABALHADORES", min(8, os.cpu_count() or 1)))
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _digest_upload(file_id, _arquivo):
+    """Hash do arquivo enviado — calculado uma vez por upload (file_id), não a cada rerun."""
+    return ingest.digest(_arquivo.getvalue())
+
+
+def resolver_fonte(uploaded_files, use_clean=True, diretorio=""):
     """
-    1) Se existir fluxo_seed_limpo.csv no diretório, usa (rápido).
-    2) Se o usuário enviar um Excel, detecta cabeçalho automaticamente.
-    3) Como último recurso, tenta ler o Excel local 'Fluxo SEED 30d.xlsx'.
+    Escolhe a fonte de dados (mesma prioridade de read_clean_or_raw) e devolve
+    (chave, tipo, origem). A chave identifica o conteúdo da fonte; None se não há fonte.
     """
-    # 1) CSV limpo
-    if use_clean and os.path.exists("fluxo_seed_limpo.csv"):
-        df = pd.read_csv("fluxo_seed_limpo.csv")
-        df["Data"] = pd.to_datetime(df["Data"], dayfirst=True, errors="coerce")
-        df["Hora"] = pd.to_numeric(df["Hora"], errors="coerce").astype("Int64")
-        df["Fluxo"] = pd.to_numeric(df["Fluxo"], errors="coerce")
-        for c in ["Company", "Loja", "ID_Loja"]:
-            if c in df.columns:
-                df[c] = df[c].astype(str).str.strip()
-        return df
-
-    # 2) Excel enviado
-    if uploaded_file is not None:
-        try:
-            raw = pd.read_excel(uploaded_file, sheet_name="Fluxo seed 30d", header=None, engine="openpyxl")
-        except Exception:
-            raw = pd.read_excel(uploaded_file, header=None, engine="openpyxl")
-
-        expected = {"Company", "Loja", "ID_Loja", "Data", "Hora", "Fluxo"}
-        header_idx = None
-        for i, row in raw.iterrows():
-            vals = set(str(x).strip() for x in row.values if pd.notna(x))
-            if expected.issubset(vals):
-                header_idx = i
-                break
-        if header_idx is None:
-            for i, row in raw.iterrows():
-                vals = set(str(x).strip() for x in row.values if pd.notna(x))
-                if {"Loja", "Data", "Fluxo"}.issubset(vals):
-                    header_idx = i
-                    break
-        if header_idx is None:
-            st.error("Não foi possível detectar o cabeçalho no Excel. Envie o CSV limpo ou verifique a planilha.")
-            return pd.DataFrame()
-
-        # Constrói o DataFrame usando a linha de cabeçalho detectada
-        header = raw.iloc[header_idx].astype(str).tolist()
-        # Dedup de nomes de coluna (Data, Data.1 etc)
-        counts, header_dedup = {}, []
-        for h in header:
-            if h in counts:
-                counts[h] += 1
-                header_dedup.append(f"{h}.{counts[h]}")
-            else:
-                counts[h] = 0
-                header_dedup.append(h)
+    if use_clean and os.path.exists(ingest.CSV_LIMPO):
+        return ingest.fonte_caminho(ingest.CSV_LIMPO)
+    if diretorio and os.path.isdir(diretorio):
+        fonte = ingest.fonte_caminho(diretorio)
+        if fonte:
+            return fonte
+    if uploaded_files:
+        arquivos = tuple((f.name, f.getvalue(), _digest_upload(f.file_id, f)) for f in uploaded_files)
+        return ingest.chave_conjunto("uploads", [d for _, _, d in arquivos]), "uploads", arquivos
+    if os.path.exists(ingest.EXCEL_LOCAL):
+        return ingest.fonte_caminho(ingest.EXCEL_LOCAL, "excel_local")
+    return None
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _carregar_fonte(chave, tipo, _origem):
+    """
+    Carrega a fonte pelo Parquet em cache (se existir) ou converte uma única vez.
+    As colunas ficam em arquivos mapeados em memória (fluxo.compartilhado): todas
+    as sessões deste processo e os outros processos do servidor leem as mesmas
+    páginas, sem cópia — por isso o df NUNCA deve ser alterado in-place. Retorna (df, erros).
+    """
+    return compartilhado.carregar(chave, tipo, _origem)
 
-        data = raw.iloc[header_idx + 1:].copy()
-        data.columns = header_dedup
 
-        # Seleciona e renomeia colunas padrão
-        def pick(name):
-            cols = [c for c in data.columns if c.split(".")[0] == name]
-            return cols[0] if cols else None
+def read_clean_or_raw(uploaded_files, use_clean=True, diretorio=""):
+    """
+    1) Se existir fluxo_seed_limpo.csv no diretório, usa (rápido).
+    2) Se for informada uma pasta de exportações, ingere todos os CSV/Excel dela.
+    3) Se o usuário enviar arquivos (um ou vários), detecta cabeçalho automaticamente.
+    4) Como último recurso, tenta ler o Excel local 'Fluxo SEED 30d.xlsx'.
+    Qualquer fonte é convertida uma única vez para Parquet (chave = hash do conteúdo)
+    e as chamadas seguintes — inclusive após reiniciar o servidor — leem o Parquet.
+    Vários arquivos são lidos em paralelo; de uma pasta, só os novos (manifesto).
+    """
+    fonte = resolver_fonte(uploaded_files, use_clean, diretorio)
+    if fonte is None:
+        return pd.DataFrame()
+    df, erros = _carregar_fonte(*fonte)
+    for erro in erros:
+        st.error(erro)
+    return df
 
-        mapping = {n: pick(n) for n in ["Company", "Loja", "ID_Loja", "Data", "Hora", "Fluxo"]}
-        keep = [c for c in mapping.values() if c]
-        if not keep:
-            st.error("Não encontrei colunas esperadas (Company/Loja/ID_Loja/Data/Hora/Fluxo).")
-            return pd.DataFrame()
 
-        df = data[keep].rename(columns={v: k for k, v in mapping.items() if v})
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _carregar_cubo(chave, _df):
+    """Cubo mapeado em memória, compartilhado entre processos (montado só pelo primeiro)."""
+    return compartilhado.carregar_cubo(_df)
 
-        # Coerções
-        if "Data" in df.columns:
-            df["Data"] = pd.to_datetime(df["Data"], dayfirst=True, errors="coerce")
-        if "Hora" in df.columns:
-            df["Hora"] = pd.to_numeric(df["Hora"], errors="coerce").astype("Int64")
-        if "Fluxo" in df.columns:
-            df["Fluxo"] = pd.to_numeric(df["Fluxo"], errors="coerce")
 
-        for c in ["Company", "Loja", "ID_Loja"]:
-            if c in df.columns:
-                df[c] = df[c].astype(str).str.strip()
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _acompanhamento(caminho):
+    """Estado do modo ao vivo (offset + agregados), um por arquivo, compartilhado pelas sessões."""
+    return Acompanhamento(caminho)
 
-        df = df.dropna(how="all", subset=[c for c in ["Data", "Hora", "Fluxo", "Loja"] if c in df.columns])
 
-        return df
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _base_duckdb(fonte, assinatura):
+    """Fonte registrada no DuckDB (uma por fonte e versão dos arquivos), compartilhada pelas sessões."""
+    return consulta.BaseDuckDB(fonte)
 
-    # 3) Excel local original
-    if os.path.exists("Fluxo SEED 30d.xlsx"):
-        try:
-            raw = pd.read_excel("Fluxo SEED 30d.xlsx", sheet_name="Fluxo seed 30d", header=None, engine="openpyxl")
-        except Exception:
-            raw = pd.read_excel("Fluxo SEED 30d.xlsx", header=None, engine="openpyxl")
-        # Reaproveita a mesma lógica acima
-        expected = {"Company", "Loja", "ID_Loja", "Data", "Hora", "Fluxo"}
-        header_idx = None
-        for i, row in raw.iterrows():
-            vals = set(str(x).strip() for x in row.values if pd.notna(x))
-            if expected.issubset(vals):
-                header_idx = i
-                break
-        if header_idx is None:
-            for i, row in raw.iterrows():
-                vals = set(str(x).strip() for x in row.values if pd.notna(x))
-                if {"Loja", "Data", "Fluxo"}.issubset(vals):
-                    header_idx = i
-                    break
-        if header_idx is None:
-            return pd.DataFrame()
-
-        header = raw.iloc[header_idx].astype(str).tolist()
-        counts, header_dedup = {}, []
-        for h in header:
-            if h in counts:
-                counts[h] += 1
-                header_dedup.append(f"{h}.{counts[h]}")
-            else:
-                counts[h] = 0
-                header_dedup.append(h)
 
-        data = raw.iloc[header_idx + 1:].copy()
-        data.columns = header_dedup
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _historico(caminho):
+    """Histórico SQLite aberto (uma conexão por thread), compartilhado pelas sessões."""
+    return Historico(caminho)
 
-        def pick(name):
-            cols = [c for c in data.columns if c.split(".")[0] == name]
-            return cols[0] if cols else None
 
-        mapping = {n: pick(n) for n in ["Company", "Loja", "ID_Loja", "Data", "Hora", "Fluxo"]}
-        keep = [c for c in mapping.values() if c]
-        if not keep:
-            return pd.DataFrame()
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _carregar_indice(chave, _df):
+    """Offsets das linhas por loja/dia (a base já vem ordenada por Loja, Data, Hora)."""
+    return indexar(_df)
 
-        df = data[keep].rename(columns={v: k for k, v in mapping.items() if v})
 
-        if "Data" in df.columns:
-            df["Data"] = pd.to_datetime(df["Data"], dayfirst=True, errors="coerce")
-        if "Hora" in df.columns:
-            df["Hora"] = pd.to_numeric(df["Hora"], errors="coerce").astype("Int64")
-        if "Fluxo" in df.columns:
-            df["Fluxo"] = pd.to_numeric(df["Fluxo"], errors="coerce")
+@st.cache_resource(show_spinner=False)
+def _cache_agregados(limite_mb):
+    return CacheLRU(int(limite_mb * 2**20))
 
-        for c in ["Company", "Loja", "ID_Loja"]:
-            if c in df.columns:
-                df[c] = df[c].astype(str).str.strip()
 
-        df = df.dropna(how="all", subset=[c for c in ["Data", "Hora", "Fluxo", "Loja"] if c in df.columns])
+@st.cache_resource(show_spinner=False)
+def _pool_secoes(trabalhadores):
+    return ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix="fluxo-secao")
 
-        return df
 
-    # Sem dados
-    return pd.DataFrame()
+def tooltip_serie(plot, *extras, col="Fluxo"):
+    """Tooltip das séries: valores exatos do dia ou, em buckets, período + estatísticas diárias."""
+    if "Dias" not in plot.columns:
+        return ["Data", *extras, alt.Tooltip(f"{col}:Q", format=",.0f")]
+    return [alt.Tooltip("Data:T", title="Início"), alt.Tooltip("Fim:T", title="Fim"), *extras,
+            alt.Tooltip(f"{col}:Q", title="Soma", format=",.0f"), "Dias",
+            alt.Tooltip("Mín. dia:Q", format=",.0f"), alt.Tooltip("Máx. dia:Q", format=",.0f")]
 
-def add_alertas(df, janela=7, x=20, y=40):
-    """Calcula alertas por LOJA/DIA vs média móvel da própria loja."""
-    if df.empty:
-        return df, pd.DataFrame()
 
-    di = df.groupby(["Loja", "ID_Loja", "Data"], as_index=False)["Fluxo"].sum()
-    di = di.sort_values(["Loja", "Data"])
+def mostrar_perf():
+    """Fecha as medições do rerun e preenche o painel de desempenho (só em modo debug)."""
+    if not med.ativo:
+        return
+    med.fim()
+    mb = 2**20
+    lru = cache_ag.stats()
+    hits, misses = lru["hits"] - lru_inicio["hits"], lru["misses"] - lru_inicio["misses"]
+    with painel_perf.container():
+        st.markdown("### 🔧 Desempenho (último rerun)")
+        st.caption(
+            f"Total: **{med.total * 1000:.0f} ms** · RSS {med.rss_inicio / mb:.0f} → {med.rss_fim / mb:.0f} MB "
+            f"({(med.rss_fim - med.rss_inicio) / mb:+.1f} MB)"
+        )
+        st.dataframe(med.tabela_secoes(), hide_index=True, use_container_width=True)
+        st.caption("Intermediários em memória")
+        st.dataframe(med.tabela_frames(), hide_index=True, use_container_width=True)
+        st.caption(
+            f"Cache de agregados neste rerun: {hits} hits / {misses} misses"
+            f" ({hits / (hits + misses) if hits + misses else 0:.0%}) · acumulado {lru['taxa_acerto']:.0%}"
+        )
 
-    # Média móvel por loja (mínimo de dados para começar = metade da janela, pelo menos 2)
-    minp = max(2, janela // 2)
-    di["mm_baseline"] = di.groupby("Loja")["Fluxo"].transform(lambda s: s.rolling(window=janela, min_periods=minp).mean())
+        if perfilar:
+            pior = st.session_state.get("perf_mais_lento")
+            if pior is None or med.total > pior["total"]:
+                pior = {"total": med.total, "texto": med.perfil_texto(), "prof": med.perfil_bytes()}
+                st.session_state["perf_mais_lento"] = pior
+            with st.expander(f"cProfile do rerun mais lento ({pior['total'] * 1000:.0f} ms)"):
+                st.code(pior["texto"], language="text")
+            st.download_button("💾 Baixar .prof (pstats/snakeviz)", data=pior["prof"],
+                               file_name="fluxo_rerun_mais_lento.prof", key="perf_prof")
 
-    # Variação %
-    di["var_pct"] = np.where(
-        di["mm_baseline"].gt(0),
-        (di["Fluxo"] - di["mm_baseline"]) / di["mm_baseline"] * 100.0,
-        np.nan
-    )
 
-    def status(v):
-        if pd.isna(v):
-            return "—"
-        if v <= -y:
-            return "Crítico"
-        if v <= -x:
-            return "Alerta"
-        return "No prazo"
+def botao_exportar(rotulo, obter_df, nome_arquivo):
+    """
+    Export preguiçoso: nada é serializado no rerun comum. O arquivo só é gerado
+    (no formato escolhido na sidebar) quando o usuário clica em "preparar".
+    """
+    ext, mime = FORMATOS_EXPORT[formato_export]
+    if st.button(f"{rotulo} ({formato_export})", key=f"exp_{nome_arquivo}"):
+        with st.spinner("Gerando arquivo..."):
+            dados = gerar_export(obter_df(), formato_export)
+        tamanho = f"{len(dados) / 2**20:.1f} MB" if len(dados) >= 2**20 else f"{len(dados) / 1024:.0f} KB"
+        st.download_button(
+            f"💾 Salvar {nome_arquivo}{ext} ({tamanho})",
+            data=dados,
+            file_name=f"{nome_arquivo}{ext}",
+            mime=mime,
+            key=f"dl_{nome_arquivo}"
+        )
 
-    di["Status"] = di["var_pct"].apply(status)
-    return df, di
 
 # ---------- Carga ----------
-df = read_clean_or_raw(uploaded, use_clean=use_clean_csv)
-
-if df.empty:
-    st.warning("Envie o arquivo ou deixe marcado **Usar CSV já limpo** (se estiver na pasta).")
+med.etapa("Carga")
+acomp = vivo = sql = None
+if arquivo_vivo and not os.path.isfile(arquivo_vivo):
+    st.error(f"Arquivo ao vivo não encontrado: {arquivo_vivo}")
+elif arquivo_vivo:
+    acomp = _acompanhamento(os.path.abspath(arquivo_vivo))
+    try:
+        acomp.atualizar()
+    except (OSError, ValueError) as e:
+        st.error(f"Modo ao vivo: {e}")
+    # Cubo e agregados mantidos incrementalmente; o retrato é imutável e a chave muda a cada lote
+    vivo = acomp.retrato()
+elif base_duckdb:
+    try:
+        sql = _base_duckdb(base_duckdb, consulta.assinatura(base_duckdb))
+    except (OSError, ValueError) as e:
+        st.error(f"Base DuckDB: {e}")
+elif historico_sqlite:
+    try:
+        hist = _historico(os.path.abspath(historico_sqlite))
+        # A fonte atual entra no histórico uma única vez (chave de conteúdo); depois só o índice é lido
+        fonte = resolver_fonte(uploaded, use_clean_csv, pasta_dados)
+        if fonte is not None and not hist.gravada(fonte[0]):
+            # Fora do cache_resource: as linhas só passam pela memória durante o upsert
+            novas, erros = ingest.carregar(*fonte)
+            for erro in erros:
+                st.error(erro)
+            hist.gravar(novas, fonte[0])
+            del novas
+        sql = hist.atualizar()
+    except (OSError, ValueError) as e:
+        st.error(f"Histórico SQLite: {e}")
+if acomp is None and sql is None:
+    df = read_clean_or_raw(uploaded, use_clean=use_clean_csv, diretorio=pasta_dados)
+    med.frame("df (base)", df)
+
+if acomp is not None:
+    @st.fragment(run_every=int(intervalo_vivo))
+    def vigiar_arquivo():
+        """Só este trecho roda no intervalo: lê as linhas novas e refaz a página se chegou algo."""
+        try:
+            acomp.atualizar()
+        except (OSError, ValueError) as e:
+            st.error(f"Modo ao vivo: {e}")
+            return
+        st.caption(f"🔴 Ao vivo: {acomp.linhas:,} linhas lidas de {os.path.basename(arquivo_vivo)} · "
+                   f"verificado às {pd.Timestamp.now():%H:%M:%S}".replace(",", "."))
+        if acomp.chave != vivo.chave:
+            st.rerun()
+
+    vigiar_arquivo()
+
+# Backend SQL (DuckDB ou histórico SQLite) ou retrato ao vivo: só o domínio (período, lojas, horas) é lido
+base = sql if sql is not None else vivo
+sem_dados = base.dominio() is None if base is not None else df.empty
+if sem_dados:
+    if acomp is not None:
+        st.info("Aguardando linhas no arquivo ao vivo...")
+    else:
+        st.warning("Envie o arquivo ou deixe marcado **Usar CSV já limpo** (se estiver na pasta).")
     st.stop()
 
 # ---------- Filtros ----------
-min_d, max_d = df["Data"].min().date(), df["Data"].max().date()
-lojas = sorted(df["Loja"].dropna().unique().tolist())
+med.etapa("Filtros")
+if base is not None:
+    d_ini, d_fim, lojas, hmin, hmax = base.dominio()
+    min_d, max_d = d_ini.date(), d_fim.date()
+    chave_dados = base.chave
+else:
+    min_d, max_d = df["Data"].min().date(), df["Data"].max().date()
+    lojas = df["Loja"].cat.categories.tolist()  # categorias já vêm ordenadas
+    hmin, hmax = int(df["Hora"].min()), int(df["Hora"].max())
+    chave_dados = df.attrs["chave"]
 
 c1, c2, c3 = st.columns([2, 2, 1])
 with c1:
@@ -411,52 +527,167 @@ with c1:
 with c2:
     f_lojas = st.multiselect("Lojas", options=lojas, default=lojas)
 with c3:
-    hmin, hmax = int(df["Hora"].min()), int(df["Hora"].max())
     f_horas = st.slider("Horas", min_value=hmin, max_value=hmax, value=(hmin, hmax), step=1)
 
-# Aplica filtros
-mask = (
-    (df["Data"].between(f_inicio, f_fim)) &
-    (df["Loja"].isin(f_lojas)) &
-    (df["Hora"].between(f_horas[0], f_horas[1]))
-)
-df_f = df.loc[mask].copy()
+# Derivados do filtro são memoizados pela chave normalizada (período, lojas, horas):
+# reruns que só mexem em tema, modo de comparação, Top N etc. não recalculam nada.
+cache_ag = _cache_agregados(CACHE_AGREGADOS_MB)
+lru_inicio = cache_ag.stats()
+filtro = (f_inicio, f_fim, f_lojas, f_horas)
+# Ao vivo, a chave é a do último lote com linhas dentro do filtro: os outros lotes não invalidam nada
+chave_filtro = chave_do_filtro(acomp.chave_recorte(vivo, *filtro) if acomp is not None else chave_dados,
+                               f_inicio, f_fim, f_lojas, f_horas)
+
+
+def memo(nome, calcular, *params):
+    return cache_ag.obter((chave_filtro, nome) + params, calcular)
+
+
+if sql is None:
+    # Todas as agregações saem do cubo denso (fatias + somas por eixo), não de groupby sobre df_f
+    if acomp is not None:
+        # Ao vivo não há cubo inteiro: o recorte é montado só com os blocos de dias do período
+        rec = memo("recorte", lambda: vivo.recortar(*filtro))
+    else:
+        indice = _carregar_indice(chave_dados, df)
+        cubo = _carregar_cubo(chave_dados, df)
+        rec = memo("recorte", lambda: recortar(cubo, *filtro))
+        med.frame("cubo", cubo)
+    med.frame("recorte do cubo", rec)
+
+
+def calcular_baseline():
+    if sql is not None:
+        return sql.baseline_alertas(baseline_window)
+    return baseline_alertas(cubo, janela=baseline_window)
+
+
+def calcular_zeros():
+    if sql is not None:
+        return sql.sequencias_zero(min_consecutive_zero)
+    if acomp is not None:
+        return acomp.sequencias_zero(vivo, min_consecutive_zero)
+    return sequencias_zero(cubo, minimo=min_consecutive_zero)
+
+
+def linhas_filtradas():
+    if acomp is not None:
+        # Ao vivo não há base de linhas: a tabela sai das células com registro do recorte
+        return linhas_do_recorte(rec, vivo.empresas)
+    # Faixas contíguas por loja/dia (searchsorted no índice), sem máscara sobre a base
+    return filtrar_linhas(df, *filtro, indice)
+
+
+def matrizes_historico():
+    """Matrizes da base inteira (todas as lojas, datas e horas): referência da normalização por hora."""
+    def calcular():
+        if sql is not None:
+            d0, d1, todas, h0, h1 = sql.dominio()
+            return sql.matrizes(d0, d1, todas, (h0, h1))
+        if acomp is not None:
+            return vivo.matrizes()
+        return matrizes(cubo)
+    return cache_ag.obter((chave_dados, "matrizes_historico"), calcular)
+
+
+def alertas_filtrados():
+    """(baseline da base inteira, linhas do filtro) dos alertas."""
+    if acomp is not None:
+        # Ao vivo, a média móvel fica nos blocos do acompanhamento e só as linhas do filtro são montadas;
+        # a chave é a do último lote com linhas dessas lojas até o fim do período
+        chave = chave_do_filtro(acomp.chave_alertas(vivo, f_fim, f_lojas), f_inicio, f_fim, f_lojas, f_horas)
+        return None, cache_ag.obter((chave, "alertas", baseline_window),
+                                    lambda: acomp.alertas(vivo, baseline_window, f_inicio, f_fim, f_lojas))
+    # Média móvel: cacheada só por janela (base inteira — o baseline usa o histórico antes do filtro)
+    di = cache_ag.obter((chave_dados, "baseline_alertas", baseline_window), calcular_baseline)
+    indice_di = cache_ag.obter((chave_dados, "indice_alertas", baseline_window), lambda: indexar(di))
+    # chave_dados também no memo: os alertas dependem da base inteira, não só das células do recorte
+    return di, memo("alertas", lambda: filtrar_alertas(di, f_inicio, f_fim, f_lojas, indice_di),
+                    baseline_window, chave_dados)
+
+
+def zeros_filtrados():
+    # Detecção na base inteira (cacheada por N); o filtro só escolhe quais sequências mostrar.
+    # Ao vivo, só as lojas tocadas pelos lotes novos são refeitas.
+    seq_zero = cache_ag.obter((chave_dados, "sequencias_zero", min_consecutive_zero), calcular_zeros)
+    return memo("zeros", lambda: filtrar_sequencias(seq_zero, f_inicio, f_fim, f_lojas),
+                min_consecutive_zero, chave_dados)
+
+
+# Derivados independentes do filtro (só leem df, cubo e recorte). No modo paralelo vão todos
+# para o pool já aqui e cada seção espera só o seu; senão, cada um é calculado na sua seção.
+if sql is not None:
+    # Backend SQL: um GROUP BY por derivado, com o filtro no WHERE (a grid consulta por página)
+    secoes = {
+        "df_f": lambda: None,
+        "daily": lambda: memo("daily", lambda: sql.serie_diaria(*filtro)),
+        "rank": lambda: memo("rank", lambda: sql.ranking_lojas(*filtro)),
+        "pivot": lambda: memo("pivot", lambda: sql.heatmap_data_hora(*filtro)),
+        "matrizes": lambda: memo("matrizes", lambda: sql.matrizes(*filtro)),
+    }
+else:
+    secoes = {
+        "df_f": lambda: memo("df_f", linhas_filtradas),
+        "daily": lambda: memo("daily", lambda: serie_diaria(rec)),
+        "rank": lambda: memo("rank", lambda: ranking_lojas(rec)),
+        "pivot": lambda: memo("pivot", lambda: heatmap_data_hora(rec)),
+        # Loja × Hora e Loja × Data uma vez por filtro: comparação e small multiples só selecionam e somam linhas
+        "matrizes": lambda: memo("matrizes", lambda: matrizes(rec)),
+    }
+secoes.update(alertas=alertas_filtrados, zeros=zeros_filtrados)
+if paralelo:
+    pool = _pool_secoes(TRABALHADORES_SECOES)
+    # med.tarefa: com cProfile ligado, o que roda nas threads do pool também entra no perfil do rerun
+    secoes = {nome: pool.submit(med.tarefa(calcular)) for nome, calcular in secoes.items()}
+
+
+def secao(nome):
+    """Resultado de um derivado; no modo paralelo, um placeholder fica na página até o cálculo terminar."""
+    calculo = secoes[nome]
+    if not isinstance(calculo, Future):
+        return calculo()
+    if not calculo.done():
+        with st.spinner("Calculando..."):
+            return calculo.result()
+    return calculo.result()
+
 
 # ---------- KPIs ----------
+med.etapa("KPIs")
+daily = secao("daily")
+ind = kpis(daily)
 k1, k2, k3, k4 = st.columns(4)
 with k1:
-    st.metric("Fluxo (soma)", f"{int(df_f['Fluxo'].sum()):,}".replace(",", "."))
+    st.metric("Fluxo (soma)", f"{ind['total']:,}".replace(",", "."))
 with k2:
-    media_dia = df_f.groupby("Data")["Fluxo"].sum().mean() if not df_f.empty else 0
-    st.metric("Média por dia", f"{media_dia:.1f}")
+    st.metric("Média por dia", f"{ind['media_dia']:.1f}")
 with k3:
-    st.metric("Dias no filtro", f"{df_f['Data'].nunique()}")
-
-pico_dia = df_f.groupby("Data", as_index=False)["Fluxo"].sum().sort_values("Fluxo", ascending=False).head(1)
-if not pico_dia.empty:
-    d = pico_dia.iloc[0]["Data"].date().isoformat()
-    v = int(pico_dia.iloc[0]["Fluxo"])
-    with k4:
-        st.metric("Pico do período (dia)", f"{v:,}".replace(",", ".") + f" em {d}")
-else:
-    with k4:
+    st.metric("Dias no filtro", f"{ind['dias']}")
+with k4:
+    if ind["pico"] is not None:
+        d, v = ind["pico"]
+        st.metric("Pico do período (dia)", f"{v:,}".replace(",", ".") + f" em {d.date().isoformat()}")
+    else:
         st.metric("Pico do período (dia)", "—")
 
 st.markdown("---")
 
 # ---------- Gráfico: série temporal ----------
+med.etapa("Gráficos (série, ranking, heatmap)")
 st.subheader("📈 Evolução diária (soma)")
-daily = df_f.groupby("Data", as_index=False)["Fluxo"].sum()
 if not daily.empty:
+    daily_plot, sufixo = memo("daily_plot", lambda: reamostrar_serie(daily, resolucao_series, pontos_alvo),
+                              resolucao_series, pontos_alvo)
     chart = (
-        alt.Chart(daily)
+        alt.Chart(daily_plot)
         .mark_line(point=True)
         .encode(
             x=alt.X("Data:T", title="Data"),
-            y=alt.Y("Fluxo:Q", title="Fluxo (soma)"),
-            tooltip=["Data", "Fluxo"]
+            y=alt.Y("Fluxo:Q", title="Fluxo (soma)" if sufixo == "diária" else f"Fluxo (soma {sufixo})"),
+            tooltip=tooltip_serie(daily_plot)
         )
         .properties(height=300)
+        .interactive(bind_y=False)
     )
     st.altair_chart(chart, use_container_width=True)
 else:
@@ -464,12 +695,13 @@ else:
 
 # ---------- Ranking de lojas ----------
 st.subheader("🏆 Ranking de lojas (soma no filtro)")
-rank = df_f.groupby(["Loja", "ID_Loja"], as_index=False)["Fluxo"].sum().sort_values("Fluxo", ascending=False)
+rank = secao("rank")
 st.dataframe(rank, use_container_width=True, height=280)
 
 # ---------- Heatmap Data × Hora ----------
 st.subheader("🔥 Heatmap — Data × Hora (soma)")
-pivot = df_f.groupby(["Data", "Hora"], as_index=False)["Fluxo"].sum()
+pivot = secao("pivot")
+med.frame("heatmap (data × hora)", pivot)
 if not pivot.empty:
     heat = (
         alt.Chart(pivot)
@@ -487,40 +719,89 @@ else:
     st.info("Sem dados para exibir no heatmap.")
 
 # ---------- Grid interativa ----------
+med.etapa("Grid")
 st.subheader("🧱 Tabela (interativa)")
-cols_grid = [c for c in ["Company", "Loja", "ID_Loja", "Data", "Hora", "Fluxo"] if c in df_f.columns]
-gb = GridOptionsBuilder.from_dataframe(df_f[cols_grid])
-gb.configure_default_column(sortable=True, filter=True, groupable=True, resizable=True)
-gb.configure_side_bar()
-gb.configure_selection(selection_mode="multiple", use_checkbox=True)
-gb.configure_pagination(paginationAutoPageSize=True)
-AgGrid(
-    df_f[cols_grid],
-    gridOptions=gb.build(),
-    update_mode=GridUpdateMode.MODEL_CHANGED,
-    enable_enterprise_modules=True,
-    theme=grid_theme,
-    height=420
-)
+df_f = secao("df_f")
+if df_f is not None:
+    med.frame("df_f (linhas filtradas)", df_f)
 
-st.download_button(
-    "📥 Baixar dados filtrados (CSV)",
-    data=df_f.to_csv(index=False).encode("utf-8"),
-    file_name="fluxo_filtrado.csv",
-    mime="text/csv"
-)
+
+@st.fragment
+def tabela_interativa(df_f):
+    """
+    Grid paginada no servidor; ordenar, filtrar e paginar reexecutam só esta seção.
+    df_f None = backend SQL: contagem e página saem do SQL (ORDER BY + LIMIT/OFFSET).
+    """
+    colunas = sql.colunas if df_f is None else df_f.columns
+    cols_grid = [c for c in ["Company", "Loja", "ID_Loja", "Data", "Hora", "Fluxo"] if c in colunas]
+
+    # Paginação no servidor: ordenação/filtro rodam sobre df_f em memória e só a página
+    # visível é serializada para o navegador (custo constante, qualquer que seja o filtro).
+    g1, g2, g3, g4 = st.columns([2, 1, 2, 1])
+    with g1:
+        grid_col = st.selectbox("Ordenar por", options=cols_grid, index=cols_grid.index("Data") if "Data" in cols_grid else 0)
+    with g2:
+        grid_cresc = st.radio("Ordem", ["Crescente", "Decrescente"], index=0, horizontal=True) == "Crescente"
+    with g3:
+        grid_texto = st.text_input("Filtrar (Loja/ID contém)", value="").strip()
+    with g4:
+        grid_tam = st.selectbox("Linhas por página", options=[50, 100, 250, 500], index=1)
+
+    if df_f is None:
+        total = memo("grid_total", lambda: sql.contar(*filtro, grid_texto), grid_texto)
+    else:
+        ordem = memo("grid_ordem", lambda: ordem_grid(df_f, grid_col, grid_cresc, grid_texto), grid_col, grid_cresc, grid_texto)
+        total = len(ordem)
+    n_paginas = max(1, -(-total // grid_tam))
+    if st.session_state.get("grid_pagina", 1) > n_paginas:
+        st.session_state["grid_pagina"] = n_paginas
+    num_pagina = st.number_input(f"Página (de {n_paginas})", min_value=1, max_value=n_paginas, step=1, key="grid_pagina")
+    if df_f is None:
+        linhas_pagina, ini = sql.pagina(*filtro, grid_col, grid_cresc, grid_texto, grid_tam, num_pagina)
+    else:
+        linhas_pagina, ini = pagina(df_f, ordem, grid_tam, num_pagina)
+    df_pagina = linhas_pagina[cols_grid]
+    med.frame("página da grid (AgGrid)", df_pagina)
+    st.caption(f"Linhas {ini + 1 if total else 0}–{ini + len(df_pagina)} de {total:,}".replace(",", "."))
+
+    gb = GridOptionsBuilder.from_dataframe(df_pagina)
+    # Ordenar/filtrar no cliente afetaria só a página — isso é feito pelos controles acima
+    gb.configure_default_column(sortable=False, filter=False, groupable=True, resizable=True)
+    gb.configure_side_bar()
+    gb.configure_selection(selection_mode="multiple", use_checkbox=True)
+    AgGrid(
+        df_pagina,
+        gridOptions=gb.build(),
+        update_mode=GridUpdateMode.MODEL_CHANGED,
+        enable_enterprise_modules=True,
+        theme=grid_theme,
+        height=420
+    )
+
+    botao_exportar("📥 Baixar dados filtrados", lambda: sql.linhas(*filtro) if df_f is None else df_f, "fluxo_filtrado")
+
+
+tabela_interativa(df_f)
 
 st.markdown("---")
 
 # ---------- Alertas (queda vs média móvel) ----------
+med.etapa("Alertas")
 st.subheader("🚨 Alertas — Queda vs baseline por loja")
 
-_, di = add_alertas(df, janela=baseline_window, x=pct_alerta, y=pct_critico)
-di_f = di[(di["Data"].between(pd.to_datetime(f_inicio), pd.to_datetime(f_fim))) & (di["Loja"].isin(f_lojas))].copy()
+# Mexer nos limiares reclassifica apenas as linhas já filtradas
+di, di_f = secao("alertas")
+di_f = classificar_alertas(di_f, x=pct_alerta, y=pct_critico)
+med.frame("baseline de alertas", di)
+
+st_cache = cache_ag.stats()
+info_cache.caption(
+    f"Cache de agregados: {st_cache['hits']} hits / {st_cache['misses']} misses "
+    f"({st_cache['taxa_acerto']:.0%}) · {st_cache['bytes'] / 2**20:.1f} de {st_cache['limite_bytes'] / 2**20:.0f} MB"
+)
 
 if not di_f.empty:
-    ult_dia = di_f["Data"].max()
-    ult = di_f[di_f["Data"] == ult_dia].sort_values(["Status", "var_pct"], ascending=[True, True])
+    ult_dia, ult = ultimo_dia(di_f)
     st.caption(f"Status na última data do filtro: **{ult_dia.date().isoformat()}**")
     mostra = (
         ult[["Loja", "ID_Loja", "Fluxo", "mm_baseline", "var_pct", "Status"]]
@@ -528,32 +809,71 @@ if not di_f.empty:
     )
     st.dataframe(mostra, use_container_width=True, height=320)
 
-    st.download_button(
-        "📥 Baixar alertas (último dia no filtro, CSV)",
-        data=ult.to_csv(index=False).encode("utf-8"),
-        file_name="alertas_ultimo_dia.csv",
-        mime="text/csv"
-    )
+    botao_exportar("📥 Baixar alertas (último dia no filtro)", lambda: ult, "alertas_ultimo_dia")
 else:
     st.info("Sem dados para calcular alertas no intervalo selecionado.")
 
+# ---------- Zero prolongado (possível falha de sensor) ----------
+med.etapa("Zero prolongado")
+st.subheader(f"⛔ Zero prolongado — {min_consecutive_zero}h ou mais seguidas com fluxo 0 ou sem registro")
+
+zeros_f = secao("zeros")
+
+if zeros_f.empty:
+    st.success("Nenhuma sequência de horas zeradas nas lojas/período do filtro.")
+else:
+    z1, z2, z3 = st.columns(3)
+    with z1: st.metric("Sequências", f"{len(zeros_f):,}".replace(",", "."))
+    with z2: st.metric("Lojas afetadas", f"{zeros_f['Loja'].nunique()}")
+    with z3: st.metric("Horas zeradas", f"{int(zeros_f['Horas'].sum()):,}".replace(",", "."))
+    st.caption(
+        "Só contam as horas de funcionamento de cada loja (horas com fluxo > 0 em pelo menos metade dos dias); "
+        "uma falha que atravessa a noite aparece como uma sequência só."
+    )
+
+    chart_zero = (
+        alt.Chart(zeros_f.assign(Ate=zeros_f["Fim"] + pd.Timedelta(hours=1)))
+        .mark_bar(cornerRadius=2)
+        .encode(
+            x=alt.X("Início:T", title="Data"),
+            x2="Ate:T",
+            y=alt.Y("Loja:N", title="Loja"),
+            color=alt.Color("Horas:Q", title="Horas", scale=alt.Scale(scheme="orangered")),
+            tooltip=["Loja", "ID_Loja", alt.Tooltip("Início:T", format="%Y-%m-%d %Hh"),
+                     alt.Tooltip("Fim:T", format="%Y-%m-%d %Hh"), "Horas", "Sem registro"]
+        )
+        .properties(height=min(600, 60 + 22 * zeros_f["Loja"].nunique()))
+    )
+    st.altair_chart(chart_zero, use_container_width=True)
+    st.dataframe(zeros_f, use_container_width=True, height=280)
+
+    botao_exportar("📥 Baixar sequências de zero prolongado", lambda: zeros_f, "zero_prolongado")
+
 # ---------- Comparar Lojas ----------
+med.etapa("Comparação")
 st.markdown("---")
 st.header("🔍 Comparar Lojas")
+mat = secao("matrizes")
+med.frame("matrizes loja × hora / loja × dia", mat)
 
-if df_f.empty:
-    st.info("Ajuste os filtros de período/lojas/horas para comparar.")
-else:
+
+@st.fragment
+def comparar_lojas(mat, lojas_filtro):
+    """Comparação de lojas: trocar modo, lojas ou grupos reexecuta só esta seção, sobre as matrizes do filtro."""
     # =====================
     # Seleção de lojas A e B
     # =====================
-    lojas_filtro = sorted(df_f["Loja"].dropna().unique().tolist())
     cA, cB, cMode = st.columns([2, 2, 2])
     with cA:
         loja_A = st.selectbox("Loja A", options=lojas_filtro, index=0 if lojas_filtro else None)
     with cB:
+        # Loja B tem chave no session_state para a sugestão de lojas parecidas poder preenchê-la;
+        # como antes, volta ao padrão quando as lojas do filtro mudam
         idx_default_B = 1 if len(lojas_filtro) > 1 else 0
-        loja_B = st.selectbox("Loja B", options=lojas_filtro, index=idx_default_B)
+        if st.session_state.get("loja_B_opcoes") != lojas_filtro or st.session_state.get("loja_B") not in lojas_filtro:
+            st.session_state["loja_B"] = lojas_filtro[idx_default_B] if lojas_filtro else None
+            st.session_state["loja_B_opcoes"] = lojas_filtro
+        loja_B = st.selectbox("Loja B", options=lojas_filtro, key="loja_B")
     with cMode:
         modo = st.radio(
             "Modo de comparação",
@@ -568,40 +888,37 @@ else:
             horizontal=False
         )
 
-
+    # =====================
+    # Lojas parecidas com A (perfil horário + dia da semana)
+    # =====================
+    if st.toggle("🔎 Sugerir lojas parecidas com a Loja A", key="sugerir_parecidas"):
+        # Matriz de similaridade de todas as lojas do filtro, uma vez por filtro
+        sim = memo("similaridade", lambda: similaridade(mat))
+        cS1, cS2 = st.columns([1, 3])
+        with cS1:
+            k_sim = st.number_input("Quantas sugestões (k)", min_value=1, max_value=50, value=5, step=1)
+            sentido = st.radio("Mostrar", options=["Mais parecidas", "Mais diferentes"], horizontal=True)
+        sugestoes = semelhantes(mat, sim, loja_A, int(k_sim), parecidas=(sentido == "Mais parecidas"))
+        with cS2:
+            if sugestoes.empty:
+                st.info("Sem outras lojas com fluxo neste filtro para comparar com a Loja A.")
+            else:
+                st.caption("Similaridade = correlação entre os perfis (participação de cada hora e de cada dia da semana) das lojas.")
+                st.dataframe(sugestoes, use_container_width=True, hide_index=True, height=min(400, 38 + 35 * len(sugestoes)))
+                c_sug, c_btn = st.columns([3, 1])
+                with c_sug:
+                    sugestao = st.selectbox("Sugestão", options=sugestoes["Loja"].tolist(), key="sugestao_B")
+                with c_btn:
+                    st.button("Usar como Loja B", on_click=st.session_state.update, kwargs={"loja_B": sugestao})
 
     if loja_A == loja_B:
         st.warning("Selecione **duas** lojas diferentes para comparar.")
     else:
-        # =====================
-        # Funções auxiliares
-        # =====================
-        def agg_por_hora(df_sel):
-            """Agrega soma por Loja x Hora no período filtrado."""
-            t = (df_sel.groupby(["Loja", "Hora"], as_index=False)["Fluxo"].sum())
-            t = t.dropna(subset=["Hora"])
-            t["Hora"] = t["Hora"].astype(int)
-            t["Fluxo"] = pd.to_numeric(t["Fluxo"], errors="coerce").fillna(0)
-            return t
-
-        def agg_por_dia(df_sel):
-            """Agrega soma por Loja x Dia."""
-            d = (df_sel.groupby(["Loja", "Data"], as_index=False)["Fluxo"].sum()
-                        .sort_values(["Loja", "Data"]))
-            d["Fluxo"] = pd.to_numeric(d["Fluxo"], errors="coerce").fillna(0)
-            d["Data"] = pd.to_datetime(d["Data"], errors="coerce")
-            return d
-
         # =====================
         # A vs B
         # =====================
-        df_AB = df_f[df_f["Loja"].isin([loja_A, loja_B])].copy()
-
-        # KPIs (período filtrado)
-        tot_A = int(df_AB.loc[df_AB["Loja"] == loja_A, "Fluxo"].sum())
-        tot_B = int(df_AB.loc[df_AB["Loja"] == loja_B, "Fluxo"].sum())
-        diff_abs = tot_A - tot_B
-        diff_pct = (diff_abs / tot_B * 100.0) if tot_B > 0 else np.nan
+        tot_A, tot_B = totais(mat, loja_A, loja_B)
+        diff_abs, diff_pct = diferenca(tot_A, tot_B)
 
         k1, k2, k3, k4 = st.columns(4)
         with k1: st.metric(f"Fluxo — {loja_A}", f"{tot_A:,}".replace(",", "."))
@@ -613,37 +930,16 @@ else:
         # Modo 1: Agregado por hora (período)
         # =====================
         if modo == "Agregado por hora (período)":
-            hora_sum = agg_por_hora(df_AB)
-
-            # Pivota para A e B lado a lado
-            base = hora_sum.pivot_table(index="Hora", columns="Loja", values="Fluxo", aggfunc="sum", fill_value=0)
-            if (loja_A not in base.columns) or (loja_B not in base.columns):
+            base = comparar_por_hora(mat, loja_A, loja_B)
+            if base is None:
                 st.info("Sem dados suficientes para uma das lojas neste intervalo/horas.")
             else:
-                base = base.reset_index().rename(columns={loja_A: "Fluxo_A", loja_B: "Fluxo_B"})
-                base["Delta"] = base["Fluxo_A"] - base["Fluxo_B"]
-                base["Vencedor"] = np.where(base["Delta"] > 0, "A", np.where(base["Delta"] < 0, "B", "Empate"))
-
                 # Métricas de vitória por hora
-                horas_A = int((base["Delta"] > 0).sum())
-                horas_B = int((base["Delta"] < 0).sum())
-                horas_empate = int((base["Delta"] == 0).sum())
+                horas_A, horas_B, horas_empate = placar_horas(base)
                 st.caption(f"🏁 Por hora no período: **{loja_A}** vence em **{horas_A}h**, **{loja_B}** vence em **{horas_B}h**, empates: **{horas_empate}h**.")
 
                 # --- Linhas A vs B (usando melt em pandas, sem transform_fold) ---
-
-                for col in ["Fluxo_A", "Fluxo_B"]:
-                    base[col] = pd.to_numeric(base[col], errors="coerce").fillna(0)
-                base["Hora"] = base["Hora"].astype(int)
-
-                long = base.melt(
-                    id_vars=["Hora"],
-                    value_vars=["Fluxo_A", "Fluxo_B"],
-                    var_name="Serie",
-                    value_name="Fluxo"
-                )
-                long["Serie"] = long["Serie"].map({"Fluxo_A": loja_A, "Fluxo_B": loja_B})
-                long["Fluxo"] = pd.to_numeric(long["Fluxo"], errors="coerce").fillna(0)
+                long = longo_ab(base, "Hora", loja_A, loja_B)
 
                 # Camada de glow (grossa, translúcida) + camada nítida com pontos
 
@@ -687,12 +983,7 @@ else:
                 st.altair_chart(chart_lines, use_container_width=True)
                 st.altair_chart(chart_delta, use_container_width=True)
 
-                st.download_button(
-                    "📥 Baixar comparação por hora (CSV)",
-                    data=base.to_csv(index=False).encode("utf-8"),
-                    file_name="comparacao_por_hora_AB.csv",
-                    mime="text/csv"
-                )
+                botao_exportar("📥 Baixar comparação por hora", lambda: base, "comparacao_por_hora_AB")
 
         # =====================
         # Modo 3: Agregado por hora (sobreposto, N lojas)
@@ -712,14 +1003,7 @@ else:
                 st.info("Selecione pelo menos 2 lojas para comparar.")
             else:
                 # 2) Base agregada por Loja × Hora no período filtrado
-                df_multi = df_f[df_f["Loja"].isin(lojas_multi)].copy()
-                hora_sum_multi = (
-                    df_multi.groupby(["Loja", "Hora"], as_index=False)["Fluxo"]
-                            .sum()
-                            .dropna(subset=["Hora"])
-                )
-                hora_sum_multi["Hora"] = hora_sum_multi["Hora"].astype(int)
-                hora_sum_multi["Fluxo"] = pd.to_numeric(hora_sum_multi["Fluxo"], errors="coerce").fillna(0)
+                hora_sum_multi = soma_hora_lojas(mat, lojas_multi)
 
                 # 3) Linhas com "neon" (glow grosso + linha nítida)
                 glow = (
@@ -745,12 +1029,7 @@ else:
                 st.altair_chart(chart_multi, use_container_width=True)
 
                 # 4) Export
-                st.download_button(
-                    "📥 Baixar comparação por hora (N lojas, CSV)",
-                    data=hora_sum_multi.to_csv(index=False).encode("utf-8"),
-                    file_name="comparacao_por_hora_N_lojas.csv",
-                    mime="text/csv"
-                )
+                botao_exportar("📥 Baixar comparação por hora (N lojas)", lambda: hora_sum_multi, "comparacao_por_hora_N_lojas")
         
         
         
@@ -784,30 +1063,18 @@ else:
             # validações
             if len(lojas_A) == 0 or len(lojas_B) == 0:
                 st.warning("Selecione ao menos **1 loja** em cada grupo.")
+            elif nome_A == nome_B:
+                # Mesmo nome: os dois grupos virariam um só (tudo empate)
+                st.info("Dê nomes diferentes aos dois grupos para comparar.")
             else:
-                # base filtrada com as lojas A ∪ B
-                df_grp = df_f[df_f["Loja"].isin(set(lojas_A) | set(lojas_B))].copy()
-
-                # etiqueta de grupo por linha
-                df_grp["Grupo"] = np.where(
-                    df_grp["Loja"].isin(lojas_A), nome_A,
-                    np.where(df_grp["Loja"].isin(lojas_B), nome_B, np.nan)
-                )
-                df_grp = df_grp.dropna(subset=["Grupo"])
-
-                # agrega por Grupo × Hora
-                hora_grp = (
-                    df_grp.groupby(["Grupo", "Hora"], as_index=False)["Fluxo"].sum()
-                        .dropna(subset=["Hora"])
-                )
-                hora_grp["Hora"] = hora_grp["Hora"].astype(int)
-                hora_grp["Fluxo"] = pd.to_numeric(hora_grp["Fluxo"], errors="coerce").fillna(0)
+                # agrega por Grupo × Hora (soma das linhas de cada grupo nas matrizes)
+                grupos = [(nome_A, lojas_A), (nome_B, lojas_B)]
+                hora_grp = soma_grupos(mat, grupos, "Hora")
 
                 # KPIs de período por grupo
                 tot_A = int(hora_grp.loc[hora_grp["Grupo"] == nome_A, "Fluxo"].sum())
                 tot_B = int(hora_grp.loc[hora_grp["Grupo"] == nome_B, "Fluxo"].sum())
-                diff_abs = tot_A - tot_B
-                diff_pct = (diff_abs / tot_B * 100.0) if tot_B > 0 else np.nan
+                diff_abs, diff_pct = diferenca(tot_A, tot_B)
 
                 k1, k2, k3, k4 = st.columns(4)
                 with k1: st.metric(f"Fluxo — {nome_A}", f"{tot_A:,}".replace(",", "."))
@@ -815,16 +1082,12 @@ else:
                 with k3: st.metric("Δ absoluto (A - B)", f"{diff_abs:,}".replace(",", "."))
                 with k4: st.metric("Δ % vs B", f"{diff_pct:.1f}%" if pd.notna(diff_pct) else "—")
 
-                # Pivot para Delta por hora (A - B)
-                base_grp = hora_grp.pivot_table(index="Hora", columns="Grupo", values="Fluxo", aggfunc="sum", fill_value=0)
-                if nome_A not in base_grp.columns or nome_B not in base_grp.columns:
+                # Delta por hora (A - B)
+                base_grp = comparar_grupos(mat, grupos, "Hora")
+                if base_grp is None:
                     st.info("Sem dados suficientes para um dos grupos neste intervalo/horas.")
                 else:
-                    base_grp = base_grp.reset_index().rename(columns={nome_A: "Fluxo_A", nome_B: "Fluxo_B"})
-                    base_grp["Delta"] = base_grp["Fluxo_A"] - base_grp["Fluxo_B"]
-                    horas_A = int((base_grp["Delta"] > 0).sum())
-                    horas_B = int((base_grp["Delta"] < 0).sum())
-                    horas_emp = int((base_grp["Delta"] == 0).sum())
+                    horas_A, horas_B, horas_emp = placar_horas(base_grp)
                     st.caption(f"🏁 Por hora no período: **{nome_A}** vence em **{horas_A}h**, **{nome_B}** vence em **{horas_B}h**, empates: **{horas_emp}h**.")
 
                     # Linhas com glow (neon)
@@ -864,12 +1127,7 @@ else:
                     st.altair_chart(chart_delta, use_container_width=True)
 
                     # Export
-                    st.download_button(
-                        "📥 Baixar A×B por hora (grupos, CSV)",
-                        data=hora_grp.to_csv(index=False).encode("utf-8"),
-                        file_name="comparacao_AxB_grupos_por_hora.csv",
-                        mime="text/csv"
-                    )
+                    botao_exportar("📥 Baixar A×B por hora (grupos)", lambda: hora_grp, "comparacao_AxB_grupos_por_hora")
 
                     # Mostrar composição dos grupos (opcional)
                     st.caption("Composição dos grupos:")
@@ -906,50 +1164,37 @@ else:
 
             if len(lojas_A) == 0 or len(lojas_B) == 0:
                 st.warning("Selecione ao menos **1 loja** em cada grupo.")
+            elif nome_A == nome_B:
+                # Mesmo nome: os dois grupos virariam um só (tudo empate)
+                st.info("Dê nomes diferentes aos dois grupos para comparar.")
             else:
-                df_grp = df_f[df_f["Loja"].isin(set(lojas_A) | set(lojas_B))].copy()
-                df_grp["Grupo"] = np.where(
-                    df_grp["Loja"].isin(lojas_A), nome_A,
-                    np.where(df_grp["Loja"].isin(lojas_B), nome_B, np.nan)
-                )
-                df_grp = df_grp.dropna(subset=["Grupo"])
-
-                dia_grp = (
-                    df_grp.groupby(["Grupo", "Data"], as_index=False)["Fluxo"].sum()
-                        .sort_values(["Grupo", "Data"])
-                )
-                dia_grp["Fluxo"] = pd.to_numeric(dia_grp["Fluxo"], errors="coerce").fillna(0)
-                dia_grp["Data"] = pd.to_datetime(dia_grp["Data"], errors="coerce")
+                dia_grp = soma_grupos(mat, [(nome_A, lojas_A), (nome_B, lojas_B)], "Data")
+                dia_plot, sufixo = reamostrar_serie(dia_grp, resolucao_series, pontos_alvo, por="Grupo")
 
                 # Linhas com glow (neon)
                 glow_d = (
-                    alt.Chart(dia_grp)
+                    alt.Chart(dia_plot)
                     .mark_line(strokeWidth=8, opacity=0.35)
                     .encode(
                         x=alt.X("Data:T", title="Data"),
-                        y=alt.Y("Fluxo:Q", title="Fluxo (soma diária)"),
+                        y=alt.Y("Fluxo:Q", title=f"Fluxo (soma {sufixo})"),
                         color=alt.Color("Grupo:N", title="Grupo")
                     )
                 )
                 linhas_d = (
-                    alt.Chart(dia_grp)
+                    alt.Chart(dia_plot)
                     .mark_line(point=True, strokeWidth=2.2)
                     .encode(
                         x=alt.X("Data:T", title="Data"),
-                        y=alt.Y("Fluxo:Q", title="Fluxo (soma diária)"),
+                        y=alt.Y("Fluxo:Q", title=f"Fluxo (soma {sufixo})"),
                         color=alt.Color("Grupo:N", title="Grupo"),
-                        tooltip=["Grupo", "Data", alt.Tooltip("Fluxo:Q", format=",.0f")]
+                        tooltip=tooltip_serie(dia_plot, "Grupo")
                     )
                 )
-                st.altair_chart((glow_d + linhas_d).properties(height=360), use_container_width=True)
+                st.altair_chart((glow_d + linhas_d).properties(height=360).interactive(bind_y=False), use_container_width=True)
 
                 # Export
-                st.download_button(
-                    "📥 Baixar A×B diário (grupos, CSV)",
-                    data=dia_grp.to_csv(index=False).encode("utf-8"),
-                    file_name="comparacao_AxB_grupos_diario.csv",
-                    mime="text/csv"
-                )
+                botao_exportar("📥 Baixar A×B diário (grupos)", lambda: dia_grp, "comparacao_AxB_grupos_diario")
         
         
         
@@ -959,58 +1204,47 @@ else:
         # Modo 2: Evolução diária (A vs B)
         # =====================
         else:
-            dia_sum = agg_por_dia(df_AB)
-            base_dia = dia_sum.pivot_table(index="Data", columns="Loja", values="Fluxo", aggfunc="sum", fill_value=0)
-            if (loja_A not in base_dia.columns) or (loja_B not in base_dia.columns):
+            base_dia = comparar_por_dia(mat, loja_A, loja_B)
+            if base_dia is None:
                 st.info("Sem dados diários suficientes para uma das lojas.")
             else:
-                base_dia = base_dia.reset_index().rename(columns={loja_A: "Fluxo_A", loja_B: "Fluxo_B"})
-                base_dia["Delta"] = base_dia["Fluxo_A"] - base_dia["Fluxo_B"]
-
                 # Derrete no pandas (long)
-                long_dia = base_dia.melt(
-                    id_vars=["Data"],
-                    value_vars=["Fluxo_A", "Fluxo_B"],
-                    var_name="Serie",
-                    value_name="Fluxo"
-                )
-                long_dia["Serie"] = long_dia["Serie"].map({"Fluxo_A": loja_A, "Fluxo_B": loja_B})
-                long_dia["Fluxo"] = pd.to_numeric(long_dia["Fluxo"], errors="coerce").fillna(0)
-                long_dia["Data"] = pd.to_datetime(long_dia["Data"], errors="coerce")
+                long_dia = longo_ab(base_dia, "Data", loja_A, loja_B)
+                long_plot, sufixo = reamostrar_serie(long_dia, resolucao_series, pontos_alvo, por="Serie")
 
                 chart_daily = (
-                    alt.Chart(long_dia)
+                    alt.Chart(long_plot)
                     .mark_line(point=True)
                     .encode(
                         x=alt.X("Data:T", title="Data"),
-                        y=alt.Y("Fluxo:Q", title="Fluxo (soma diária)"),
+                        y=alt.Y("Fluxo:Q", title=f"Fluxo (soma {sufixo})"),
                         color=alt.Color("Serie:N", title="Loja", scale=alt.Scale(range=["#1f77b4", "#ff7f0e"])),
-                        tooltip=["Data", "Serie", "Fluxo"]
+                        tooltip=tooltip_serie(long_plot, "Serie")
                     )
                     .properties(height=320)
+                    .interactive(bind_y=False)
                 )
                 st.altair_chart(chart_daily, use_container_width=True)
 
-                st.download_button(
-                    "📥 Baixar comparação diária (CSV)",
-                    data=base_dia.to_csv(index=False).encode("utf-8"),
-                    file_name="comparacao_diaria_AB.csv",
-                    mime="text/csv"
-                )
-                
-
+                botao_exportar("📥 Baixar comparação diária", lambda: base_dia, "comparacao_diaria_AB")
 
 
+if rank.empty:
+    st.info("Ajuste os filtros de período/lojas/horas para comparar.")
+else:
+    comparar_lojas(mat, mat.lojas[mat.tem_dia.any(axis=1)].tolist())
 
 # -------------------------------------------
 # 📊 Small multiples por hora (N lojas)
 # -------------------------------------------
+med.etapa("Small multiples + pódio")
 st.markdown("---")
 st.header("📊 Small multiples por hora (N lojas)")
 
-if df_f.empty:
-    st.info("Ajuste os filtros de período/lojas/horas para visualizar.")
-else:
+
+@st.fragment
+def small_multiples_e_podio(mat, rank):
+    """Small multiples e pódio: seleção, Top N, páginas e K reexecutam só esta seção."""
     # --- Controles de seleção ---
     csel1, csel2, csel3 = st.columns([2, 2, 2])
     with csel1:
@@ -1026,33 +1260,12 @@ else:
         usar_normalizacao = st.checkbox(
             "Normalizar por hora (% vs baseline da hora por loja)",
             value=False,
-            help="Compara o volume observado com o 'esperado' (média da mesma hora na própria loja) no período."
+            help="Compara o volume do período com o 'esperado': média da mesma hora na própria loja em todo o "
+                 "histórico carregado. Com o histórico inteiro no filtro, o desvio é 0."
         )
 
-    # --- Base de agregação por dia/hora (para normalização robusta) ---
-    # Fluxo diário por Loja x Data x Hora (no período filtrado)
-    by_ldh = (
-        df_f.groupby(["Loja", "ID_Loja", "Data", "Hora"], as_index=False)["Fluxo"]
-            .sum()
-            .dropna(subset=["Hora"])
-    )
-    by_ldh["Hora"] = by_ldh["Hora"].astype(int)
-    by_ldh["Fluxo"] = pd.to_numeric(by_ldh["Fluxo"], errors="coerce").fillna(0)
-
-    # --- Soma no período por Loja x Hora (para os gráficos small multiples) ---
-    soma_lh = (
-        by_ldh.groupby(["Loja", "ID_Loja", "Hora"], as_index=False)["Fluxo"]
-              .sum()
-    )  # S = soma dos dias (Loja, Hora)
-
-    # --- Total por loja (para ranquear Top N) ---
-    tot_loja = df_f.groupby(["Loja", "ID_Loja"], as_index=False)["Fluxo"].sum().rename(columns={"Fluxo": "Fluxo_total"})
-
-    # Seleção de lojas
-    lojas_disponiveis = (
-        tot_loja.sort_values("Fluxo_total", ascending=False)["Loja"]
-                .tolist()
-    )
+    # Seleção de lojas (ranking do período, da maior para a menor)
+    lojas_disponiveis = lojas_por_fluxo(rank)
     if modo_sel == "Top N por fluxo no período":
         lojas_escolhidas = lojas_disponiveis[:top_n]
     else:
@@ -1063,51 +1276,33 @@ else:
         )
     if not lojas_escolhidas:
         st.warning("Selecione ao menos uma loja.")
-        st.stop()
-
-    soma_lh_sel = soma_lh[soma_lh["Loja"].isin(lojas_escolhidas)].copy()
-
-    # --- Cálculo do baseline por hora (média diária da hora) e normalização ---
-    # baseline_hora = média do Fluxo por (Loja, Hora) ao longo das datas
-    base_mean = (
-        by_ldh.groupby(["Loja", "Hora"], as_index=False)["Fluxo"].mean()
-              .rename(columns={"Fluxo": "baseline_hora"})
-    )
-    # n_dias por (Loja, Hora) observado no filtro (contando dias com registro)
-    n_dias = (
-        by_ldh.groupby(["Loja", "Hora"], as_index=False)["Data"].nunique()
-              .rename(columns={"Data": "n_dias"})
-    )
-
-    # Une baseline e nº de dias à soma no período
-    soma_lh_sel = (
-        soma_lh_sel
-        .merge(base_mean, on=["Loja", "Hora"], how="left")
-        .merge(n_dias, on=["Loja", "Hora"], how="left")
-    )
-    soma_lh_sel["baseline_hora"] = pd.to_numeric(soma_lh_sel["baseline_hora"], errors="coerce")
-    soma_lh_sel["n_dias"] = pd.to_numeric(soma_lh_sel["n_dias"], errors="coerce")
-    soma_lh_sel["esperado"] = soma_lh_sel["baseline_hora"] * soma_lh_sel["n_dias"]
-
-    # % desvio vs esperado da própria hora na loja
-    soma_lh_sel["norm_pct"] = np.where(
-        soma_lh_sel["esperado"] > 0,
-        (soma_lh_sel["Fluxo"] / soma_lh_sel["esperado"] - 1.0) * 100.0,
-        np.nan
-    )
+        return
+
+    # --- Páginas de facetas: só as lojas da página vão para o spec do gráfico ---
+    lojas_pagina, n_paginas_sm = paginar_lojas(lojas_escolhidas, FACETAS_POR_PAGINA, 1)
+    if n_paginas_sm > 1:
+        cpag1, cpag2 = st.columns([1, 3])
+        # Como na grid: a página fica só no session_state e volta ao limite se a seleção encolher
+        if st.session_state.get("sm_pagina", 1) > n_paginas_sm:
+            st.session_state["sm_pagina"] = n_paginas_sm
+        with cpag1:
+            pagina_sm = st.number_input(f"Página dos gráficos (de {n_paginas_sm})", min_value=1,
+                                        max_value=n_paginas_sm, step=1, key="sm_pagina")
+        lojas_pagina, _ = paginar_lojas(lojas_escolhidas, FACETAS_POR_PAGINA, pagina_sm)
+        ini_sm = (int(pagina_sm) - 1) * FACETAS_POR_PAGINA
+        with cpag2:
+            st.caption(f"Lojas {ini_sm + 1}–{ini_sm + len(lojas_pagina)} de {len(lojas_escolhidas)} "
+                       f"(ordem do ranking; {FACETAS_POR_PAGINA} por página).")
+
+    # --- Normalização: esperado = média da hora na loja (histórico inteiro) × dias com registro no período ---
+    # A referência só é calculada (uma vez por base) se a normalização estiver ligada
+    soma_lh_sel = normalizar_por_hora(mat, lojas_pagina, matrizes_historico() if usar_normalizacao else None)
 
     # --- Dataset para o gráfico ---
     plot_col_y = "norm_pct" if usar_normalizacao else "Fluxo"
     titulo_y = "Desvio vs baseline da hora (%)" if usar_normalizacao else "Fluxo (soma no período)"
 
-    # Evita linhas quebradas por NaN e garante tipo
-    soma_lh_sel["Hora"] = soma_lh_sel["Hora"].astype(int)
-    soma_lh_sel["Fluxo"] = pd.to_numeric(soma_lh_sel["Fluxo"], errors="coerce").fillna(0)
-
-    # Pequena ordenação para estética
-    soma_lh_sel = soma_lh_sel.sort_values(["Loja", "Hora"])
-
-    # --- Small multiples (facet por loja) ---
+    # --- Small multiples (facet por loja da página) ---
     chart_sm = (
         alt.Chart(soma_lh_sel)
         .mark_line(point=True)
@@ -1125,55 +1320,57 @@ else:
     )
     st.altair_chart(chart_sm, use_container_width=True)
 
-    # Exporta o dataset usado no gráfico
-    st.download_button(
-        "📥 Baixar (Loja × Hora) — com baseline e normalização",
-        data=soma_lh_sel.to_csv(index=False).encode("utf-8"),
-        file_name="small_multiples_por_hora.csv",
-        mime="text/csv"
-    )
+    # Exporta o dataset de todas as lojas escolhidas (não só da página)
+    botao_exportar("📥 Baixar (Loja × Hora) — com baseline e normalização",
+                   lambda: normalizar_por_hora(mat, lojas_escolhidas, matrizes_historico()), "small_multiples_por_hora")
 
     # -------------------------------------------
-    # 🏁 Pódio por hora (Top 3 lojas em cada hora)
+    # 🏁 Pódio (Top K lojas por hora, dia ou hora da semana)
     # -------------------------------------------
-    st.subheader("🏁 Pódio por horário (Top 3)")
+    st.subheader("🏁 Pódio (Top K)")
 
-    # Usamos a soma no período por (Loja, Hora) restrita às lojas escolhidas
-    podio_base = soma_lh[soma_lh["Loja"].isin(lojas_escolhidas)].copy()
+    cp1, cp2, cp3 = st.columns([1, 2, 2])
+    with cp1:
+        k_podio = st.number_input("K (lojas por posição)", min_value=1, max_value=50, value=3, step=1, key="podio_k")
+    with cp2:
+        eixo_podio = st.radio("Pódio por", options=EIXOS_PODIO, horizontal=True, key="podio_eixo")
+    with cp3:
+        universo_podio = st.radio("Entre", options=["Todas as lojas do filtro", "Lojas dos small multiples"],
+                                  horizontal=True, key="podio_lojas")
 
-    # Rank por hora
-    podio = (
-        podio_base
-        .assign(rank=lambda d: d.groupby("Hora")["Fluxo"].rank(method="first", ascending=False))
-        .query("rank <= 3")
-        .sort_values(["Hora", "rank"])
-    )
+    # Seleção parcial (argpartition) na matriz Loja × eixo — sem rank completo
+    lojas_podio = None if universo_podio == "Todas as lojas do filtro" else lojas_escolhidas
+    tabela_podio = podio(mat, eixo_podio, int(k_podio), lojas_podio)
 
     # Tabela do pódio
     st.dataframe(
-        podio.rename(columns={"Fluxo": "Fluxo (soma no período)"}),
+        tabela_podio.rename(columns={"Fluxo": "Fluxo (soma no período)"}),
         use_container_width=True,
         height=360
     )
 
-    # Gráfico: barras por hora (Top 3)
+    # Gráfico: barras empilhadas por posição do eixo (Top K)
+    tipo_x = "Data:T" if eixo_podio == "Data" else f"{eixo_podio}:O"
     chart_podio = (
-        alt.Chart(podio)
+        alt.Chart(tabela_podio)
         .mark_bar()
         .encode(
-            x=alt.X("Hora:O", title="Hora"),
+            x=alt.X(tipo_x, title=eixo_podio, sort=None),
             y=alt.Y("Fluxo:Q", title="Fluxo (soma no período)"),
             color=alt.Color("Loja:N", title="Loja"),
-            tooltip=["Hora", "Loja", alt.Tooltip("Fluxo:Q", title="Fluxo", format=",.0f"), "rank"]
+            tooltip=[eixo_podio, "Loja", alt.Tooltip("Fluxo:Q", title="Fluxo", format=",.0f"), "rank"]
         )
         .properties(height=320)
     )
     st.altair_chart(chart_podio, use_container_width=True)
 
     # Export CSV do pódio
-    st.download_button(
-        "📥 Baixar pódio por hora (Top 3, CSV)",
-        data=podio.to_csv(index=False).encode("utf-8"),
-        file_name="podio_por_hora_top3.csv",
-        mime="text/csv"
-    )
\ No newline at end of file
+    botao_exportar(f"📥 Baixar pódio (Top {int(k_podio)})", lambda: tabela_podio, "podio_top_k")
+
+
+if rank.empty:
+    st.info("Ajuste os filtros de período/lojas/horas para visualizar.")
+else:
+    small_multiples_e_podio(mat, rank)
+
+mostrar_perf()
@@ -0,0 +1,223 @@
+"""
+Benchmark das etapas do dashboard sobre dados sintéticos (fluxo.sintetico).
+
+    python benchmarks/bench_fluxo.py --escala 10x30 --escala 500x365 --repeticoes 3
+
+Cada etapa é medida separadamente: tempo de parede (mediana e mínimo de N
+execuções) e pico de memória alocada (tracemalloc, numa execução à parte para
+não distorcer o tempo). Os resultados são acrescentados a um CSV com a versão
+(git) e comparados com a última medição de outra versão na mesma escala.
+"""
+import os
+import gc
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fluxo import consulta, ingest, sintetico
+from fluxo.alertas import add_alertas, sequencias_zero
+from fluxo.comparacao import (
+    comparar_grupos, comparar_por_dia, comparar_por_hora, longo_ab, matrizes, normalizar_por_hora,
+    podio, semelhantes, similaridade, soma_grupos, soma_hora_lojas,
+)
+from fluxo.cubo import (
+    heatmap_data_hora, kpis, montar_cubo, ranking_lojas, recortar, serie_diaria,
+)
+from fluxo.historico import Historico
+from fluxo.indice import indexar
+from fluxo.series import reamostrar_serie
+from fluxo.tabela import filtrar_linhas
+
+RESULTADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados.csv")
+
+
+def versao():
+    """Commit atual (com -dirty se houver alterações locais) ou 'desconhecida'."""
+    try:
+        rev = subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+        return rev or "desconhecida"
+    except (OSError, subprocess.CalledProcessError):
+        return "desconhecida"
+
+
+def etapas(df, csv, pasta):
+    """[(nome, função)] na ordem do app, com um filtro típico (últimos 3/4 do período, metade das lojas, 10h–20h)."""
+    cubo = montar_cubo(df)
+    lojas = cubo.lojas.tolist()
+    inicio, fim = cubo.datas[len(cubo.datas) // 4], cubo.datas[-1]
+    lojas_sel = lojas[::2] if len(lojas) > 3 else lojas
+    horas = (10, 20)
+    indice = indexar(df)
+    rec = recortar(cubo, inicio, fim, lojas_sel, horas)
+    mat = matrizes(rec)
+    mat_base = matrizes(cubo)  # referência da normalização (base inteira)
+    top = ranking_lojas(rec)["Loja"].tolist()
+    loja_A, loja_B = top[0], top[1]
+    metade = max(1, len(top) // 4)
+    grupos = [("Grupo A", top[:metade]), ("Grupo B", top[metade:2 * metade])]
+
+    quente = os.path.join(pasta, "cache_quente")
+    ingest.CACHE_DIR = quente
+    ingest.carregar(*ingest.fonte_caminho(csv))
+
+    def ingestao_fria():
+        ingest.CACHE_DIR = tempfile.mkdtemp(dir=pasta)
+        try:
+            return ingest.carregar(*ingest.fonte_caminho(csv))
+        finally:
+            shutil.rmtree(ingest.CACHE_DIR, ignore_errors=True)
+            ingest.CACHE_DIR = quente
+
+    def modo_2():
+        base = comparar_por_dia(mat, loja_A, loja_B)
+        return reamostrar_serie(longo_ab(base, "Data", loja_A, loja_B), "Automática", 500, por="Serie")
+
+    hist = Historico(os.path.join(pasta, "historico.sqlite"))
+    hist.gravar(df)
+    filtro = (inicio, fim, lojas_sel, horas)
+
+    def gravacao_fria():
+        return Historico(os.path.join(tempfile.mkdtemp(dir=pasta), "historico.sqlite")).gravar(df)
+
+    lista = [
+        ("ingestão (parsing + Parquet)", ingestao_fria),
+        ("ingestão (Parquet em cache)", lambda: ingest.carregar(*ingest.fonte_caminho(csv))),
+        ("filtro (máscara nas linhas)", lambda: filtrar_linhas(df, inicio, fim, lojas_sel, horas)),
+        ("índice loja/dia", lambda: indexar(df)),
+        ("filtro (índice, metade das lojas)", lambda: filtrar_linhas(df, inicio, fim, lojas_sel, horas, indice)),
+        ("filtro (índice, 3 lojas)", lambda: filtrar_linhas(df, inicio, fim, lojas_sel[:3], horas, indice)),
+        ("cubo", lambda: montar_cubo(df)),
+        ("recorte do cubo", lambda: recortar(cubo, inicio, fim, lojas_sel, horas)),
+        ("kpis", lambda: kpis(serie_diaria(rec))),
+        ("ranking", lambda: ranking_lojas(rec)),
+        ("heatmap data × hora", lambda: heatmap_data_hora(rec)),
+        ("add_alertas", lambda: add_alertas(df)),
+        ("zero prolongado (≥ 4h)", lambda: sequencias_zero(cubo, 4)),
+        ("matrizes da comparação", lambda: matrizes(rec)),
+        ("modo 1: A vs B por hora", lambda: comparar_por_hora(mat, loja_A, loja_B)),
+        ("modo 2: A vs B diário", modo_2),
+        ("modo 3: N lojas por hora", lambda: soma_hora_lojas(mat, top[:6])),
+        ("modo 4: grupos por hora", lambda: (soma_grupos(mat, grupos, "Hora"), comparar_grupos(mat, grupos, "Hora"))),
+        ("modo 5: grupos diário", lambda: reamostrar_serie(soma_grupos(mat, grupos, "Data"), "Automática", 500,
+                                                           por="Grupo")),
+        ("lojas parecidas (matriz + top k)", lambda: semelhantes(mat, similaridade(mat), loja_A, 5)),
+        ("small multiples (página de 12)", lambda: normalizar_por_hora(mat, top[:12], mat_base)),
+        ("pódio top 10 por hora (todas)", lambda: podio(mat, "Hora", 10)),
+        ("pódio top 10 por dia (todas)", lambda: podio(mat, "Data", 10)),
+        ("pódio top 10 por hora da semana", lambda: podio(mat, "Hora da semana", 10)),
+        ("sqlite: gravação (histórico vazio)", gravacao_fria),
+        ("sqlite: upsert da mesma base", lambda: hist.gravar(df)),
+        ("sqlite: série diária", lambda: hist.serie_diaria(*filtro)),
+        ("sqlite: ranking", lambda: hist.ranking_lojas(*filtro)),
+        ("sqlite: matrizes da comparação", lambda: hist.matrizes(*filtro)),
+        ("sqlite: alertas (histórico inteiro)", lambda: hist.baseline_alertas(7)),
+        ("sqlite: zero prolongado (≥ 4h)", lambda: hist.sequencias_zero(4)),
+        ("sqlite: página da grid", lambda: hist.pagina(*filtro, "Fluxo", False, "", 100, 3)),
+    ]
+    if consulta.duckdb is not None:  # backend opcional: só mede se o pacote estiver instalado
+        sql = consulta.BaseDuckDB(csv)
+        lista += [
+            ("duckdb: registro (Parquet em cache)", lambda: consulta.BaseDuckDB(csv)),
+            ("duckdb: série diária", lambda: sql.serie_diaria(*filtro)),
+            ("duckdb: ranking", lambda: sql.ranking_lojas(*filtro)),
+            ("duckdb: matrizes da comparação", lambda: sql.matrizes(*filtro)),
+            ("duckdb: alertas (base inteira)", lambda: sql.baseline_alertas(7)),
+            ("duckdb: zero prolongado (≥ 4h)", lambda: sql.sequencias_zero(4)),
+            ("duckdb: página da grid", lambda: sql.pagina(*filtro, "Fluxo", False, "", 100, 3)),
+        ]
+    return lista
+
+
+def medir(funcao, repeticoes):
+    """(tempos em s, pico de memória em bytes) de uma etapa."""
+    tempos = []
+    for _ in range(repeticoes):
+        gc.collect()
+        t0 = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - t0)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        funcao()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return tempos, pico
+
+
+def comparar(novos, anteriores):
+    """Razão de tempo vs a última medição de outra versão (mesma escala e etapa)."""
+    if anteriores is None or anteriores.empty:
+        return novos.assign(vs_anterior=float("nan"))
+    chaves = ["lojas", "dias", "etapa"]
+    outras = anteriores[anteriores["versao"] != novos["versao"].iloc[0]].drop_duplicates(chaves, keep="last")
+    t = novos.merge(outras[chaves + ["tempo_mediana_s"]], on=chaves, how="left", suffixes=("", "_ant"))
+    return t.assign(vs_anterior=t["tempo_mediana_s"] / t["tempo_mediana_s_ant"]).drop(columns="tempo_mediana_s_ant")
+
+
+def escala(texto):
+    lojas, dias = texto.lower().split("x")
+    return int(lojas), int(dias)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark das etapas do Fluxo SEED sobre dados sintéticos.")
+    p.add_argument("--escala", type=escala, action="append",
+                   help="LOJASxDIAS (repita para várias; padrão: 10x30 e 100x180)")
+    p.add_argument("--repeticoes", type=int, default=3)
+    p.add_argument("--semente", type=int, default=0)
+    p.add_argument("--saida", default=RESULTADOS, help="CSV de resultados (acrescenta linhas)")
+    p.add_argument("--versao", default=None, help="rótulo da versão (padrão: git describe)")
+    args = p.parse_args(argv)
+
+    rotulo = args.versao or versao()
+    anteriores = pd.read_csv(args.saida) if os.path.exists(args.saida) else None
+    quando = datetime.now().isoformat(timespec="seconds")
+    cache_original = ingest.CACHE_DIR
+    linhas = []
+    for lojas, dias in args.escala or [(10, 30), (100, 180)]:
+        with tempfile.TemporaryDirectory() as pasta:
+            df = sintetico.gerar(lojas, dias, semente=args.semente)
+            csv = os.path.join(pasta, "fluxo.csv")
+            sintetico.gravar_csv(df, csv)
+            print(f"\n{lojas} lojas × {dias} dias ({len(df):,} linhas)")
+            try:
+                for nome, funcao in etapas(df, csv, pasta):
+                    tempos, pico = medir(funcao, args.repeticoes)
+                    linhas.append({
+                        "quando": quando, "versao": rotulo, "lojas": lojas, "dias": dias, "linhas": len(df),
+                        "etapa": nome, "repeticoes": args.repeticoes,
+                        "tempo_mediana_s": statistics.median(tempos), "tempo_min_s": min(tempos),
+                        "pico_mem_mb": pico / 2**20,
+                    })
+                    print(f"  {nome:<32} {statistics.median(tempos) * 1000:10.1f} ms {pico / 2**20:9.1f} MB")
+            finally:
+                ingest.CACHE_DIR = cache_original
+
+    novos = pd.DataFrame(linhas)
+    rel = comparar(novos, anteriores)
+    if rel["vs_anterior"].notna().any():
+        print("\nTempo vs última medição de outra versão (>1 = mais lento):")
+        for _, r in rel[rel["vs_anterior"].notna()].iterrows():
+            alerta = "  <-- regressão?" if r["vs_anterior"] > 1.2 and r["tempo_mediana_s"] >= 0.01 else ""
+            print(f"  {r['lojas']}x{r['dias']} {r['etapa']:<32} {r['vs_anterior']:6.2f}x{alerta}")
+
+    novos.to_csv(args.saida, mode="a", index=False, header=not os.path.exists(args.saida))
+    print(f"\nResultados acrescentados a {args.saida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,9 @@
+"""
+Núcleo do Fluxo SEED — ingestão e cálculos, sem dependência do Streamlit.
+
+ingest (fontes → Parquet), compartilhado (base e cubo mapeados em memória entre
+processos), ao_vivo (tail incremental de um CSV que cresce), consulta (backend
+DuckDB opcional, filtros e agregações em SQL), historico (histórico acumulado em
+SQLite, upsert e consultas pelo índice), cubo (Loja × Data × Hora e agregações),
+alertas, comparacao, series, tabela, cache, exportar e lote (``python -m fluxo``).
+"""
@@ -0,0 +1,55 @@
+"""
+Linha de comando do Fluxo SEED.
+
+    python -m fluxo [FONTE] --saida precalculo --formato parquet
+
+FONTE pode ser o CSV limpo, um Excel ou uma pasta de exportações; sem FONTE,
+usa fluxo_seed_limpo.csv ou o Excel local, como o dashboard.
+"""
+import sys
+import argparse
+
+from fluxo import ingest
+from fluxo.lote import precalcular
+
+FORMATOS = {"csv": "CSV", "csv.gz": "CSV (gzip)", "parquet": "Parquet"}
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m fluxo", description="Pré-calcula ranking, alertas e perfil horário por loja.")
+    p.add_argument("fonte", nargs="?", help="CSV limpo, Excel ou pasta de exportações")
+    p.add_argument("--saida", default="precalculo", help="pasta de saída (padrão: precalculo)")
+    p.add_argument("--formato", choices=list(FORMATOS), default="parquet")
+    p.add_argument("--janela", type=int, default=7, help="janela da média móvel dos alertas (dias)")
+    p.add_argument("--alerta", type=float, default=20, help="queda %% para Alerta")
+    p.add_argument("--critico", type=float, default=40, help="queda %% para Crítico")
+    p.add_argument("--zeros", type=int, default=4, help="horas seguidas com fluxo 0 para sinalizar falha")
+    p.add_argument("--inicio", help="primeiro dia (AAAA-MM-DD); padrão: início da base")
+    p.add_argument("--fim", help="último dia (AAAA-MM-DD); padrão: fim da base")
+    p.add_argument("--trabalhadores", "--processos", type=int, help="threads para ler vários arquivos (padrão: nº de CPUs)")
+    args = p.parse_args(argv)
+
+    if args.fonte:
+        fonte = ingest.fonte_caminho(args.fonte)
+    else:
+        fonte = ingest.fonte_caminho(ingest.CSV_LIMPO) or ingest.fonte_caminho(ingest.EXCEL_LOCAL, "excel_local")
+    if fonte is None:
+        p.error(f"fonte não encontrada: {args.fonte or ingest.CSV_LIMPO}")
+
+    df, erros = ingest.carregar(*fonte, trabalhadores=args.trabalhadores)
+    for erro in erros:
+        print(f"aviso: {erro}", file=sys.stderr)
+    if df.empty:
+        print("erro: a fonte não tem linhas válidas", file=sys.stderr)
+        return 1
+
+    resumo = precalcular(df, args.saida, FORMATOS[args.formato], args.janela, args.alerta, args.critico,
+                         args.inicio, args.fim, args.zeros)
+    print(f"{resumo['lojas']} lojas, {resumo['periodo'][0]} a {resumo['periodo'][1]}:")
+    for caminho in resumo["arquivos"].values():
+        print(f"  {caminho}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
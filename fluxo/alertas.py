@@ -0,0 +1,173 @@
+"""Alertas de queda: fluxo por LOJA/DIA vs média móvel da própria loja."""
+import numpy as np
+import pandas as pd
+
+from fluxo.cubo import montar_cubo
+
+
+def media_movel(diario, tem, janela=7):
+    """
+    Média móvel de cada linha (loja) de `diario` (lojas × dias), percorrendo só os
+    dias com registro (`tem`) — como o rolling por grupo —, via somas acumuladas.
+    NaN nos dias sem registro e enquanto a janela tem menos de max(2, janela // 2) dias.
+    """
+    li, dj = np.nonzero(tem)  # ordem: loja, data
+    fluxo = diario[li, dj]
+    n = len(fluxo)
+
+    # Posição de cada linha dentro da sua loja
+    inicio = np.zeros(n, dtype=np.int64)
+    if n:
+        trocas = np.flatnonzero(np.diff(li)) + 1
+        inicio[trocas] = trocas
+        inicio = np.maximum.accumulate(inicio)
+    pos = np.arange(n) - inicio
+
+    # Média móvel (mínimo de dados para começar = metade da janela, pelo menos 2)
+    minp = max(2, janela // 2)
+    acum = np.concatenate([[0], np.cumsum(fluxo)])
+    cont = np.minimum(pos + 1, janela)
+    fim = np.arange(1, n + 1)
+    mm = np.full(diario.shape, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mm[li, dj] = np.where(cont >= minp, (acum[fim] - acum[fim - cont]) / cont, np.nan)
+    return mm
+
+
+def tabela_alertas(lojas, id_lojas, datas, diario, tem, mm):
+    """
+    Linhas LOJA/DIA (dias com registro, ordem Loja, Data) com fluxo, média móvel e
+    variação %. `lojas`, `id_lojas` e `datas` rotulam as linhas e colunas de `diario`.
+    """
+    li, dj = np.nonzero(tem)
+    fluxo = diario[li, dj]
+    base = mm[li, dj]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var_pct = np.where(base > 0, (fluxo - base) / base * 100.0, np.nan)
+    return pd.DataFrame({
+        "Loja": pd.Categorical.from_codes(li, categories=lojas),
+        "ID_Loja": id_lojas[li],
+        "Data": datas[dj],
+        "Fluxo": fluxo,
+        "mm_baseline": base,
+        "var_pct": var_pct,
+    })
+
+
+def baseline_alertas(cubo, janela=7):
+    """
+    Fluxo por LOJA/DIA e média móvel da própria loja, para todas as lojas de uma vez
+    (sem groupby/transform/lambda). Não depende dos limiares.
+    """
+    diario = cubo.valores.sum(axis=2, dtype=np.int64)
+    tem = cubo.presenca.any(axis=2)
+    return tabela_alertas(cubo.lojas, cubo.id_lojas, cubo.datas, diario, tem, media_movel(diario, tem, janela))
+
+
+def filtrar_alertas(di, inicio, fim, lojas_sel, indice=None):
+    """
+    Linhas do baseline dentro do período e das lojas do filtro. O baseline sai em
+    ordem (Loja, Data): com fluxo.indice.indexar(di), são faixas por loja.
+    """
+    if indice is not None:
+        return di.iloc[indice.posicoes(inicio, fim, lojas_sel)]
+    return di[(di["Data"].between(pd.to_datetime(inicio), pd.to_datetime(fim))) & (di["Loja"].isin(lojas_sel))]
+
+
+def classificar_alertas(di, x=20, y=40):
+    """Status por limiar (queda ≥ x% = Alerta, ≥ y% = Crítico) — passo barato e separado."""
+    v = di["var_pct"].to_numpy()
+    status = np.select([np.isnan(v), v <= -y, v <= -x], ["—", "Crítico", "Alerta"], default="No prazo")
+    return di.assign(Status=status)
+
+
+def ultimo_dia(di):
+    """(data, linhas) do último dia com alertas, ordenadas por Status e queda."""
+    ult_dia = di["Data"].max()
+    ult = di[di["Data"] == ult_dia].sort_values(["Status", "var_pct"], ascending=[True, True])
+    return ult_dia, ult
+
+
+def horario_funcionamento(cubo, frac=0.5):
+    """
+    (abre, fecha) por loja: primeira e última hora com fluxo > 0 em pelo menos
+    `frac` dos dias com registro da loja. Loja sem nenhuma hora assim: fecha = -1.
+    """
+    dias = cubo.presenca.any(axis=2).sum(axis=1)
+    ativos = (cubo.valores > 0).sum(axis=1)                        # (lojas, horas)
+    return horario_das_contagens(dias, ativos, frac)
+
+
+def horario_das_contagens(dias, ativos, frac=0.5):
+    """(abre, fecha) de horario_funcionamento a partir das contagens: dias com registro e dias com fluxo > 0 por hora."""
+    ok = ativos >= np.maximum(frac * dias, 1)[:, None]
+    tem = ok.any(axis=1)
+    abre = np.where(tem, ok.argmax(axis=1), 0)
+    fecha = np.where(tem, ok.shape[1] - 1 - ok[:, ::-1].argmax(axis=1), -1)
+    return abre, fecha
+
+
+def sequencias_zero(cubo, minimo=4, frac=0.5, horario=None, inicio=None):
+    """
+    Sequências de ≥ `minimo` horas seguidas com fluxo 0 ou sem registro, por loja,
+    dentro do horário de funcionamento e entre o primeiro e o último dia da loja.
+    A linha do tempo de cada loja só tem as horas de funcionamento: uma falha que
+    atravessa a noite é uma sequência só. Todas as lojas de uma vez (sem loop por loja):
+    o cubo é achatado em (loja, dia, hora) e as bordas das sequências saem de
+    comparações com a célula vizinha.
+    `horario` = (abre, fecha) já calculados; `inicio` = primeiro dia (índice) a
+    considerar por loja — para refazer só o fim da linha do tempo (fluxo.ao_vivo).
+    """
+    n_lojas, n_dias, n_horas = cubo.valores.shape
+    abre, fecha = horario_funcionamento(cubo, frac) if horario is None else horario
+    tem_dia = cubo.presenca.any(axis=2)
+    d_ini = tem_dia.argmax(axis=1)
+    if inicio is not None:
+        d_ini = np.maximum(d_ini, inicio)
+    d_fim = n_dias - 1 - tem_dia[:, ::-1].argmax(axis=1)
+
+    h, d = np.arange(n_horas), np.arange(n_dias)
+    dentro = (((h >= abre[:, None]) & (h <= fecha[:, None]))[:, None, :]
+              & ((d >= d_ini[:, None]) & (d <= d_fim[:, None]))[:, :, None])
+    plano = np.flatnonzero(dentro)                                  # ordem: loja, dia, hora
+    sem_registro = ~cubo.presenca.reshape(-1)[plano]
+    zero = sem_registro | (cubo.valores.reshape(-1)[plano] == 0)
+    li = plano // (n_dias * n_horas)
+
+    mesma_loja = li[1:] == li[:-1]
+    continua_antes = np.concatenate([[False], zero[:-1] & mesma_loja])
+    continua_depois = np.concatenate([zero[1:] & mesma_loja, [False]])
+    ini = np.flatnonzero(zero & ~continua_antes)
+    fim = np.flatnonzero(zero & ~continua_depois)
+    horas = fim - ini + 1
+    ok = horas >= minimo
+    ini, fim, horas = ini[ok], fim[ok], horas[ok]
+
+    acum = np.concatenate([[0], np.cumsum(sem_registro)])
+    resto = plano % (n_dias * n_horas)
+
+    def instante(k):
+        return cubo.datas[resto[k] // n_horas] + pd.to_timedelta(resto[k] % n_horas, unit="h")
+
+    return pd.DataFrame({
+        "Loja": pd.Categorical.from_codes(li[ini], categories=cubo.lojas),
+        "ID_Loja": cubo.id_lojas[li[ini]],
+        "Início": instante(ini),
+        "Fim": instante(fim),
+        "Horas": horas,
+        "Sem registro": acum[fim + 1] - acum[ini],
+    })
+
+
+def filtrar_sequencias(seq, inicio, fim, lojas_sel):
+    """Sequências das lojas do filtro que tocam o período (mostradas inteiras), das mais longas."""
+    fim_dia = pd.Timestamp(fim) + pd.Timedelta(days=1)
+    t = seq[(seq["Início"] < fim_dia) & (seq["Fim"] >= pd.Timestamp(inicio)) & (seq["Loja"].isin(lojas_sel))]
+    return t.sort_values(["Horas", "Início"], ascending=[False, True], kind="stable")
+
+
+def add_alertas(df, janela=7, x=20, y=40):
+    """Calcula alertas por LOJA/DIA vs média móvel da própria loja."""
+    if df.empty:
+        return df, pd.DataFrame()
+    return df, classificar_alertas(baseline_alertas(montar_cubo(df), janela), x, y)
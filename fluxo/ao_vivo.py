@@ -0,0 +1,509 @@
+"""
+Modo ao vivo: acompanha um CSV que cresce (os contadores acrescentam linhas
+horárias ao longo do dia) a partir do último byte lido.
+
+O estado fica em blocos de DIAS_POR_BLOCO dias (cubo, fluxo diário e médias
+móveis dos alertas), mais contagens por Loja × Hora. Cada atualização converte
+só as linhas novas e escreve só nos blocos que elas tocam; as médias móveis são
+refeitas apenas nas lojas tocadas, a partir do primeiro dia tocado (com o
+histórico mínimo que a janela precisa). Dia novo é só mais um bloco; loja nova
+realoca os blocos (raro).
+
+O app lê um Retrato: os blocos de uma versão, somente leitura, sem base de
+linhas. Bloco publicado não é alterado — o lote seguinte copia só os blocos em
+que vai escrever (copy-on-write) —, então o que foi calculado sob a chave de
+uma versão é desta versão, e um lote custa proporcional às lojas × dias dos
+blocos que toca, não ao histórico.
+"""
+import io
+import os
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from fluxo.alertas import horario_das_contagens, media_movel, sequencias_zero, tabela_alertas
+from fluxo.comparacao import Matrizes
+from fluxo.cubo import Cubo
+from fluxo.ingest import OBRIGATORIAS, ErroIngestao, coagir_tipos, compactar, digest
+
+DIAS_POR_BLOCO = 32
+# Lotes cujo alcance (lojas, dias, horas) fica guardado para as chaves por filtro e sequencias_zero
+LOTES_LEMBRADOS = 256
+
+_EPOCA = pd.Timestamp("1970-01-01")  # uma quinta-feira: dia da semana = (dia + 3) % 7
+# Arrays dos blocos (lojas, dias, ...): dtype, valor de "sem dado" e eixos depois dos dias
+_CAMPOS = {
+    "valores": (np.int32, 0, (24,)),
+    "presenca": (bool, False, (24,)),
+    "diario": (np.int64, 0, ()),
+    "tem_dia": (bool, False, ()),
+    "mm": (float, np.nan, ()),  # campo ("mm", janela)
+}
+
+
+def _dia(datas):
+    """Dias desde 1970-01-01: índice absoluto do eixo de dias dos blocos."""
+    return (np.asarray(datas, dtype="datetime64[ns]") - _EPOCA.to_datetime64()) // np.timedelta64(1, "D")
+
+
+def _datas(dias):
+    """Inverso de _dia."""
+    return _EPOCA + pd.to_timedelta(np.asarray(dias), unit="D")
+
+
+def _ler(blocos, campo, linhas, a, b):
+    """Dias [a, b) de `campo` nas `linhas` (lojas), juntando os blocos; bloco ausente = sem dado."""
+    tipo, vazio, resto = _CAMPOS[campo if isinstance(campo, str) else campo[0]]
+    saida = np.full((len(linhas), max(0, b - a)) + resto, vazio, dtype=tipo)
+    for k in range(a // DIAS_POR_BLOCO, -(-b // DIAS_POR_BLOCO)):
+        arr = blocos.get(k, {}).get(campo)
+        if arr is None:
+            continue
+        i0, i1 = max(a, k * DIAS_POR_BLOCO), min(b, (k + 1) * DIAS_POR_BLOCO)
+        saida[:, i0 - a:i1 - a] = arr[linhas, i0 - k * DIAS_POR_BLOCO:i1 - k * DIAS_POR_BLOCO]
+    return saida
+
+
+def ler_trecho(caminho, offset, cabecalho=None):
+    """
+    Linhas completas do arquivo a partir de `offset` (bytes). Devolve
+    (df no ESQUEMA, cabeçalho, novo offset); uma última linha sem '\\n' fica para
+    a próxima leitura. No offset 0, o cabeçalho é lido do próprio arquivo.
+    """
+    with open(caminho, "rb") as f:
+        f.seek(offset)
+        bloco = f.read()
+    fim = bloco.rfind(b"\n") + 1
+    if not fim:
+        return None, cabecalho, offset
+    bloco = bloco[:fim]
+    if cabecalho is None:
+        quebra = bloco.index(b"\n") + 1
+        cabecalho, bloco = bloco[:quebra], bloco[quebra:]
+        colunas = set(pd.read_csv(io.BytesIO(cabecalho), nrows=0).columns)
+        if not OBRIGATORIAS.issubset(colunas):
+            raise ErroIngestao(f"{os.path.basename(caminho)}: faltam as colunas {sorted(OBRIGATORIAS - colunas)}")
+    # Textos como str em todo trecho: a mesma loja/ID não pode virar número num trecho e texto no outro
+    df = pd.read_csv(io.BytesIO(cabecalho + bloco), dtype={c: str for c in ["Company", "Loja", "ID_Loja"]})
+    return compactar(coagir_tipos(df)), cabecalho, offset + fim
+
+
+def _inicio_releitura(blocos, linhas, d0, janela, primeiro):
+    """Primeiro dia a reler para cada loja ter janela - 1 dias com registro antes de d0 (ou o primeiro dia)."""
+    a, passo = d0, janela
+    while a > primeiro:
+        a = max(primeiro, d0 - passo)
+        if (_ler(blocos, "tem_dia", linhas, a, d0).sum(axis=1) >= janela - 1).all():
+            break
+        passo *= 2
+    return a
+
+
+def _dia_reinicio(retrato, linhas, abre, d0):
+    """
+    Por loja (`linhas`), o último dia antes de d0 em que a primeira hora de
+    funcionamento teve fluxo > 0 (o primeiro dia se não houver): nenhuma sequência
+    de zeros atravessa esse ponto, então a linha do tempo pode ser refeita a partir dele.
+    """
+    primeiro = retrato.dias[0]
+    r = np.full(len(linhas), primeiro, dtype=np.int64)
+    falta, fim, passo = np.arange(len(linhas)), d0, 2
+    while len(falta) and fim > primeiro:
+        ini = max(primeiro, d0 - passo)
+        v = retrato.ler("valores", linhas[falta], ini, fim)
+        ok = np.take_along_axis(v, abre[falta][:, None, None], axis=2)[:, :, 0] > 0
+        achou = ok.any(axis=1)
+        r[falta[achou]] = fim - 1 - ok[achou, ::-1].argmax(axis=1)
+        falta, fim, passo = falta[~achou], ini, passo * 2
+    return r
+
+
+def _somente_leitura(arr):
+    """View do array que não aceita escrita (o que vai para os leitores)."""
+    v = arr.view()
+    v.flags.writeable = False
+    return v
+
+
+@dataclass(frozen=True)
+class Retrato:
+    """
+    Conteúdo lido até uma versão, para as sessões lerem sem lock. lojas None =
+    nada lido ainda. `empresas` é a Company de cada loja (a primeira lida, como o
+    ID_Loja) ou None se o arquivo não tem a coluna.
+    """
+    chave: str
+    geracao: int
+    versao: int
+    lojas: pd.Index = None
+    id_lojas: np.ndarray = None
+    empresas: pd.Series = None  # Company por loja
+    dias: tuple = None          # (primeiro, último) dia com registro (_dia)
+    horas: tuple = None         # (menor, maior) hora com registro
+    blocos: dict = None         # nº do bloco -> {campo: array somente leitura}
+    contagens: dict = None      # por loja (× hora): ativos, soma_hora, dias_hora, dias, semana_hora...
+    janelas: frozenset = frozenset()  # médias móveis presentes nos blocos
+    medias: dict = field(default_factory=dict)  # janela -> média móvel inteira, calculada sob demanda
+
+    @property
+    def datas(self):
+        return pd.date_range(_datas(self.dias[0]), periods=self.dias[1] - self.dias[0] + 1, freq="D")
+
+    def dominio(self):
+        """(primeiro dia, último dia, lojas, menor hora, maior hora), como nos backends SQL; None se vazio."""
+        if self.lojas is None:
+            return None
+        return _datas(self.dias[0]), _datas(self.dias[1]), self.lojas.tolist(), self.horas[0], self.horas[1]
+
+    def ler(self, campo, linhas, a, b):
+        """Dias [a, b) (_dia) de um campo dos blocos, nas `linhas` (lojas)."""
+        return _ler(self.blocos, campo, linhas, a, b)
+
+    def selecao(self, inicio, fim, lojas_sel):
+        """(linhas das lojas, primeiro dia, dia após o último) do filtro, recortados ao que foi lido."""
+        il = self.lojas.get_indexer(lojas_sel)
+        il = np.sort(il[il >= 0])
+        a = max(self.dias[0], int(_dia(pd.Timestamp(inicio))))
+        b = max(a, min(self.dias[1] + 1, int(_dia(pd.Timestamp(fim))) + 1))
+        return il, a, b
+
+    def recortar(self, inicio, fim, lojas_sel, horas):
+        """Mesmo resultado de cubo.recortar sobre o cubo inteiro desta versão, lendo só os blocos do período."""
+        il, a, b = self.selecao(inicio, fim, lojas_sel)
+        h = slice(horas[0], horas[1] + 1)
+        return Cubo(
+            np.ascontiguousarray(self.ler("valores", il, a, b)[:, :, h]),
+            np.ascontiguousarray(self.ler("presenca", il, a, b)[:, :, h]),
+            self.lojas[il],
+            self.id_lojas[il],
+            pd.date_range(_datas(a), periods=b - a, freq="D"),
+            np.arange(24)[h],
+        )
+
+    def matrizes(self):
+        """Mesmo resultado de comparacao.matrizes do cubo inteiro: Loja × Hora e semana saem das contagens mantidas."""
+        todas = np.arange(len(self.lojas))
+        c = self.contagens
+        return Matrizes(
+            lojas=self.lojas,
+            id_lojas=self.id_lojas,
+            horas=np.arange(24),
+            datas=self.datas,
+            hora=c["soma_hora"],
+            dias_hora=c["dias_hora"],
+            dia=self.ler("diario", todas, self.dias[0], self.dias[1] + 1),
+            tem_dia=self.ler("tem_dia", todas, self.dias[0], self.dias[1] + 1),
+            semana_hora=c["semana_hora"],
+            tem_semana_hora=c["tem_semana_hora"],
+        )
+
+
+class Acompanhamento:
+    """
+    Estado do tail de um arquivo (offset, blocos, contagens e o alcance dos
+    últimos lotes). Compartilhado entre sessões: atualizar/retrato e as consultas
+    de um retrato que mexem no estado passam por um lock.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._geracao = 0
+        self._zerar()
+
+    def _zerar(self):
+        self.offset = 0
+        self.linhas = 0
+        self._versao = 0
+        self._cabecalho = None
+        self.lojas = None          # pd.Index ordenado: eixo 0 de todos os arrays
+        self._id_lojas = None
+        self._empresas = None      # Company por loja (Series) ou None
+        self._dias = None          # (primeiro, último) dia com registro (_dia)
+        self._horas = None
+        self._blocos = {}          # nº do bloco -> {campo: array (lojas, DIAS_POR_BLOCO, ...)}
+        self._livres = set()       # (bloco, campo) ainda não publicados: podem ser escritos no lugar
+        self._contagens = {}       # arrays pequenos por loja (× hora), copiados a cada retrato
+        self._janelas = set()      # médias móveis mantidas nos blocos
+        self._retrato = None
+        self._lotes = deque(maxlen=LOTES_LEMBRADOS)  # (versão, lojas, 1º dia, último dia, 1ª hora, última hora)
+        self._zeros = {}           # mínimo -> (versão, abre, fecha, sequências)
+        self._geracao += 1
+
+    def _chave(self, geracao, versao):
+        return f"ao_vivo-{digest(self.caminho.encode())}-{geracao}-{versao}"
+
+    @property
+    def chave(self):
+        """Identifica o conteúdo lido até agora (muda a cada lote de linhas novas) — chave dos caches derivados."""
+        return self._chave(self._geracao, self._versao)
+
+    def atualizar(self):
+        """Lê e aplica as linhas acrescentadas desde a última leitura; devolve quantas entraram."""
+        with self._lock:
+            if os.path.getsize(self.caminho) < self.offset:
+                self._zerar()  # arquivo truncado ou trocado: recomeça do início
+            novas, self._cabecalho, offset = ler_trecho(self.caminho, self.offset, self._cabecalho)
+            self.offset = offset
+            if novas is None or novas.empty:
+                return 0
+            self._acomodar(novas)
+            self._aplicar(novas)
+            h0, h1 = int(novas["Hora"].min()), int(novas["Hora"].max())
+            self._horas = (h0, h1) if self._horas is None else (min(h0, self._horas[0]), max(h1, self._horas[1]))
+            self.linhas += len(novas)
+            self._versao += 1
+            self._lotes.append((self._versao, frozenset(novas["Loja"].cat.categories),
+                                novas["Data"].min(), novas["Data"].max(), h0, h1))
+            return len(novas)
+
+    def _acomodar(self, novas):
+        """Garante que as lojas das linhas novas existam nos arrays (realoca os blocos só se aparecer loja)."""
+        lojas_n = novas["Loja"].cat.categories
+        if self.lojas is not None and lojas_n.isin(self.lojas).all():
+            return
+
+        lojas = lojas_n if self.lojas is None else self.lojas.union(lojas_n)
+        ids = novas["ID_Loja"].astype(str).groupby(novas["Loja"], observed=True).first()
+        id_lojas = ids.reindex(lojas).to_numpy(dtype=object)
+        empresas = None
+        if "Company" in novas.columns:
+            empresas = novas["Company"].astype(str).groupby(novas["Loja"], observed=True).first().reindex(lojas)
+        if self.lojas is None:
+            n = len(lojas)
+            self._contagens = {
+                "ativos": np.zeros((n, 24), np.int64),           # dias com fluxo > 0 na hora
+                "soma_hora": np.zeros((n, 24), np.int64),
+                "dias_hora": np.zeros((n, 24), np.int64),        # dias com registro na hora
+                "dias": np.zeros(n, np.int64),                   # dias com registro
+                "semana_hora": np.zeros((n, 7, 24), np.int64),
+                "tem_semana_hora": np.zeros((n, 7, 24), bool),
+            }
+        else:
+            il = lojas.get_indexer(self.lojas)
+
+            def mover(arr, vazio):
+                novo = np.full((len(lojas),) + arr.shape[1:], vazio, dtype=arr.dtype)
+                novo[il] = arr
+                return novo
+
+            id_lojas[il] = self._id_lojas
+            if empresas is not None:
+                empresas.iloc[il] = self._empresas.to_numpy()
+            self._blocos = {
+                k: {campo: mover(arr, _CAMPOS[campo if isinstance(campo, str) else campo[0]][1])
+                    for campo, arr in bloco.items()}
+                for k, bloco in self._blocos.items()
+            }
+            self._livres = {(k, campo) for k, bloco in self._blocos.items() for campo in bloco}
+            self._contagens = {nome: mover(arr, 0) for nome, arr in self._contagens.items()}
+        self.lojas, self._id_lojas, self._empresas = lojas, id_lojas, empresas
+
+    def _gravavel(self, k, campo):
+        """Array do bloco pronto para escrita: cópia se já está num retrato, novo (sem dado) se não existe."""
+        bloco = self._blocos.setdefault(k, {})
+        if (k, campo) not in self._livres:
+            atual = bloco.get(campo)
+            if atual is None:
+                tipo, vazio, resto = _CAMPOS[campo if isinstance(campo, str) else campo[0]]
+                bloco[campo] = np.full((len(self.lojas), DIAS_POR_BLOCO) + resto, vazio, dtype=tipo)
+            else:
+                bloco[campo] = atual.copy()
+            self._livres.add((k, campo))
+        return bloco[campo]
+
+    def _gravar(self, campo, linhas, a, valores):
+        """Escreve `valores` (linhas × dias a partir de a) nos blocos que eles cobrem."""
+        b = a + valores.shape[1]
+        for k in range(a // DIAS_POR_BLOCO, -(-b // DIAS_POR_BLOCO)):
+            i0, i1 = max(a, k * DIAS_POR_BLOCO), min(b, (k + 1) * DIAS_POR_BLOCO)
+            self._gravavel(k, campo)[linhas, i0 - k * DIAS_POR_BLOCO:i1 - k * DIAS_POR_BLOCO] = valores[:, i0 - a:i1 - a]
+
+    def _aplicar(self, novas):
+        """Grava as células novas nos blocos que tocam e propaga para o diário, as contagens e as médias móveis."""
+        li = self.lojas.get_indexer(novas["Loja"].cat.categories)[novas["Loja"].cat.codes.to_numpy()]
+        dia = _dia(novas["Data"])
+        hora = novas["Hora"].to_numpy(np.int64)
+        fluxo = novas["Fluxo"].to_numpy(np.int64)
+
+        # Célula repetida: vale a linha mais nova (como em ingest.anexar)
+        d0, d1 = int(dia.min()), int(dia.max())
+        plano = np.ravel_multi_index((li, dia - d0, hora), (len(self.lojas), d1 - d0 + 1, 24))
+        _, ult = np.unique(plano[::-1], return_index=True)
+        sel = len(plano) - 1 - ult
+        li, dia, hora, fluxo = li[sel], dia[sel], hora[sel], fluxo[sel]
+
+        c = self._contagens
+        bloco = dia // DIAS_POR_BLOCO
+        for k in np.unique(bloco):
+            m = bloco == k
+            l, d, h, f = li[m], dia[m] - k * DIAS_POR_BLOCO, hora[m], fluxo[m]
+            valores, presenca = self._gravavel(k, "valores"), self._gravavel(k, "presenca")
+            diario, tem_dia = self._gravavel(k, "diario"), self._gravavel(k, "tem_dia")
+            anterior, estava = valores[l, d, h].astype(np.int64), presenca[l, d, h]
+            dia_novo = ~tem_dia[l, d]
+            valores[l, d, h] = f
+            presenca[l, d, h] = True
+            np.add.at(diario, (l, d), f - anterior)
+            tem_dia[l, d] = True
+
+            dow = (dia[m] + 3) % 7
+            np.add.at(c["ativos"], (l, h), (f > 0).astype(np.int64) - (anterior > 0))
+            np.add.at(c["soma_hora"], (l, h), f - anterior)
+            np.add.at(c["dias_hora"], (l, h), (~estava).astype(np.int64))
+            np.add.at(c["semana_hora"], (l, dow, h), f - anterior)
+            c["tem_semana_hora"][l, dow, h] = True
+            loja_dia = np.unique(l[dia_novo] * DIAS_POR_BLOCO + d[dia_novo])
+            np.add.at(c["dias"], loja_dia // DIAS_POR_BLOCO, 1)
+
+        self._dias = (d0, d1) if self._dias is None else (min(d0, self._dias[0]), max(d1, self._dias[1]))
+        tocadas = np.unique(li)
+        fim = self._dias[1] + 1
+        for janela in self._janelas:
+            a = _inicio_releitura(self._blocos, tocadas, d0, janela, self._dias[0])
+            parcial = media_movel(_ler(self._blocos, "diario", tocadas, a, fim),
+                                  _ler(self._blocos, "tem_dia", tocadas, a, fim), janela)
+            self._gravar(("mm", janela), tocadas, d0, parcial[:, d0 - a:])
+
+    def retrato(self):
+        """Retrato da versão atual (o mesmo objeto até o próximo lote de linhas novas)."""
+        with self._lock:
+            r = self._retrato
+            if r is not None and r.geracao == self._geracao and r.versao == self._versao:
+                return r
+            if self.lojas is None:
+                r = Retrato(self.chave, self._geracao, self._versao)
+            else:
+                blocos = {k: {campo: _somente_leitura(arr) for campo, arr in bloco.items()}
+                          for k, bloco in self._blocos.items()}
+                r = Retrato(self.chave, self._geracao, self._versao, self.lojas, _somente_leitura(self._id_lojas),
+                            self._empresas, self._dias, self._horas, blocos,
+                            {nome: arr.copy() for nome, arr in self._contagens.items()}, frozenset(self._janelas))
+                self._livres.clear()  # daqui em diante, escrever num bloco publicado copia o bloco
+            self._retrato = r
+            return r
+
+    def _atual(self, retrato):
+        """O retrato é da versão em memória (sob o lock)?"""
+        return retrato.geracao == self._geracao and retrato.versao == self._versao
+
+    def _lotes_desde(self, retrato, versao):
+        """Alcance dos lotes em (versao, versão do retrato]; None se algum já foi esquecido (sob o lock)."""
+        if retrato.geracao != self._geracao:
+            return None
+        lotes = [t for t in self._lotes if versao < t[0] <= retrato.versao]
+        return lotes if len(lotes) == retrato.versao - versao else None
+
+    def _chave_ultimo_lote(self, retrato, toca):
+        """Chave da última versão (até a do retrato) cujo lote satisfaz `toca`; a do retrato se não dá para saber."""
+        with self._lock:
+            lotes = self._lotes_desde(retrato, self._lotes[0][0] - 1) if self._lotes else None
+        if lotes is None:
+            return retrato.chave
+        for lote in reversed(lotes):
+            if toca(*lote[1:]):
+                return self._chave(retrato.geracao, lote[0])
+        # Nenhum lote lembrado tocou: vale o conteúdo de antes do mais antigo
+        return self._chave(retrato.geracao, retrato.versao - len(lotes))
+
+    def chave_recorte(self, retrato, inicio, fim, lojas_sel, horas):
+        """
+        Chave do conteúdo do cubo dentro do filtro: a da última versão (até a do
+        retrato) com linhas no recorte. Derivados de filtros que os lotes novos não
+        tocam (outro período, outras lojas ou horas) continuam valendo no cache.
+        """
+        inicio, fim, sel = pd.Timestamp(inicio), pd.Timestamp(fim), set(lojas_sel)
+        return self._chave_ultimo_lote(retrato, lambda lojas, d_ini, d_fim, h_ini, h_fim: (
+            d_ini <= fim and inicio <= d_fim and h_ini <= horas[1] and horas[0] <= h_fim
+            and not lojas.isdisjoint(sel)))
+
+    def chave_alertas(self, retrato, fim, lojas_sel):
+        """Chave das linhas de alerta do filtro: a do último lote com linhas dessas lojas até `fim` (a média móvel só olha para trás)."""
+        fim, sel = pd.Timestamp(fim), set(lojas_sel)
+        return self._chave_ultimo_lote(retrato, lambda lojas, d_ini, *_: d_ini <= fim and not lojas.isdisjoint(sel))
+
+    def alertas(self, retrato, janela, inicio, fim, lojas_sel):
+        """
+        Linhas LOJA/DIA do filtro com a média móvel da janela — as mesmas de
+        filtrar_alertas(baseline_alertas(cubo inteiro, janela), ...) —, lidas só
+        dos blocos do período. Janela nova é calculada uma vez na base inteira e,
+        daí em diante, mantida nos blocos.
+        """
+        if retrato.lojas is None:
+            return pd.DataFrame()
+        il, a, b = retrato.selecao(inicio, fim, lojas_sel)
+        if janela in retrato.janelas:
+            mm = retrato.ler(("mm", janela), il, a, b)
+        else:
+            p, u = retrato.dias
+            with self._lock:
+                inteira = retrato.medias.get(janela)
+                if inteira is None:
+                    todas = np.arange(len(retrato.lojas))
+                    inteira = media_movel(retrato.ler("diario", todas, p, u + 1),
+                                          retrato.ler("tem_dia", todas, p, u + 1), janela)
+                    retrato.medias[janela] = _somente_leitura(inteira)
+                    if self._atual(retrato) and janela not in self._janelas:
+                        self._gravar(("mm", janela), todas, p, inteira)
+                        self._janelas.add(janela)
+            mm = inteira[il, a - p:b - p]
+        return tabela_alertas(retrato.lojas[il], retrato.id_lojas[il], pd.date_range(_datas(a), periods=b - a, freq="D"),
+                              retrato.ler("diario", il, a, b), retrato.ler("tem_dia", il, a, b), mm)
+
+    def sequencias_zero(self, retrato, minimo=4):
+        """
+        Mesmo resultado de alertas.sequencias_zero(cubo inteiro, minimo), partindo do
+        último cálculo: só as lojas tocadas desde então são refeitas, e só a partir do
+        último dia antes das linhas novas em que abriram com fluxo. Loja cujo horário
+        de funcionamento mudou é refeita inteira.
+        """
+        if retrato.lojas is None:
+            return pd.DataFrame()
+        abre, fecha = horario_das_contagens(retrato.contagens["dias"], retrato.contagens["ativos"])
+        with self._lock:
+            anterior = self._zeros.get(minimo)
+            lotes = None
+            if anterior is not None and anterior[0] <= retrato.versao:
+                lotes = self._lotes_desde(retrato, anterior[0])
+        if lotes is None:
+            inteiro = retrato.recortar(_datas(retrato.dias[0]), _datas(retrato.dias[1]), retrato.lojas, (0, 23))
+            seq = sequencias_zero(inteiro, minimo, horario=(abre, fecha))
+        elif not lotes:
+            return anterior[3]
+        else:
+            seq = self._refazer_zeros(retrato, minimo, abre, fecha, anterior, lotes)
+        with self._lock:
+            guardado = self._zeros.get(minimo)
+            if retrato.geracao == self._geracao and (guardado is None or guardado[0] < retrato.versao):
+                self._zeros[minimo] = (retrato.versao, pd.Series(abre, index=retrato.lojas),
+                                       pd.Series(fecha, index=retrato.lojas), seq)
+        return seq
+
+    @staticmethod
+    def _refazer_zeros(retrato, minimo, abre, fecha, anterior, lotes):
+        """Sequências de `anterior` com as lojas tocadas pelos `lotes` refeitas a partir do dia de reinício."""
+        _, abre_ant, fecha_ant, seq_ant = anterior
+        lojas = retrato.lojas
+        tocadas = np.sort(lojas.get_indexer(list(frozenset().union(*(t[1] for t in lotes)))))
+        d0 = int(_dia(min(t[2] for t in lotes)))
+        r = _dia_reinicio(retrato, tocadas, abre[tocadas], d0)
+        lojas_t = lojas[tocadas]
+        mudou = ((abre_ant.reindex(lojas_t).to_numpy() != abre[tocadas])
+                 | (fecha_ant.reindex(lojas_t).to_numpy() != fecha[tocadas]) | (fecha[tocadas] < 0))
+        r[mudou] = retrato.dias[0]
+        a, fim = int(r.min()), retrato.dias[1] + 1
+        sub = Cubo(retrato.ler("valores", tocadas, a, fim), retrato.ler("presenca", tocadas, a, fim), lojas_t,
+                   retrato.id_lojas[tocadas], pd.date_range(_datas(a), periods=fim - a, freq="D"), np.arange(24))
+        novas = sequencias_zero(sub, minimo, horario=(abre[tocadas], fecha[tocadas]), inicio=r - a)
+
+        # Das anteriores ficam as de lojas não tocadas e as que começam antes do reinício
+        reinicio = pd.Series(_datas(r), index=lojas_t)
+        limite = reinicio.reindex(seq_ant["Loja"].astype(object)).to_numpy()
+        manter = pd.isna(limite) | (seq_ant["Início"].to_numpy() < limite)
+        seq = pd.concat([seq_ant[manter].astype({"Loja": object}), novas.astype({"Loja": object})], ignore_index=True)
+        li = lojas.get_indexer(seq["Loja"])
+        seq["Loja"] = pd.Categorical.from_codes(li, categories=lojas)
+        return seq.iloc[np.lexsort((seq["Início"].to_numpy(), li))].reset_index(drop=True)
@@ -0,0 +1,86 @@
+"""Memoização dos derivados de cada estado de filtro (LRU limitado em bytes)."""
+import sys
+import threading
+import dataclasses
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from fluxo.ingest import digest
+
+
+def tamanho(obj):
+    """Estimativa do tamanho em memória de um derivado (DataFrame, array, Cubo, Matrizes, tuplas...)."""
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return sum(tamanho(getattr(obj, c)) for c in obj.__dataclass_fields__)
+    if isinstance(obj, (tuple, list)):
+        return sys.getsizeof(obj) + sum(tamanho(x) for x in obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(tamanho(x) for x in obj.values())
+    return sys.getsizeof(obj)
+
+
+class CacheLRU:
+    """
+    Memoização de derivados do filtro com despejo LRU sob um limite de bytes.
+    Os valores são compartilhados entre sessões: quem os recebe NÃO deve alterá-los.
+    """
+
+    def __init__(self, limite_bytes):
+        self.limite_bytes = limite_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._itens = OrderedDict()  # chave -> (valor, tamanho)
+        self._lock = threading.Lock()
+
+    def obter(self, chave, calcular):
+        with self._lock:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                self.hits += 1
+                return self._itens[chave][0]
+            self.misses += 1
+
+        valor = calcular()
+        t = tamanho(valor)
+        with self._lock:
+            if t <= self.limite_bytes and chave not in self._itens:
+                self._itens[chave] = (valor, t)
+                self.bytes += t
+                while self.bytes > self.limite_bytes:
+                    _, (_, t) = self._itens.popitem(last=False)
+                    self.bytes -= t
+        return valor
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "taxa_acerto": self.hits / total if total else 0.0,
+                "itens": len(self._itens),
+                "bytes": self.bytes,
+                "limite_bytes": self.limite_bytes,
+            }
+
+
+def chave_do_filtro(chave_dados, inicio, fim, lojas_sel, horas):
+    """Chave normalizada do estado de filtro (ordem/duplicatas das lojas não importam)."""
+    lojas_norm = "\x1f".join(sorted(set(map(str, lojas_sel))))
+    return (
+        chave_dados,
+        pd.Timestamp(inicio).date().isoformat(),
+        pd.Timestamp(fim).date().isoformat(),
+        digest(lojas_norm.encode("utf-8")),
+        int(horas[0]),
+        int(horas[1]),
+    )
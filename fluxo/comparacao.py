@@ -0,0 +1,318 @@
+"""
+Comparações entre lojas (A vs B, N lojas, grupos A×B), lojas parecidas,
+small multiples normalizados e pódio (top K por hora, dia ou hora da semana).
+
+Os modos de comparação leem duas matrizes calculadas uma vez por filtro
+(Loja × Hora e Loja × Data, ver `matrizes`): trocar de modo ou mexer nos
+grupos vira seleção e soma de linhas, sem reprocessar as linhas da base.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+DIAS_SEMANA = ["Seg", "Ter", "Qua", "Qui", "Sex", "Sáb", "Dom"]
+EIXOS_PODIO = ["Hora", "Data", "Hora da semana"]
+
+
+@dataclass(frozen=True)
+class Matrizes:
+    """Somas do recorte por Loja × Hora e Loja × Data, com a presença de cada célula."""
+    lojas: pd.Index            # rótulo de cada linha
+    id_lojas: np.ndarray
+    horas: np.ndarray          # colunas de `hora`
+    datas: pd.DatetimeIndex    # colunas de `dia`
+    hora: np.ndarray           # int64 (lojas, horas): soma no período
+    dias_hora: np.ndarray      # int64 (lojas, horas): nº de dias com registro
+    dia: np.ndarray            # int64 (lojas, dias)
+    tem_dia: np.ndarray        # bool  (lojas, dias)
+    semana_hora: np.ndarray    # int64 (lojas, 7, horas): soma por dia da semana × hora
+    tem_semana_hora: np.ndarray  # bool (lojas, 7, horas)
+
+    def linhas(self, lojas):
+        """Índices (ordenados) das lojas pedidas; lojas fora do recorte são ignoradas."""
+        il = self.lojas.get_indexer(pd.unique(np.asarray(lojas, dtype=object)))
+        return np.sort(il[il >= 0])
+
+    def eixo(self, eixo):
+        """(rótulos, somas, presença) do eixo "Hora" ou "Data"."""
+        if eixo == "Hora":
+            return self.horas, self.hora, self.dias_hora > 0
+        return self.datas, self.dia, self.tem_dia
+
+
+def matrizes(rec):
+    """Reduz o recorte do cubo às matrizes Loja × Hora, Loja × Data e Loja × (dia da semana, hora)."""
+    dow = rec.datas.dayofweek.to_numpy()
+    forma = (len(rec.lojas), 7, len(rec.horas))
+    semana_hora, tem_semana_hora = np.zeros(forma, dtype=np.int64), np.zeros(forma, dtype=bool)
+    for d in range(7):
+        dias = dow == d
+        if dias.any():
+            semana_hora[:, d] = rec.valores[:, dias].sum(axis=1, dtype=np.int64)
+            tem_semana_hora[:, d] = rec.presenca[:, dias].any(axis=1)
+    return Matrizes(
+        lojas=rec.lojas,
+        id_lojas=rec.id_lojas,
+        horas=rec.horas.astype(int),
+        datas=rec.datas,
+        hora=rec.valores.sum(axis=1, dtype=np.int64),
+        dias_hora=rec.presenca.sum(axis=1, dtype=np.int64),
+        dia=rec.valores.sum(axis=2, dtype=np.int64),
+        tem_dia=rec.presenca.any(axis=2),
+        semana_hora=semana_hora,
+        tem_semana_hora=tem_semana_hora,
+    )
+
+
+def grupos_linhas(mat, grupos):
+    """
+    {nome: linhas} de `grupos` = [(nome, lojas), ...], em ordem de nome;
+    uma loja em mais de um grupo conta no primeiro.
+    """
+    usadas = np.zeros(len(mat.lojas), dtype=bool)
+    por_nome = {}
+    for nome, lojas in grupos:
+        il = mat.linhas(lojas)
+        il = il[~usadas[il]]
+        usadas[il] = True
+        por_nome[nome] = np.union1d(por_nome.get(nome, il[:0]), il)
+    return {nome: por_nome[nome] for nome in sorted(por_nome)}
+
+
+def _somar(mat, eixo, linhas):
+    """(soma, presença) das `linhas` ao longo do eixo."""
+    _, soma, tem = mat.eixo(eixo)
+    return soma[linhas].sum(axis=0), tem[linhas].any(axis=0)
+
+
+def lado_a_lado(mat, eixo, linhas_a, linhas_b):
+    """
+    Série de `linhas_a` e de `linhas_b` lado a lado por `eixo` (só onde algum
+    lado tem registro): Fluxo_A, Fluxo_B e Delta (A - B). None se um lado não tem dados.
+    """
+    soma_a, tem_a = _somar(mat, eixo, linhas_a)
+    soma_b, tem_b = _somar(mat, eixo, linhas_b)
+    if not tem_a.any() or not tem_b.any():
+        return None
+    manter = tem_a | tem_b
+    rotulos, _, _ = mat.eixo(eixo)
+    base = pd.DataFrame({eixo: rotulos[manter], "Fluxo_A": soma_a[manter], "Fluxo_B": soma_b[manter]})
+    base["Delta"] = base["Fluxo_A"] - base["Fluxo_B"]
+    return base
+
+
+# ---------- A vs B ----------
+def totais(mat, loja_A, loja_B):
+    """Fluxo total de A e de B no recorte."""
+    return int(mat.hora[mat.linhas([loja_A])].sum()), int(mat.hora[mat.linhas([loja_B])].sum())
+
+
+def diferenca(tot_A, tot_B):
+    """(Δ absoluto, Δ % vs B); o % é NaN quando B não tem fluxo."""
+    diff_abs = tot_A - tot_B
+    return diff_abs, (diff_abs / tot_B * 100.0) if tot_B > 0 else np.nan
+
+
+def placar_horas(base):
+    """Horas em que A vence, em que B vence e empates."""
+    return int((base["Delta"] > 0).sum()), int((base["Delta"] < 0).sum()), int((base["Delta"] == 0).sum())
+
+
+def comparar_por_hora(mat, loja_A, loja_B):
+    """A vs B por hora (soma no período) com o vencedor de cada hora; None se faltar uma loja."""
+    base = lado_a_lado(mat, "Hora", mat.linhas([loja_A]), mat.linhas([loja_B]))
+    if base is None:
+        return None
+    base["Vencedor"] = np.where(base["Delta"] > 0, "A", np.where(base["Delta"] < 0, "B", "Empate"))
+    return base
+
+
+def comparar_por_dia(mat, loja_A, loja_B):
+    """A vs B por dia; None se faltar uma loja."""
+    return lado_a_lado(mat, "Data", mat.linhas([loja_A]), mat.linhas([loja_B]))
+
+
+def longo_ab(base, eixo, loja_A, loja_B):
+    """Formato longo (eixo, Serie, Fluxo) de uma base lado a lado, para o gráfico."""
+    long = base.melt(
+        id_vars=[eixo],
+        value_vars=["Fluxo_A", "Fluxo_B"],
+        var_name="Serie",
+        value_name="Fluxo"
+    )
+    long["Serie"] = long["Serie"].map({"Fluxo_A": loja_A, "Fluxo_B": loja_B})
+    return long
+
+
+# ---------- N lojas e grupos ----------
+def soma_hora_lojas(mat, lojas):
+    """Soma no período por Loja × Hora das lojas pedidas (linhas sobrepostas)."""
+    il = mat.linhas(lojas)
+    li, hi = np.nonzero(mat.dias_hora[il])
+    return pd.DataFrame({"Loja": mat.lojas[il][li], "Hora": mat.horas[hi], "Fluxo": mat.hora[il][li, hi]})
+
+
+def soma_grupos(mat, grupos, eixo="Hora"):
+    """
+    Soma por Grupo × `eixo` ("Hora" ou "Data"), em formato longo, ordenada por
+    grupo e eixo. `grupos` = [(nome, lojas), ...] (ver grupos_linhas).
+    """
+    por_nome = grupos_linhas(mat, grupos)
+    rotulos, soma, tem = mat.eixo(eixo)
+    nomes = np.array(list(por_nome), dtype=object)
+    soma_g = np.stack([soma[il].sum(axis=0) for il in por_nome.values()]) if len(nomes) else soma[:0]
+    tem_g = np.stack([tem[il].any(axis=0) for il in por_nome.values()]) if len(nomes) else tem[:0]
+    gi, ci = np.nonzero(tem_g)
+    return pd.DataFrame({"Grupo": nomes[gi], eixo: rotulos[ci], "Fluxo": soma_g[gi, ci]})
+
+
+def comparar_grupos(mat, grupos, eixo="Hora"):
+    """Primeiro vs segundo grupo de `grupos` lado a lado por `eixo`; None se um grupo não tem dados."""
+    por_nome = grupos_linhas(mat, grupos)
+    (nome_a, _), (nome_b, _) = grupos[:2]
+    return lado_a_lado(mat, eixo, por_nome[nome_a], por_nome[nome_b])
+
+
+# ---------- Lojas parecidas ----------
+def perfis(mat):
+    """
+    Perfil de cada loja: participação de cada hora no fluxo do período e de cada
+    dia da semana na média diária (cada parte soma 1), lado a lado — (lojas, horas + 7).
+    """
+    semana = np.eye(7, dtype=np.int64)[mat.datas.dayofweek]        # (dias, 7)
+    soma_sem = mat.dia @ semana
+    dias_sem = mat.tem_dia.astype(np.int64) @ semana
+    media_sem = np.divide(soma_sem, dias_sem, out=np.zeros(soma_sem.shape), where=dias_sem > 0)
+    partes = []
+    for m in (mat.hora.astype(float), media_sem):
+        tot = m.sum(axis=1, keepdims=True)
+        partes.append(np.divide(m, tot, out=np.zeros_like(m), where=tot > 0))
+    return np.hstack(partes)
+
+
+def similaridade(mat):
+    """
+    Correlação de Pearson entre os perfis de todas as lojas (lojas × lojas), num
+    único produto Z @ Z.T. Lojas sem fluxo no recorte ficam com NaN.
+    """
+    z = perfis(mat)
+    z -= z.mean(axis=1, keepdims=True)
+    norma = np.linalg.norm(z, axis=1, keepdims=True)
+    valida = norma[:, 0] > 0
+    z = np.divide(z, norma, out=np.zeros_like(z), where=norma > 0).astype(np.float32)
+    sim = z @ z.T
+    sim[~valida] = np.nan
+    sim[:, ~valida] = np.nan
+    return sim
+
+
+def semelhantes(mat, sim, loja, k=5, parecidas=True):
+    """As k lojas mais parecidas (ou mais diferentes) com `loja`: Loja, ID_Loja, Similaridade."""
+    il = mat.linhas([loja])
+    vazio = pd.DataFrame({"Loja": [], "ID_Loja": [], "Similaridade": []})
+    if not len(il):
+        return vazio
+    s = sim[il[0]].astype(float)
+    s[il[0]] = np.nan
+    cand = np.flatnonzero(~np.isnan(s))
+    if not len(cand):
+        return vazio
+    chave = -s[cand] if parecidas else s[cand]
+    k = min(k, len(cand))
+    top = cand[np.argpartition(chave, k - 1)[:k]]
+    top = top[np.argsort(-s[top] if parecidas else s[top], kind="stable")]
+    return pd.DataFrame({"Loja": mat.lojas[top], "ID_Loja": mat.id_lojas[top], "Similaridade": s[top].round(3)})
+
+
+# ---------- Small multiples e pódio ----------
+def lojas_por_fluxo(rank):
+    """Lojas do ranking, da maior para a menor soma no período."""
+    return rank.sort_values("Fluxo", ascending=False)["Loja"].tolist()
+
+
+def normalizar_por_hora(mat, lojas, referencia=None):
+    """
+    Loja × Hora das lojas escolhidas (soma e dias com registro no período) vs a
+    mesma hora na própria loja em `referencia` (matrizes de um período de
+    referência, ex.: o histórico inteiro): baseline_hora = média por dia com
+    registro na referência, esperado = baseline × n_dias do período e o desvio %
+    vs esperado. Sem referência, baseline/esperado/norm_pct ficam NaN.
+    """
+    il = mat.linhas(lojas)
+    il = il[np.argsort(np.asarray(mat.lojas[il], dtype=str), kind="stable")]
+    li, hi = np.nonzero(mat.dias_hora[il])
+    soma = mat.hora[il][li, hi]
+    n_dias = mat.dias_hora[il][li, hi]
+    baseline = np.full(len(soma), np.nan)
+    if referencia is not None:
+        # Lojas e horas casadas pelo rótulo: a referência pode ter outras lojas/horas
+        ir = referencia.lojas.get_indexer(mat.lojas[il][li])
+        jr = pd.Index(referencia.horas).get_indexer(mat.horas[hi])
+        ok = (ir >= 0) & (jr >= 0)
+        r_soma = referencia.hora[ir[ok], jr[ok]].astype(float)
+        r_dias = referencia.dias_hora[ir[ok], jr[ok]]
+        baseline[ok] = np.divide(r_soma, r_dias, out=np.full(len(r_soma), np.nan), where=r_dias > 0)
+    esperado = baseline * n_dias
+    norm_pct = np.full(len(soma), np.nan)
+    np.divide(soma, esperado, out=norm_pct, where=esperado > 0)
+    return pd.DataFrame({
+        "Loja": mat.lojas[il][li],
+        "ID_Loja": mat.id_lojas[il][li],
+        "Hora": mat.horas[hi],
+        "Fluxo": soma,
+        "baseline_hora": baseline,
+        "n_dias": n_dias,
+        "esperado": esperado,
+        "norm_pct": (norm_pct - 1.0) * 100.0,
+    })
+
+
+def paginar_lojas(lojas, por_pagina, numero):
+    """(lojas da página `numero` (1-based), nº de páginas) — para não desenhar centenas de facetas de uma vez."""
+    paginas = max(1, -(-len(lojas) // por_pagina))
+    numero = min(max(1, int(numero)), paginas)
+    return lojas[(numero - 1) * por_pagina:numero * por_pagina], paginas
+
+
+def _matriz_podio(mat, eixo):
+    """(rótulos das colunas, somas, presença) da matriz Loja × `eixo` do pódio."""
+    if eixo == "Hora da semana":
+        n = len(mat.lojas)
+        rotulos = np.array([f"{DIAS_SEMANA[d]} {h:02d}h" for d in range(7) for h in mat.horas], dtype=object)
+        return rotulos, mat.semana_hora.reshape(n, -1), mat.tem_semana_hora.reshape(n, -1)
+    return mat.eixo(eixo)
+
+
+def podio(mat, eixo="Hora", k=3, lojas=None):
+    """
+    Top k lojas em cada coluna de `eixo` ("Hora", "Data" ou "Hora da semana"),
+    entre `lojas` (todas do recorte se None). Seleção parcial (argpartition) na
+    matriz Loja × eixo; empates ficam com a loja que vem primeiro, como
+    rank(method="first"). Só entram células com registro.
+    """
+    rotulos, soma, tem = _matriz_podio(mat, eixo)
+    il = np.arange(len(mat.lojas)) if lojas is None else mat.linhas(lojas)
+    soma, tem = soma[il], tem[il]
+    n = len(il)
+    k = min(int(k), n)
+    if not k or not soma.shape[1]:
+        return pd.DataFrame({"Loja": [], "ID_Loja": [], eixo: [], "Fluxo": [], "rank": []})
+
+    # Chave única por célula: fluxo (desc) e, no empate, a loja de menor índice; sem registro = -1
+    chave = np.where(tem, soma * n + (n - 1 - np.arange(n))[:, None], -1)
+    top = np.argpartition(-chave, k - 1, axis=0)[:k]                       # (k, colunas), sem ordem
+    top = np.take_along_axis(top, np.argsort(-np.take_along_axis(chave, top, axis=0), axis=0), axis=0)
+
+    li = top.T.ravel()                                                    # coluna a coluna, rank 1..k
+    ci = np.repeat(np.arange(soma.shape[1]), k)
+    rank = np.tile(np.arange(1, k + 1), soma.shape[1])
+    ok = tem[li, ci]
+    li, ci, rank = li[ok], ci[ok], rank[ok]
+    return pd.DataFrame({
+        "Loja": mat.lojas[il][li],
+        "ID_Loja": mat.id_lojas[il][li],
+        eixo: rotulos[ci],
+        "Fluxo": soma[li, ci],
+        "rank": rank,
+    })
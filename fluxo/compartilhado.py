@@ -0,0 +1,164 @@
+"""
+Base e cubo compartilhados entre processos: as colunas do DataFrame e os arrays
+do cubo ficam em arquivos .npy (um diretório por chave de conteúdo, ao lado do
+Parquet) abertos com mmap somente leitura.
+
+Todos os processos do servidor — e todas as sessões de cada um — mapeiam as
+mesmas páginas do cache do sistema operacional: a memória residente não cresce
+com o número de workers. Os arrays são read-only; quem os recebe NÃO deve
+alterá-los (o mesmo contrato do cache_resource).
+
+Por fonte, só as ingest.VERSOES_POR_FONTE versões mais recentes ficam em disco.
+"""
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from fluxo import ingest
+from fluxo.cubo import Cubo, montar_cubo
+
+
+def _pasta(chave, parte):
+    return os.path.join(ingest.CACHE_DIR, "mmap", f"{chave}.{parte}")
+
+
+def _publicar(pasta, arrays, meta):
+    """
+    Grava os arrays (.npy) e o meta.json num diretório temporário e o renomeia
+    de uma vez: leitores nunca veem um diretório pela metade. Se outro processo
+    publicou antes, o dele vale (mesmo conteúdo, mesma chave).
+    """
+    tmp = f"{pasta}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(tmp, exist_ok=True)
+        for nome, arr in arrays.items():
+            np.save(os.path.join(tmp, f"{nome}.npy"), np.ascontiguousarray(arr))
+        ingest.gravar_json(os.path.join(tmp, "meta.json"), meta)
+        os.rename(tmp, pasta)
+    except OSError:
+        # Já publicado por outro processo, disco cheio ou somente leitura: best-effort
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _abrir(pasta, nomes):
+    """{nome: array mapeado (somente leitura)} ou None se faltar algo."""
+    try:
+        # asarray: view ndarray comum sobre o mmap (sem cópia), não a subclasse np.memmap
+        return {n: np.asarray(np.load(os.path.join(pasta, f"{n}.npy"), mmap_mode="r")) for n in nomes}
+    except (OSError, ValueError):
+        return None
+
+
+# ---------- Base (DataFrame no ESQUEMA compacto) ----------
+def publicar_df(df, chave, erros=()):
+    """Grava as colunas de `df` (categorias como códigos + rótulos) para abrir_df."""
+    arrays, categorias = {}, {}
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            arrays[col] = df[col].cat.codes.to_numpy()
+            categorias[col] = df[col].cat.categories.astype(str).tolist()
+        else:
+            arrays[col] = df[col].to_numpy()
+    _publicar(_pasta(chave, "base"), arrays,
+              {"colunas": list(df.columns), "categorias": categorias, "erros": list(erros)})
+
+
+def abrir_df(chave):
+    """(df, erros) com as colunas mapeadas do disco, sem cópia; None se a chave não foi publicada."""
+    pasta = _pasta(chave, "base")
+    meta = ingest.ler_json(os.path.join(pasta, "meta.json"))
+    arrays = _abrir(pasta, meta.get("colunas", [])) if meta else None
+    if arrays is None:
+        return None
+    colunas = {}
+    for col, arr in arrays.items():
+        if col in meta["categorias"]:
+            colunas[col] = pd.Categorical.from_codes(arr, categories=meta["categorias"][col], validate=False)
+        else:
+            colunas[col] = arr
+    df = pd.DataFrame(colunas, copy=False)
+    df.attrs["chave"] = chave
+    return df, meta["erros"]
+
+
+def _descartar(chaves):
+    """
+    Apaga o que versões superadas deixaram no cache (mmap da base e do cubo,
+    Parquet). Processos que ainda as mapeiam seguem lendo: no Linux/macOS o
+    arquivo apagado vive até o último mapeamento fechar.
+    """
+    for chave in chaves:
+        for parte in ("base", "cubo"):
+            shutil.rmtree(_pasta(chave, parte), ignore_errors=True)
+        try:
+            os.remove(os.path.join(ingest.CACHE_DIR, f"{chave}.parquet"))
+        except OSError:
+            pass
+
+
+def _identidade(origem):
+    """A fonte por trás das versões: caminho absoluto ou os nomes dos arquivos enviados."""
+    if isinstance(origem, str):
+        return os.path.abspath(origem)
+    return "uploads:" + "|".join(nome for nome, _, _ in origem)
+
+
+def carregar(chave, tipo, origem, trabalhadores=None):
+    """
+    Como ingest.carregar, mas devolve a base mapeada em memória compartilhada.
+    Só o primeiro processo a pedir a chave faz a ingestão e publica; os demais
+    abrem direto os arquivos. Se a publicação falhar, devolve a cópia em memória.
+    Versões antigas da mesma fonte são apagadas do cache.
+    """
+    aberta = abrir_df(chave)
+    if aberta is None:
+        df, erros = ingest.carregar(chave, tipo, origem, trabalhadores)
+        if df.empty:
+            return df, erros
+        publicar_df(df, chave, erros)
+        aberta = abrir_df(chave) or (df, erros)
+    _descartar(ingest.registrar_versao(_identidade(origem), chave))
+    return aberta
+
+
+# ---------- Cubo ----------
+def publicar_cubo(cubo, chave):
+    _publicar(_pasta(chave, "cubo"), {"valores": cubo.valores, "presenca": cubo.presenca}, {
+        "lojas": cubo.lojas.astype(str).tolist(),
+        "id_lojas": [None if pd.isna(i) else str(i) for i in cubo.id_lojas],
+        "inicio": str(cubo.datas[0].date()) if len(cubo.datas) else None,
+        "dias": len(cubo.datas),
+        "horas": [int(h) for h in cubo.horas],
+    })
+
+
+def abrir_cubo(chave):
+    """Cubo com valores/presença mapeados do disco; None se a chave não foi publicada."""
+    pasta = _pasta(chave, "cubo")
+    meta = ingest.ler_json(os.path.join(pasta, "meta.json"))
+    arrays = _abrir(pasta, ["valores", "presenca"]) if meta else None
+    if arrays is None:
+        return None
+    return Cubo(
+        arrays["valores"],
+        arrays["presenca"],
+        pd.Index(meta["lojas"], dtype=object),
+        np.array(meta["id_lojas"], dtype=object),
+        pd.date_range(meta["inicio"], periods=meta["dias"], freq="D"),
+        np.array(meta["horas"]),
+    )
+
+
+def carregar_cubo(df):
+    """Cubo da base (chave em df.attrs["chave"]): abre o publicado ou monta, publica e abre."""
+    chave = df.attrs.get("chave")
+    if not chave:
+        return montar_cubo(df)
+    cubo = abrir_cubo(chave)
+    if cubo is None:
+        cubo = montar_cubo(df)
+        publicar_cubo(cubo, chave)
+        cubo = abrir_cubo(chave) or cubo
+    return cubo
@@ -0,0 +1,369 @@
+"""
+Backends SQL para históricos maiores que a memória.
+
+Consulta reúne a interface que o app usa (série diária, ranking, heatmap,
+matrizes da comparação, alertas, zero prolongado, páginas da grid) sobre uma
+view/tabela `fluxo` com as colunas do ESQUEMA; cada backend só diz como executar
+uma consulta, como ler Data e como montar o WHERE do filtro. Só os resultados
+agregados viram DataFrame/array, nos mesmos formatos do caminho cubo —
+comparacao, alertas e series funcionam sem mudança.
+
+BaseDuckDB (opcional): a fonte — Parquet ou CSV limpo; arquivo, pasta ou
+curinga — fica registrada como view num DuckDB embutido, sem carregar as
+linhas no pandas. CSV é convertido uma única vez para Parquet em CACHE_DIR
+(pelo próprio DuckDB, fora da memória), em ordem (Loja, Data, Hora): os filtros
+por faixa de lojas e período pulam os row groups que não interessam. As
+agregações grandes ficam limitadas a FLUXO_DUCKDB_MEMORIA e, passando disso,
+usam disco em CACHE_DIR. O histórico em SQLite está em historico.Historico.
+"""
+import os
+import glob
+
+import numpy as np
+import pandas as pd
+
+try:
+    import duckdb
+except ImportError:  # dependência opcional: só este backend precisa
+    duckdb = None
+
+from fluxo import ingest
+from fluxo.alertas import media_movel, sequencias_zero, tabela_alertas
+from fluxo.comparacao import Matrizes
+from fluxo.cubo import Cubo
+
+# Lojas por lote no zero prolongado (cubo denso só do lote: lojas × dias × 24)
+LOJAS_POR_LOTE = 200
+# Teto de memória do DuckDB (acima disso as agregações vão para disco)
+MEMORIA = os.environ.get("FLUXO_DUCKDB_MEMORIA", "1GB")
+
+# Mesmas coerções de ingest.coagir_tipos/compactar, em SQL (CSV lido todo como texto)
+_EXPR_CSV = {
+    "Company": "trim(Company)",
+    "Loja": "trim(Loja)",
+    "ID_Loja": "trim(ID_Loja)",
+    "Data": "CAST(coalesce(try_strptime(Data, '%d/%m/%Y'), TRY_CAST(Data AS TIMESTAMP)) AS DATE)",
+    "Hora": "TRY_CAST(TRY_CAST(Hora AS DOUBLE) AS INTEGER)",
+    "Fluxo": "CAST(round(coalesce(TRY_CAST(Fluxo AS DOUBLE), 0)) AS BIGINT)",
+}
+_EXPR_PARQUET = {
+    "Company": "CAST(Company AS VARCHAR)",
+    "Loja": "CAST(Loja AS VARCHAR)",
+    "ID_Loja": "CAST(ID_Loja AS VARCHAR)",
+    "Data": "CAST(Data AS DATE)",
+    "Hora": "CAST(Hora AS INTEGER)",
+    "Fluxo": "CAST(round(coalesce(CAST(Fluxo AS DOUBLE), 0)) AS BIGINT)",
+}
+
+
+def arquivos(fonte):
+    """Arquivos .parquet/.csv da fonte (arquivo, pasta ou curinga), em ordem de nome."""
+    if os.path.isdir(fonte):
+        fonte = os.path.join(fonte, "*")
+    return sorted(c for c in glob.glob(fonte)
+                  if os.path.isfile(c) and os.path.splitext(c)[1].lower() in (".parquet", ".csv"))
+
+
+def assinatura(fonte):
+    """Muda quando algum arquivo da fonte muda (caminho, tamanho, mtime) — sem ler o conteúdo."""
+    partes = []
+    for c in arquivos(fonte):
+        st = os.stat(c)
+        partes.append(f"{os.path.abspath(c)}:{st.st_size}:{st.st_mtime_ns}")
+    return ingest.digest("|".join(partes).encode("utf-8"))
+
+
+def _texto_sql(texto):
+    """Literal de texto SQL (aspas simples dobradas)."""
+    return "'" + texto.replace("'", "''") + "'"
+
+
+def _lista_sql(caminhos):
+    return "[" + ", ".join(map(_texto_sql, caminhos)) + "]"
+
+
+def _int(col):
+    return np.asarray(col, dtype=np.int64)
+
+
+class Consulta:
+    """
+    Consultas sobre a tabela `fluxo`, comuns aos backends. A subclasse lê o
+    domínio (lojas, id_lojas, datas, _hmin, _hmax, colunas) e implementa
+    _tabela/_um (executar), _datas (Data do resultado → DatetimeIndex) e _onde
+    (WHERE do filtro); os trechos de SQL que mudam de dialeto são atributos.
+    """
+
+    # Dia da semana (segunda = 0) e células (loja, dia, hora) com registro num GROUP BY Loja, dia da semana, Hora
+    _DOW = "isodow(Data) - 1"
+    _CELULAS = "count(DISTINCT Data)"
+    # Fluxo LOJA/DIA da base inteira, e as células de uma faixa de lojas (zero prolongado)
+    _SQL_DIARIO = "SELECT Loja, Data, sum(Fluxo) FROM fluxo GROUP BY Loja, Data"
+    _SQL_LOTE = "SELECT Loja, Data, Hora, sum(Fluxo) FROM fluxo WHERE Loja BETWEEN ? AND ? GROUP BY Loja, Data, Hora"
+
+    def _tabela(self, sql, params, nomes):
+        """Resultado da consulta como {nome: coluna}."""
+        raise NotImplementedError
+
+    def _um(self, sql, params=()):
+        raise NotImplementedError
+
+    def _datas(self, col):
+        """Coluna Data de um resultado → DatetimeIndex (ns), como no ESQUEMA."""
+        raise NotImplementedError
+
+    def _onde(self, inicio, fim, lojas_sel, horas, texto=""):
+        """(cláusula WHERE, parâmetros) do filtro — a mesma seleção de recortar/filtrar_linhas."""
+        raise NotImplementedError
+
+    def _por_dia(self, campos, inicio, fim, lojas_sel, horas):
+        """(SELECT campos, sum(Fluxo) ... WHERE filtro, parâmetros) de uma agregação por dia ou loja."""
+        onde, params = self._onde(inicio, fim, lojas_sel, horas)
+        return f"SELECT {campos}, sum(Fluxo) FROM fluxo WHERE {onde}", params
+
+    # ---------- Filtro ----------
+    def dominio(self):
+        """(primeiro dia, último dia, lojas, hora mínima, hora máxima); None se a base estiver vazia."""
+        if not len(self.datas):
+            return None
+        return self.datas[0], self.datas[-1], self.lojas.tolist(), int(self._hmin), int(self._hmax)
+
+    def _eixos(self, inicio, fim, lojas_sel, horas):
+        """Lojas (índices na base), dias e horas do recorte — os eixos que recortar daria."""
+        il = self.lojas.get_indexer(lojas_sel)
+        il = np.sort(il[il >= 0])
+        d0 = max(0, (pd.Timestamp(inicio) - self.datas[0]).days)
+        d1 = max(d0, min(len(self.datas), (pd.Timestamp(fim) - self.datas[0]).days + 1))
+        return il, self.datas[d0:d1], np.arange(24)[horas[0]:horas[1] + 1]
+
+    def _dias(self, col, datas):
+        """Posição de cada Data do resultado no eixo `datas`."""
+        return (self._datas(col) - datas[0]).days.to_numpy()
+
+    # ---------- Agregações do filtro ----------
+    def serie_diaria(self, inicio, fim, lojas_sel, horas):
+        consulta, params = self._por_dia("Data", inicio, fim, lojas_sel, horas)
+        t = self._tabela(f"{consulta} GROUP BY Data ORDER BY Data", params, ["Data", "Fluxo"])
+        return pd.DataFrame({"Data": self._datas(t["Data"]), "Fluxo": _int(t["Fluxo"])})
+
+    def ranking_lojas(self, inicio, fim, lojas_sel, horas):
+        consulta, params = self._por_dia("Loja", inicio, fim, lojas_sel, horas)
+        t = self._tabela(f"{consulta} GROUP BY Loja ORDER BY Loja", params, ["Loja", "Fluxo"])
+        il = self.lojas.get_indexer(t["Loja"])
+        t = pd.DataFrame({"Loja": self.lojas[il], "ID_Loja": self.id_lojas[il], "Fluxo": _int(t["Fluxo"])})
+        return t.sort_values("Fluxo", ascending=False, kind="stable").reset_index(drop=True)
+
+    def heatmap_data_hora(self, inicio, fim, lojas_sel, horas):
+        onde, params = self._onde(inicio, fim, lojas_sel, horas)
+        t = self._tabela(f"SELECT Data, Hora, sum(Fluxo) FROM fluxo WHERE {onde} "
+                         "GROUP BY Data, Hora ORDER BY Data, Hora", params, ["Data", "Hora", "Fluxo"])
+        return pd.DataFrame({"Data": self._datas(t["Data"]), "Hora": _int(t["Hora"]), "Fluxo": _int(t["Fluxo"])})
+
+    def matrizes(self, inicio, fim, lojas_sel, horas):
+        """As Matrizes de comparacao.matrizes(recorte) a partir de dois GROUP BY (Loja × dia da semana × Hora, Loja × Data)."""
+        il, datas, hs = self._eixos(inicio, fim, lojas_sel, horas)
+        lojas = self.lojas[il]
+        n, nd, nh = len(lojas), len(datas), len(hs)
+        semana_hora, tem_semana_hora = np.zeros((n, 7, nh), np.int64), np.zeros((n, 7, nh), bool)
+        dias_hora = np.zeros((n, nh), np.int64)
+        dia, tem_dia = np.zeros((n, nd), np.int64), np.zeros((n, nd), bool)
+        if n and nd and nh:
+            onde, params = self._onde(inicio, fim, lojas_sel, horas)
+            t = self._tabela(f"SELECT Loja, {self._DOW}, Hora, sum(Fluxo), {self._CELULAS} FROM fluxo WHERE {onde} "
+                             f"GROUP BY Loja, {self._DOW}, Hora", params, ["Loja", "dow", "Hora", "Fluxo", "dias"])
+            li, hi, dw = lojas.get_indexer(t["Loja"]), _int(t["Hora"]) - hs[0], _int(t["dow"])
+            semana_hora[li, dw, hi] = _int(t["Fluxo"])
+            tem_semana_hora[li, dw, hi] = True
+            np.add.at(dias_hora, (li, hi), _int(t["dias"]))
+
+            consulta, params = self._por_dia("Loja, Data", inicio, fim, lojas_sel, horas)
+            t = self._tabela(f"{consulta} GROUP BY Loja, Data", params, ["Loja", "Data", "Fluxo"])
+            li, di = lojas.get_indexer(t["Loja"]), self._dias(t["Data"], datas)
+            dia[li, di] = _int(t["Fluxo"])
+            tem_dia[li, di] = True
+        return Matrizes(
+            lojas=lojas,
+            id_lojas=self.id_lojas[il],
+            horas=hs.astype(int),
+            datas=datas,
+            hora=semana_hora.sum(axis=1),
+            dias_hora=dias_hora,
+            dia=dia,
+            tem_dia=tem_dia,
+            semana_hora=semana_hora,
+            tem_semana_hora=tem_semana_hora,
+        )
+
+    # ---------- Base inteira (alertas e zero prolongado) ----------
+    def baseline_alertas(self, janela=7):
+        """Mesmo resultado de alertas.baseline_alertas(cubo, janela), do fluxo LOJA/DIA agregado em SQL."""
+        diario = np.zeros((len(self.lojas), len(self.datas)), np.int64)
+        tem = np.zeros(diario.shape, bool)
+        if len(self.datas):
+            t = self._tabela(self._SQL_DIARIO, (), ["Loja", "Data", "Fluxo"])
+            li, di = self.lojas.get_indexer(t["Loja"]), self._dias(t["Data"], self.datas)
+            diario[li, di] = _int(t["Fluxo"])
+            tem[li, di] = True
+        return tabela_alertas(self.lojas, self.id_lojas, self.datas, diario, tem, media_movel(diario, tem, janela))
+
+    def sequencias_zero(self, minimo=4):
+        """
+        Mesmo resultado de alertas.sequencias_zero(cubo, minimo), montando o cubo
+        denso de LOJAS_POR_LOTE lojas por vez (memória limitada pelo lote, não pela
+        base). Lote contíguo na ordem de Loja: a faixa basta e só lê o trecho do lote.
+        """
+        partes = []
+        forma_dia = (len(self.datas), 24)
+        for ini in range(0, len(self.lojas), LOJAS_POR_LOTE):
+            lojas = self.lojas[ini:ini + LOJAS_POR_LOTE]
+            t = self._tabela(self._SQL_LOTE, (lojas[0], lojas[-1]), ["Loja", "Data", "Hora", "Fluxo"])
+            plano = np.ravel_multi_index(
+                (lojas.get_indexer(t["Loja"]), self._dias(t["Data"], self.datas), _int(t["Hora"])),
+                (len(lojas),) + forma_dia)
+            valores = np.zeros((len(lojas),) + forma_dia, np.int32)
+            presenca = np.zeros(valores.shape, bool)
+            valores.reshape(-1)[plano] = _int(t["Fluxo"])
+            presenca.reshape(-1)[plano] = True
+            cubo = Cubo(valores, presenca, lojas, self.id_lojas[ini:ini + LOJAS_POR_LOTE], self.datas, np.arange(24))
+            partes.append(sequencias_zero(cubo, minimo))
+        seq = pd.concat(partes, ignore_index=True)
+        seq["Loja"] = pd.Categorical(seq["Loja"].astype(object), categories=self.lojas)
+        return seq
+
+    # ---------- Linhas (grid e export) ----------
+    def contar(self, inicio, fim, lojas_sel, horas, texto=""):
+        onde, params = self._onde(inicio, fim, lojas_sel, horas, texto)
+        return int(self._um(f"SELECT count(*) FROM fluxo WHERE {onde}", params)[0])
+
+    def linhas(self, inicio, fim, lojas_sel, horas, coluna="Loja", crescente=True, texto="",
+               limite=None, deslocamento=0):
+        """
+        Linhas do filtro em ordem de `coluna` (empates na ordem Loja, Data, Hora,
+        como a ordenação estável de tabela.ordem_grid); com `limite`, só uma página.
+        """
+        if coluna not in self.colunas:
+            raise ValueError(f"coluna desconhecida: {coluna}")
+        onde, params = self._onde(inicio, fim, lojas_sel, horas, texto)
+        ordem = f"{coluna} {'ASC' if crescente else 'DESC'}, Loja, Data, Hora"
+        pagina = "" if limite is None else f" LIMIT {int(limite)} OFFSET {int(deslocamento)}"
+        t = pd.DataFrame(self._tabela(f"SELECT {', '.join(self.colunas)} FROM fluxo WHERE {onde} "
+                                      f"ORDER BY {ordem}{pagina}", params, self.colunas))
+        return t.assign(Data=self._datas(t["Data"]), Hora=_int(t["Hora"]), Fluxo=_int(t["Fluxo"]))
+
+    def pagina(self, inicio, fim, lojas_sel, horas, coluna, crescente, texto, tamanho, numero):
+        """Como tabela.pagina: (linhas da página `numero`, 1-based, e a posição da primeira)."""
+        ini = (numero - 1) * tamanho
+        return self.linhas(inicio, fim, lojas_sel, horas, coluna, crescente, texto, tamanho, ini), ini
+
+
+class BaseDuckDB(Consulta):
+    """
+    Fonte registrada num DuckDB em processo. A conexão é compartilhada pelas
+    sessões; cada consulta abre o seu cursor, então as seções podem consultar
+    em paralelo (modo paralelo do app).
+    """
+
+    def __init__(self, fonte):
+        if duckdb is None:
+            raise ingest.ErroIngestao("O backend DuckDB precisa do pacote duckdb (pip install duckdb).")
+        caminhos = arquivos(fonte)
+        if not caminhos:
+            raise ingest.ErroIngestao(f"Nenhum arquivo .parquet/.csv em {fonte}")
+        tipos = {os.path.splitext(c)[1].lower() for c in caminhos}
+        if len(tipos) > 1:
+            raise ingest.ErroIngestao(f"{fonte}: misture só arquivos .parquet ou só .csv")
+        self.fonte = fonte
+        self.chave = f"duckdb-{assinatura(fonte)}"
+        temporarios = os.path.join(ingest.CACHE_DIR, "duckdb_tmp")
+        os.makedirs(temporarios, exist_ok=True)
+        self._con = duckdb.connect(config={"memory_limit": MEMORIA, "temp_directory": temporarios})
+        try:
+            if tipos == {".csv"}:
+                caminhos = [self._converter_csv(caminhos)]
+            self._registrar(caminhos)
+            self._ler_dominio()
+        except duckdb.Error as e:
+            raise ingest.ErroIngestao(f"{os.path.basename(fonte)}: {e}") from e
+
+    # ---------- Registro ----------
+    def _colunas(self, leitor):
+        with self._con.cursor() as c:
+            colunas = [r[0] for r in c.execute(f"DESCRIBE SELECT * FROM {leitor}").fetchall()]
+        faltam = ingest.OBRIGATORIAS - set(colunas)
+        if faltam:
+            raise ingest.ErroIngestao(f"{os.path.basename(self.fonte)}: faltam as colunas {sorted(faltam)}")
+        return [c for c in ingest.COLUNAS if c in colunas]
+
+    def _select(self, leitor, expr):
+        colunas = self._colunas(leitor)
+        lista = ", ".join(f"{expr[c]} AS {c}" for c in colunas)
+        # Linhas sem Data ou com Hora fora de 0–23 são descartadas, como em ingest.compactar
+        return colunas, f"SELECT * FROM (SELECT {lista} FROM {leitor}) WHERE Data IS NOT NULL AND Hora BETWEEN 0 AND 23"
+
+    def _converter_csv(self, caminhos):
+        """CSV → Parquet em CACHE_DIR (uma vez por assinatura), com as coerções de ingest."""
+        destino = os.path.join(ingest.CACHE_DIR, f"{self.chave}-v{ingest.CACHE_VERSAO}.parquet")
+        if os.path.exists(destino):
+            return destino
+        _, consulta = self._select(f"read_csv({_lista_sql(caminhos)}, header=true, all_varchar=true)", _EXPR_CSV)
+        tmp = f"{destino}.{os.getpid()}.tmp"
+        try:
+            with self._con.cursor() as c:
+                c.execute(f"COPY ({consulta} ORDER BY Loja, Data, Hora) TO {_texto_sql(tmp)} (FORMAT PARQUET)")
+            os.replace(tmp, destino)
+        except BaseException:
+            # Conversão interrompida não deixa Parquet pela metade no cache
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        # Conversões de versões antigas da mesma fonte saem do cache
+        for antiga in ingest.registrar_versao(os.path.abspath(self.fonte), self.chave):
+            try:
+                os.remove(os.path.join(ingest.CACHE_DIR, f"{antiga}-v{ingest.CACHE_VERSAO}.parquet"))
+            except OSError:
+                pass
+        return destino
+
+    def _registrar(self, caminhos):
+        self.colunas, consulta = self._select(f"read_parquet({_lista_sql(caminhos)})", _EXPR_PARQUET)
+        self._con.execute(f"CREATE OR REPLACE VIEW fluxo AS {consulta}")
+
+    def _ler_dominio(self):
+        ini, fim, self._hmin, self._hmax = self._um("SELECT min(Data), max(Data), min(Hora), max(Hora) FROM fluxo")
+        # ID_Loja da primeira linha (Data, Hora) da loja, como montar_cubo
+        t = self._tabela("SELECT Loja, arg_min(ID_Loja, date_diff('day', DATE '1970-01-01', Data) * 24 + Hora) "
+                         "FROM fluxo GROUP BY Loja ORDER BY Loja", (), ["Loja", "ID_Loja"])
+        self.lojas = pd.Index(t["Loja"].to_numpy(dtype=object), dtype=object)
+        self.id_lojas = t["ID_Loja"].astype(str).to_numpy(dtype=object)
+        self.datas = pd.DatetimeIndex([]) if ini is None else pd.date_range(ini, fim, freq="D")
+
+    # ---------- Execução ----------
+    def _tabela(self, sql, params, nomes):
+        with self._con.cursor() as c:
+            t = c.execute(sql, list(params)).df()
+        t.columns = nomes
+        return t
+
+    def _um(self, sql, params=()):
+        with self._con.cursor() as c:
+            return c.execute(sql, list(params)).fetchone()
+
+    def _datas(self, col):
+        return pd.DatetimeIndex(col).astype("datetime64[ns]")
+
+    # ---------- Filtro ----------
+    def _onde(self, inicio, fim, lojas_sel, horas, texto=""):
+        cond = ["Data BETWEEN ? AND ?", "Hora BETWEEN ? AND ?"]
+        params = [pd.Timestamp(inicio).date(), pd.Timestamp(fim).date(), int(horas[0]), int(horas[1])]
+        il = self.lojas.get_indexer(pd.unique(np.asarray(lojas_sel, dtype=object)))
+        il = np.sort(il[il >= 0])
+        if not len(il):
+            cond.append("FALSE")
+        elif len(il) < len(self.lojas):
+            # A faixa (primeira, última) é o que o Parquet consegue usar para pular row groups
+            cond.append("Loja BETWEEN ? AND ? AND Loja IN (SELECT UNNEST(?))")
+            params += [self.lojas[il[0]], self.lojas[il[-1]], self.lojas[il].tolist()]
+        if texto:
+            cond.append("(contains(lower(Loja), ?) OR contains(lower(ID_Loja), ?))")
+            params += [texto.lower(), texto.lower()]
+        return " AND ".join(cond), params
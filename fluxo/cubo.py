@@ -0,0 +1,125 @@
+"""
+Cubo denso Loja × Data × Hora e as agregações do dashboard sobre ele.
+
+As views (série diária, ranking, heatmap, Loja × Hora, Loja × Data) saem de
+fatias + somas por eixo do cubo, sem groupby sobre as linhas filtradas.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class Cubo:
+    """
+    Fluxo denso (n_lojas, n_dias, 24) + mapas de índice.
+    `presenca` marca as células que têm registro na fonte — as agregações só
+    consideram essas células, como os groupby sobre as linhas faziam.
+    """
+    valores: np.ndarray        # int32 (lojas, dias, horas)
+    presenca: np.ndarray       # bool  (lojas, dias, horas)
+    lojas: pd.Index            # rótulo de cada linha do eixo 0
+    id_lojas: np.ndarray       # ID_Loja de cada loja
+    datas: pd.DatetimeIndex    # dias contíguos (eixo 1)
+    horas: np.ndarray          # horas do eixo 2
+
+
+def montar_cubo(df):
+    """Constrói o cubo a partir do DataFrame no ESQUEMA compacto (uma passada, sem groupby)."""
+    lojas = df["Loja"].cat.categories
+    datas = pd.date_range(df["Data"].min(), df["Data"].max(), freq="D")
+    li = df["Loja"].cat.codes.to_numpy(np.int64)
+    di = (df["Data"].to_numpy() - datas[0].to_datetime64()) // np.timedelta64(1, "D")
+    hi = df["Hora"].to_numpy(np.int64)
+
+    forma = (len(lojas), len(datas), 24)
+    plano = np.ravel_multi_index((li, di, hi), forma)
+    valores = np.zeros(forma, dtype=np.int32)
+    np.add.at(valores.reshape(-1), plano, df["Fluxo"].to_numpy())
+    presenca = np.zeros(forma, dtype=bool)
+    presenca.reshape(-1)[plano] = True
+
+    id_lojas = df["ID_Loja"].astype(str).groupby(df["Loja"], observed=False).first().reindex(lojas).to_numpy()
+    return Cubo(valores, presenca, lojas, id_lojas, datas, np.arange(24))
+
+
+def recortar(cubo, inicio, fim, lojas_sel, horas):
+    """
+    Sub-cubo do filtro (período, lojas, faixa de horas): fatias contíguas em datas
+    e horas + seleção das linhas das lojas. Custa proporcional ao recorte, não à base.
+    """
+    il = cubo.lojas.get_indexer(lojas_sel)
+    il = np.sort(il[il >= 0])
+    d0 = max(0, (pd.Timestamp(inicio) - cubo.datas[0]).days)
+    d1 = max(d0, min(len(cubo.datas), (pd.Timestamp(fim) - cubo.datas[0]).days + 1))
+    h = slice(horas[0], horas[1] + 1)
+    return Cubo(
+        cubo.valores[il, d0:d1, h],
+        cubo.presenca[il, d0:d1, h],
+        cubo.lojas[il],
+        cubo.id_lojas[il],
+        cubo.datas[d0:d1],
+        cubo.horas[h],
+    )
+
+
+def linhas_lojas(rec, lojas=None):
+    """Índices (no recorte) das lojas pedidas; todas se lojas=None."""
+    if lojas is None:
+        return np.arange(len(rec.lojas))
+    il = rec.lojas.get_indexer(lojas)
+    return np.sort(il[il >= 0])
+
+
+def serie_diaria(rec):
+    """Soma por Data (dias com registro no recorte)."""
+    tem = rec.presenca.any(axis=(0, 2))
+    soma = rec.valores.sum(axis=(0, 2))
+    return pd.DataFrame({"Data": rec.datas[tem], "Fluxo": soma[tem]})
+
+
+def kpis(daily):
+    """Indicadores do topo (da série diária): soma, média por dia, nº de dias e o dia de pico (ou None)."""
+    pico = daily.nlargest(1, "Fluxo")
+    return {
+        "total": int(daily["Fluxo"].sum()),
+        "media_dia": daily["Fluxo"].mean() if not daily.empty else 0,
+        "dias": len(daily),
+        "pico": None if pico.empty else (pico.iloc[0]["Data"], int(pico.iloc[0]["Fluxo"])),
+    }
+
+
+def ranking_lojas(rec):
+    """Soma por loja, do maior para o menor."""
+    tem = rec.presenca.any(axis=(1, 2))
+    soma = rec.valores.sum(axis=(1, 2))
+    t = pd.DataFrame({"Loja": rec.lojas[tem], "ID_Loja": rec.id_lojas[tem], "Fluxo": soma[tem]})
+    return t.sort_values("Fluxo", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def heatmap_data_hora(rec):
+    """Soma por Data × Hora (formato longo, para o Altair)."""
+    tem = rec.presenca.any(axis=0)
+    soma = rec.valores.sum(axis=0)
+    di, hi = np.nonzero(tem)
+    return pd.DataFrame({"Data": rec.datas[di], "Hora": rec.horas[hi], "Fluxo": soma[di, hi]})
+
+
+def soma_loja_hora(rec, lojas=None):
+    """
+    Soma no período por Loja × Hora, com o nº de dias com registro (n_dias) e a
+    média diária da hora na loja (baseline_hora = soma / n_dias).
+    """
+    il = linhas_lojas(rec, lojas)
+    soma = rec.valores[il].sum(axis=1)
+    n_dias = rec.presenca[il].sum(axis=1)
+    li, hi = np.nonzero(n_dias)
+    return pd.DataFrame({
+        "Loja": rec.lojas[il][li],
+        "ID_Loja": rec.id_lojas[il][li],
+        "Hora": rec.horas[hi],
+        "Fluxo": soma[li, hi],
+        "baseline_hora": soma[li, hi] / n_dias[li, hi],
+        "n_dias": n_dias[li, hi],
+    })
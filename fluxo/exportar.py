@@ -0,0 +1,30 @@
+"""Serialização dos exports (CSV, CSV gzip, Parquet) — usada pelo app e pelo lote."""
+import io
+import gzip
+
+FORMATOS_EXPORT = {
+    "CSV": (".csv", "text/csv"),
+    "CSV (gzip)": (".csv.gz", "application/gzip"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+
+
+def blocos_csv(df, linhas_por_bloco=100_000):
+    """Gera o CSV em blocos de bytes (cabeçalho só no primeiro) — nunca uma string gigante."""
+    for ini in range(0, max(len(df), 1), linhas_por_bloco):
+        yield df.iloc[ini:ini + linhas_por_bloco].to_csv(index=False, header=(ini == 0)).encode("utf-8")
+
+
+def gerar_export(df, formato="CSV"):
+    """Conteúdo do arquivo de export no formato pedido (CSV, CSV gzip ou Parquet)."""
+    buf = io.BytesIO()
+    if formato == "Parquet":
+        df.to_parquet(buf, index=False)
+    elif formato == "CSV (gzip)":
+        with gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=6) as gz:
+            for bloco in blocos_csv(df):
+                gz.write(bloco)
+    else:
+        for bloco in blocos_csv(df):
+            buf.write(bloco)
+    return buf.getvalue()
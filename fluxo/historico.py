@@ -0,0 +1,239 @@
+"""
+Histórico em SQLite: as bases carregadas são gravadas (upsert por Loja, Data,
+Hora) num arquivo local que acumula as exportações, e o dashboard consulta o
+histórico por faixas do índice — reabrir o app lê só as páginas do filtro, não
+o histórico inteiro.
+
+Tabelas:
+    fluxo   linhas horárias; chave primária (Loja, Data, Hora) numa tabela
+            WITHOUT ROWID: as linhas de uma loja num período ficam contíguas
+    diario  fluxo por (Loja, Data), somado na gravação — série, ranking, matrizes
+            e alertas sem filtro de horas leem só esta tabela (~24x menor)
+    lojas   ID_Loja (da primeira célula, como montar_cubo) e faixa de horas
+    cargas  fontes já gravadas (chave de conteúdo de ingest): regravar é no-op
+
+Data é guardada como dias desde 1970-01-01. As consultas são as de
+consulta.Consulta (as mesmas do backend DuckDB): o app usa qualquer um dos dois.
+"""
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from fluxo import ingest
+from fluxo.consulta import Consulta
+
+# Linhas convertidas para objetos Python por vez na gravação (memória limitada pelo lote)
+LINHAS_POR_GRAVACAO = 100_000
+EPOCA = np.datetime64("1970-01-01", "D")
+
+_TABELAS = """
+CREATE TABLE IF NOT EXISTS fluxo (
+    Loja TEXT NOT NULL, Data INTEGER NOT NULL, Hora INTEGER NOT NULL,
+    Company TEXT, ID_Loja TEXT, Fluxo INTEGER NOT NULL,
+    PRIMARY KEY (Loja, Data, Hora)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS diario (
+    Loja TEXT NOT NULL, Data INTEGER NOT NULL, Fluxo INTEGER NOT NULL,
+    PRIMARY KEY (Loja, Data)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS diario_data ON diario (Data);
+CREATE TABLE IF NOT EXISTS lojas (
+    Loja TEXT PRIMARY KEY, ID_Loja TEXT, HoraMin INTEGER, HoraMax INTEGER
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS cargas (
+    id INTEGER PRIMARY KEY, chave TEXT UNIQUE, linhas INTEGER, quando TEXT
+);
+"""
+
+# A linha nova substitui a gravada na mesma célula (como ingest.anexar)
+_UPSERT_FLUXO = """
+INSERT INTO fluxo (Loja, Data, Hora, Company, ID_Loja, Fluxo) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (Loja, Data, Hora) DO UPDATE SET
+    Company = excluded.Company, ID_Loja = excluded.ID_Loja, Fluxo = excluded.Fluxo
+"""
+_UPSERT_DIARIO = """
+INSERT INTO diario (Loja, Data, Fluxo)
+SELECT f.Loja, f.Data, sum(f.Fluxo) FROM tocados t JOIN fluxo f ON f.Loja = t.Loja AND f.Data = t.Data
+WHERE true GROUP BY f.Loja, f.Data
+ON CONFLICT (Loja, Data) DO UPDATE SET Fluxo = excluded.Fluxo
+"""
+_UPSERT_LOJA = """
+INSERT INTO lojas (Loja, ID_Loja, HoraMin, HoraMax)
+SELECT :loja, ID_Loja, :hmin, :hmax FROM fluxo WHERE Loja = :loja ORDER BY Data, Hora LIMIT 1
+ON CONFLICT (Loja) DO UPDATE SET ID_Loja = excluded.ID_Loja,
+    HoraMin = min(HoraMin, excluded.HoraMin), HoraMax = max(HoraMax, excluded.HoraMax)
+"""
+
+
+def _dias(datas):
+    """datetime64 → dias desde 1970-01-01 (int64)."""
+    return (np.asarray(datas, dtype="datetime64[D]") - EPOCA).astype(np.int64)
+
+
+def _datas(dias):
+    """Dias desde 1970-01-01 → DatetimeIndex (ns), como no ESQUEMA."""
+    return pd.DatetimeIndex((EPOCA + np.asarray(dias, dtype=np.int64)).astype("datetime64[ns]"))
+
+
+def _texto(col):
+    """Coluna de rótulos como objetos str (None onde falta)."""
+    col = col.astype(object)
+    return col.where(col.notna(), None).to_numpy()
+
+
+class Historico(Consulta):
+    """
+    Arquivo SQLite aberto com uma conexão por thread (as seções do modo paralelo
+    consultam ao mesmo tempo); WAL deixa as leituras seguirem durante uma gravação.
+    """
+
+    # (Data + 3) % 7: segunda = 0 (1970-01-01 foi quinta). Célula única pela chave: count(*) = dias com registro
+    _DOW = "(Data + 3) % 7"
+    _CELULAS = "count(*)"
+    _SQL_DIARIO = "SELECT Loja, Data, Fluxo FROM diario"
+    # Uma faixa da chave primária por lote
+    _SQL_LOTE = "SELECT Loja, Data, Hora, Fluxo FROM fluxo WHERE Loja BETWEEN ? AND ?"
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.colunas = list(ingest.COLUNAS)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._marca = None
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+            self._con().executescript(_TABELAS)
+            self.atualizar()
+        except sqlite3.Error as e:
+            raise ingest.ErroIngestao(f"{os.path.basename(caminho)}: {e}") from e
+
+    def _con(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.caminho, timeout=60, check_same_thread=False)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            # lower() do SQLite só conhece ASCII; o filtro de texto usa o do Python, como tabela.ordem_grid
+            con.create_function("minusculas", 1, lambda s: None if s is None else str(s).lower(), deterministic=True)
+            self._local.con = con
+        return con
+
+    def _todas(self, sql, params=()):
+        return self._con().execute(sql, params).fetchall()
+
+    def _um(self, sql, params=()):
+        return self._con().execute(sql, params).fetchone()
+
+    def _tabela(self, sql, params, nomes):
+        """Resultado da consulta como {nome: array} (colunas vazias se não houver linhas)."""
+        linhas = self._todas(sql, params)
+        return dict(zip(nomes, map(np.asarray, zip(*linhas)))) if linhas else {n: np.empty(0, object) for n in nomes}
+
+    def _datas(self, col):
+        return _datas(col)
+
+    # ---------- Gravação ----------
+    def gravada(self, chave):
+        """True se a fonte com esta chave de conteúdo já está no histórico."""
+        return self._um("SELECT 1 FROM cargas WHERE chave = ?", (chave,)) is not None
+
+    def gravar(self, df, chave=None):
+        """
+        Upsert das linhas de df (ESQUEMA compacto) por (Loja, Data, Hora), numa só
+        transação; o diário e as lojas são refeitos só nos (loja, dia) tocados.
+        Com `chave`, uma fonte já gravada não é regravada. Devolve as linhas gravadas.
+        """
+        n = len(df)
+        try:
+            with self._lock, self._con() as con:
+                if chave is not None and self.gravada(chave):
+                    return 0
+                con.execute("CREATE TEMP TABLE IF NOT EXISTS tocados "
+                            "(Loja TEXT, Data INTEGER, PRIMARY KEY (Loja, Data)) WITHOUT ROWID")
+                con.execute("DELETE FROM tocados")
+                for ini in range(0, n, LINHAS_POR_GRAVACAO):
+                    self._gravar_lote(con, df.iloc[ini:ini + LINHAS_POR_GRAVACAO])
+                con.execute(_UPSERT_DIARIO)
+                if n:
+                    horas = df["Hora"].astype(np.int64).groupby(df["Loja"], observed=True).agg(["min", "max"])
+                    con.executemany(_UPSERT_LOJA, ({"loja": str(l), "hmin": int(a), "hmax": int(b)}
+                                                   for l, a, b in horas.itertuples()))
+                # OR IGNORE: outro processo pode ter gravado a mesma fonte ao mesmo tempo (upsert idempotente)
+                con.execute("INSERT OR IGNORE INTO cargas (chave, linhas, quando) VALUES (?, ?, ?)",
+                            (chave, n, datetime.now().isoformat(timespec="seconds")))
+        except sqlite3.Error as e:
+            raise ingest.ErroIngestao(f"{os.path.basename(self.caminho)}: {e}") from e
+        self.atualizar()
+        return n
+
+    @staticmethod
+    def _gravar_lote(con, lote):
+        """Upsert de um lote de linhas e registro dos (loja, dia) tocados."""
+        dias = _dias(lote["Data"].to_numpy())
+        loja = _texto(lote["Loja"])
+        company = _texto(lote["Company"]) if "Company" in lote.columns else [None] * len(lote)
+        # astype(str) como montar_cubo: o ID_Loja lido de volta é o mesmo do cubo
+        id_loja = lote["ID_Loja"].astype(str).to_numpy(dtype=object)
+        con.executemany(_UPSERT_FLUXO, zip(loja, dias.tolist(), lote["Hora"].to_numpy(np.int64).tolist(),
+                                           company, id_loja, lote["Fluxo"].to_numpy(np.int64).tolist()))
+        pares = pd.DataFrame({"Loja": loja, "Data": dias}).drop_duplicates()
+        con.executemany("INSERT OR IGNORE INTO tocados VALUES (?, ?)", zip(pares["Loja"], pares["Data"].tolist()))
+
+    # ---------- Domínio ----------
+    def atualizar(self):
+        """Relê o domínio se houve gravação desde a última leitura (inclusive de outro processo)."""
+        marca = tuple(self._um("SELECT count(*), coalesce(max(id), 0) FROM cargas"))
+        if marca != self._marca:
+            self._ler_dominio()
+            self._marca = marca
+        return self
+
+    @property
+    def chave(self):
+        """Identifica o conteúdo (muda a cada gravação) — chave dos caches derivados."""
+        return f"sqlite-{ingest.digest(os.path.abspath(self.caminho).encode())}-{self._marca[1]}"
+
+    def _ler_dominio(self):
+        lojas = self._todas("SELECT Loja, ID_Loja, HoraMin, HoraMax FROM lojas ORDER BY Loja")
+        self.lojas = pd.Index([r[0] for r in lojas], dtype=object)
+        self.id_lojas = np.array([r[1] for r in lojas], dtype=object)
+        self._hmin = min((r[2] for r in lojas), default=0)
+        self._hmax = max((r[3] for r in lojas), default=23)
+        # min/max pelo índice diario_data: dois acessos, sem varrer a tabela
+        ini, fim = self._um("SELECT (SELECT min(Data) FROM diario), (SELECT max(Data) FROM diario)")
+        self.datas = pd.DatetimeIndex([]) if ini is None else pd.date_range(*_datas([ini, fim]), freq="D")
+
+    # ---------- Filtro ----------
+    def _onde(self, inicio, fim, lojas_sel, horas=None, texto=""):
+        """
+        (cláusula WHERE, parâmetros) do filtro. As lojas vão sempre como lista: o
+        SQLite percorre a chave (Loja, Data, ...) uma faixa de dias por loja.
+        horas=None: sem condição de hora (consultas ao diário).
+        """
+        il = self.lojas.get_indexer(pd.unique(np.asarray(lojas_sel, dtype=object)))
+        il = np.sort(il[il >= 0])
+        cond = ["Loja IN (SELECT value FROM json_each(?))", "Data BETWEEN ? AND ?"]
+        params = [json.dumps(self.lojas[il].tolist()), *_dias([pd.Timestamp(inicio), pd.Timestamp(fim)]).tolist()]
+        if horas is not None:
+            cond.append("Hora BETWEEN ? AND ?")
+            params += [int(horas[0]), int(horas[1])]
+        if texto:
+            cond.append("(instr(minusculas(Loja), ?) > 0 OR instr(minusculas(ID_Loja), ?) > 0)")
+            params += [texto.lower(), texto.lower()]
+        return " AND ".join(cond), params
+
+    def _so_dias(self, horas):
+        """True se a faixa de horas não exclui nenhuma hora gravada: o diário responde."""
+        return horas[0] <= self._hmin and horas[1] >= self._hmax
+
+    def _por_dia(self, campos, inicio, fim, lojas_sel, horas):
+        """(FROM ... WHERE ..., parâmetros) na tabela diária quando possível, senão nas linhas."""
+        if self._so_dias(horas):
+            onde, params = self._onde(inicio, fim, lojas_sel)
+            return f"SELECT {campos}, sum(Fluxo) FROM diario WHERE {onde}", params
+        return super()._por_dia(campos, inicio, fim, lojas_sel, horas)
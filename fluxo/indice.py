@@ -0,0 +1,57 @@
+"""
+Índice de linhas por loja e dia.
+
+Com as linhas em ordem (Loja, Data, Hora) — como ingest.ordenar deixa a base —,
+as linhas de uma loja num intervalo de dias são uma faixa contígua. O índice
+guarda o início de cada faixa (loja, dia); selecionar k lojas custa O(k + linhas
+selecionadas), não uma máscara sobre a tabela inteira.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class IndiceLinhas:
+    lojas: pd.Index            # categorias de Loja (ordem dos códigos)
+    datas: pd.DatetimeIndex    # dias contíguos do primeiro ao último
+    offsets: np.ndarray        # (lojas × dias + 1): 1ª linha com (loja, dia) ≥ (l, d)
+
+    def posicoes(self, inicio, fim, lojas_sel):
+        """Posições (crescentes) das linhas das lojas pedidas entre inicio e fim (inclusive)."""
+        n_dias = len(self.datas)
+        il = self.lojas.get_indexer(pd.unique(np.asarray(lojas_sel, dtype=object)))
+        il = np.sort(il[il >= 0]).astype(np.int64)
+        if not n_dias or not len(il):
+            return np.empty(0, dtype=np.int64)
+        d0 = min(n_dias, max(0, (pd.Timestamp(inicio) - self.datas[0]).days))
+        d1 = min(n_dias, max(d0, (pd.Timestamp(fim) - self.datas[0]).days + 1))
+        a = self.offsets[il * n_dias + d0]
+        b = self.offsets[il * n_dias + d1]
+        return faixas(a, b)
+
+
+def faixas(a, b):
+    """Concatena os intervalos [a[i], b[i]) num só array, sem loop em Python."""
+    n = b - a
+    total = int(n.sum())
+    if not total:
+        return np.empty(0, dtype=np.int64)
+    # Cada posição = início da sua faixa + deslocamento dentro dela
+    inicio_saida = np.cumsum(n) - n
+    return np.arange(total, dtype=np.int64) + np.repeat(a - inicio_saida, n)
+
+
+def indexar(df):
+    """Índice de um DataFrame com Loja (category) e Data, ordenado por (Loja, Data)."""
+    lojas = df["Loja"].cat.categories
+    if df.empty:
+        return IndiceLinhas(lojas, pd.DatetimeIndex([]), np.zeros(1, dtype=np.int64))
+    datas = pd.date_range(df["Data"].min(), df["Data"].max(), freq="D")
+    dias = (df["Data"].to_numpy() - datas[0].to_datetime64()) // np.timedelta64(1, "D")
+    chave = df["Loja"].cat.codes.to_numpy(np.int64) * len(datas) + dias
+    if np.any(chave[1:] < chave[:-1]):
+        raise ValueError("linhas fora da ordem (Loja, Data): use ingest.ordenar antes de indexar")
+    offsets = np.searchsorted(chave, np.arange(len(lojas) * len(datas) + 1))
+    return IndiceLinhas(lojas, datas, offsets)
@@ -0,0 +1,446 @@
+"""
+Ingestão das fontes de fluxo (CSV limpo, Excel, diretórios e vários arquivos).
+
+Todas as fontes terminam no ESQUEMA compacto e são convertidas uma única vez
+para Parquet em CACHE_DIR (chave = hash do conteúdo). Diretórios mantêm um
+manifesto dos arquivos já ingeridos: um reload só faz o parsing dos novos.
+"""
+import io
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+import openpyxl
+from pandas.api.types import union_categoricals
+
+CSV_LIMPO = "fluxo_seed_limpo.csv"
+EXCEL_LOCAL = "Fluxo SEED 30d.xlsx"
+ABA_EXCEL = "Fluxo seed 30d"
+COLUNAS = ["Company", "Loja", "ID_Loja", "Data", "Hora", "Fluxo"]
+EXTENSOES = {".csv": "csv", ".xlsx": "excel", ".xlsm": "excel"}
+OBRIGATORIAS = {"Loja", "ID_Loja", "Data", "Hora", "Fluxo"}
+
+# Esquema compacto em memória — todas as seções do app trabalham sobre ele.
+# Lojas como category (códigos int + rótulos), Hora int8, Fluxo int32, Data por dia.
+ESQUEMA = {
+    "Company": "category",
+    "Loja": "category",
+    "ID_Loja": "category",
+    "Data": "datetime64[ns]",
+    "Hora": "int8",
+    "Fluxo": "int32",
+}
+
+# Cache colunar persistente (Parquet) — sobrevive a reinícios do servidor.
+# Incremente CACHE_VERSAO sempre que o parsing/tipos mudarem (invalida os arquivos antigos).
+CACHE_DIR = os.environ.get("FLUXO_CACHE_DIR", ".fluxo_cache")
+CACHE_VERSAO = 4
+# Versões (chaves de conteúdo) mantidas em disco por fonte; as mais antigas são apagadas
+VERSOES_POR_FONTE = int(os.environ.get("FLUXO_VERSOES_CACHE", "2"))
+
+
+class ErroIngestao(ValueError):
+    """Fonte sem o cabeçalho/colunas esperados."""
+
+
+# ---------- Cache em disco ----------
+def digest(dados: bytes) -> str:
+    return hashlib.blake2b(dados, digest_size=16).hexdigest()
+
+
+def ler_json(caminho):
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def gravar_atomico(caminho, escrever):
+    """Grava via arquivo temporário + os.replace (leitores nunca veem arquivo pela metade)."""
+    os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+    tmp = f"{caminho}.{os.getpid()}.tmp"
+    try:
+        escrever(tmp)
+        os.replace(tmp, caminho)
+    except OSError:
+        # Cache é best-effort: disco cheio/somente leitura não pode derrubar o app
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def gravar_json(caminho, obj):
+    def escrever(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(obj, f)
+
+    gravar_atomico(caminho, escrever)
+
+
+def registrar_versao(fonte, chave):
+    """
+    Marca `chave` como a versão mais recente de `fonte` (caminho ou identificador)
+    e devolve as chaves que saíram das VERSOES_POR_FONTE mais recentes — o chamador
+    apaga os arquivos delas. Chaves ainda usadas por outra fonte não são devolvidas.
+    """
+    caminho = os.path.join(CACHE_DIR, "versoes.json")
+    versoes = ler_json(caminho)
+    lista = [c for c in versoes.get(fonte, []) if c != chave] + [chave]
+    if versoes.get(fonte) == lista[-VERSOES_POR_FONTE:]:
+        return []
+    versoes[fonte] = lista[-VERSOES_POR_FONTE:]
+    gravar_json(caminho, versoes)
+    em_uso = {c for chaves in versoes.values() for c in chaves}
+    return [c for c in lista[:-VERSOES_POR_FONTE] if c not in em_uso]
+
+
+def digest_arquivo(caminho):
+    """Hash do conteúdo de um arquivo local, memorizado em disco por (caminho, tamanho, mtime)."""
+    info = os.stat(caminho)
+    assinatura = f"{os.path.abspath(caminho)}|{info.st_size}|{info.st_mtime_ns}"
+    indice_path = os.path.join(CACHE_DIR, "indice.json")
+    indice = ler_json(indice_path)
+    if assinatura in indice:
+        return indice[assinatura]
+
+    h = hashlib.blake2b(digest_size=16)
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloco)
+    indice[assinatura] = h.hexdigest()
+    gravar_json(indice_path, indice)
+    return indice[assinatura]
+
+
+def chave_fonte(tipo, conteudo):
+    return f"{tipo}-{conteudo}-v{CACHE_VERSAO}"
+
+
+def chave_conjunto(tipo, digests):
+    """Chave de um conjunto ordenado de arquivos (muda se qualquer arquivo mudar)."""
+    return chave_fonte(tipo, digest("|".join(digests).encode("ascii")))
+
+
+def ler_parquet(chave):
+    caminho = os.path.join(CACHE_DIR, f"{chave}.parquet")
+    if not os.path.exists(caminho):
+        return None
+    try:
+        return pd.read_parquet(caminho)
+    except Exception:
+        # Arquivo corrompido/incompatível: ignora e reconstrói a partir da fonte
+        return None
+
+
+def gravar_parquet(chave, df):
+    if df.empty:
+        return
+    gravar_atomico(os.path.join(CACHE_DIR, f"{chave}.parquet"), lambda tmp: df.to_parquet(tmp, index=False))
+
+
+# ---------- Parsing ----------
+def ler_fonte(tipo, origem):
+    """
+    Parsing propriamente dito de uma fonte: tipo "csv" (CSV limpo) ou Excel
+    ("excel", "excel_enviado", "excel_local"). `origem` é caminho ou arquivo em memória.
+    """
+    try:
+        if tipo == "csv":
+            return compactar(coagir_tipos(pd.read_csv(origem)))
+        return compactar(ler_excel(origem))
+    except ErroIngestao:
+        raise
+    except Exception as e:
+        # Arquivo corrompido/ilegível (zip inválido, CSV malformado, encoding...): vira erro da fonte
+        raise ErroIngestao(f"arquivo ilegível ({type(e).__name__}: {e})") from e
+
+
+def coagir_tipos(df):
+    """Coerções comuns a todas as fontes."""
+    if "Data" in df.columns:
+        df["Data"] = pd.to_datetime(df["Data"], dayfirst=True, errors="coerce")
+    if "Hora" in df.columns:
+        df["Hora"] = pd.to_numeric(df["Hora"], errors="coerce").astype("Int64")
+    if "Fluxo" in df.columns:
+        df["Fluxo"] = pd.to_numeric(df["Fluxo"], errors="coerce")
+
+    for c in ["Company", "Loja", "ID_Loja"]:
+        if c in df.columns:
+            df[c] = df[c].astype(str).str.strip()
+    return df
+
+
+def compactar(df):
+    """
+    Converte para o ESQUEMA compacto. Linhas sem Data ou com Hora fora de 0–23
+    não passam em nenhum filtro do app e são descartadas; Fluxo vazio conta como 0.
+    Sem as colunas obrigatórias, levanta ErroIngestao.
+    """
+    if not OBRIGATORIAS.issubset(df.columns):
+        raise ErroIngestao(f"faltam as colunas {sorted(OBRIGATORIAS - set(df.columns))}")
+    if df.empty:
+        return df
+
+    validas = df["Data"].notna() & df["Hora"].between(0, 23).fillna(False)
+    df = df.loc[validas, [c for c in ESQUEMA if c in df.columns]].reset_index(drop=True)
+
+    df["Data"] = df["Data"].dt.normalize()
+    df["Hora"] = df["Hora"].astype(ESQUEMA["Hora"])
+    df["Fluxo"] = df["Fluxo"].fillna(0).round().astype(ESQUEMA["Fluxo"])
+    for c in ["Company", "Loja", "ID_Loja"]:
+        if c in df.columns:
+            # category = códigos inteiros + tabela de rótulos (ordenada)
+            df[c] = df[c].astype(ESQUEMA[c])
+    return ordenar(df)
+
+
+def ordenar(df):
+    """Linhas em ordem (Loja, Data, Hora) — pré-requisito do índice por loja/dia (fluxo.indice)."""
+    if df.empty or not {"Loja", "Data", "Hora"}.issubset(df.columns):
+        return df
+    return df.sort_values(["Loja", "Data", "Hora"], kind="stable", ignore_index=True)
+
+
+def ler_excel(origem):
+    """
+    Único caminho de leitura de Excel (enviado ou local), em streaming:
+    - openpyxl em modo read-only (não carrega a planilha inteira);
+    - a busca do cabeçalho para na primeira linha que contém Loja/Data/Fluxo;
+    - só as colunas Company/Loja/ID_Loja/Data/Hora/Fluxo são materializadas.
+    """
+    wb = openpyxl.load_workbook(origem, read_only=True, data_only=True)
+    try:
+        ws = wb[ABA_EXCEL] if ABA_EXCEL in wb.sheetnames else wb.worksheets[0]
+        ws.reset_dimensions()  # exportações às vezes gravam <dimension> errado
+        linhas = ws.iter_rows(values_only=True)
+
+        posicoes = None
+        for linha in linhas:
+            nomes = ["" if x is None else str(x).strip() for x in linha]
+            if {"Loja", "Data", "Fluxo"}.issubset(nomes):
+                # Primeira ocorrência de cada nome (equivale a escolher "Data" e não "Data.1")
+                posicoes = {n: nomes.index(n) for n in COLUNAS if n in nomes}
+                break
+        if posicoes is None:
+            raise ErroIngestao("Não foi possível detectar o cabeçalho no Excel. Envie o CSV limpo ou verifique a planilha.")
+
+        # Extrai só as colunas necessárias (itemgetter roda em C; linhas curtas são completadas)
+        pega = itemgetter(*posicoes.values())
+        largura = max(posicoes.values()) + 1
+        registros = []
+        for linha in linhas:
+            # Após reset_dimensions, uma linha em branco vem como lista vazia (não tupla)
+            linha = tuple(linha)
+            if len(linha) < largura:
+                linha = linha + (None,) * (largura - len(linha))
+            registros.append(pega(linha))
+    finally:
+        wb.close()
+
+    df = pd.DataFrame.from_records(registros, columns=list(posicoes))
+    # Linhas totalmente vazias (rodapés, linhas em branco) saem antes das coerções
+    df = df.dropna(how="all", subset=[c for c in ["Data", "Hora", "Fluxo", "Loja"] if c in df.columns])
+    return coagir_tipos(df)
+
+
+def carregar_fonte(chave, tipo, origem):
+    """Fonte única: Parquet em cache (se existir) ou parsing + gravação do Parquet."""
+    df = ler_parquet(chave)
+    if df is None:
+        df = ler_fonte(tipo, origem)
+        gravar_parquet(chave, df)
+    return df
+
+
+# ---------- Vários arquivos / diretório ----------
+def _ler_arquivo(tarefa):
+    """Tarefa do pool de leitura: (nome, origem, digest) -> (nome, df, erro)."""
+    nome, origem, dig = tarefa
+    tipo = EXTENSOES.get(os.path.splitext(nome)[1].lower(), "excel")
+    if isinstance(origem, bytes):
+        origem = io.BytesIO(origem)
+    try:
+        df = ler_fonte(tipo, origem)
+    except ErroIngestao as e:
+        return nome, pd.DataFrame(), str(e)
+    # Cada arquivo também vira um Parquet próprio, reaproveitado em reconstruções
+    gravar_parquet(chave_fonte("arquivo", dig), df)
+    return nome, df, None
+
+
+def ler_em_paralelo(tarefas, trabalhadores=None):
+    """
+    Lê vários arquivos: os já convertidos saem do Parquet por arquivo; os demais
+    passam pelo parsing em um pool de threads (inline se houver só um). Threads, não
+    processos: sob o Streamlit o ``__main__`` é o próprio app.py (spawn/forkserver
+    reexecutariam o script em cada worker) e o servidor tem threads (fork copiaria
+    locks tomados por elas); a leitura e o parser de CSV do pandas liberam o GIL.
+    """
+    resultado = [None] * len(tarefas)
+    pendentes = []
+    for i, (nome, _, dig) in enumerate(tarefas):
+        df = ler_parquet(chave_fonte("arquivo", dig))
+        if df is None:
+            pendentes.append(i)
+        else:
+            resultado[i] = (nome, df, None)
+
+    if len(pendentes) <= 1 or trabalhadores == 1:
+        lidos = [_ler_arquivo(tarefas[i]) for i in pendentes]
+    else:
+        n = min(len(pendentes), trabalhadores or os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=n, thread_name_prefix="fluxo-leitura") as pool:
+            lidos = list(pool.map(_ler_arquivo, [tarefas[i] for i in pendentes]))
+    for i, r in zip(pendentes, lidos):
+        resultado[i] = r
+    return resultado
+
+
+def concatenar(partes):
+    """Concatena partes no ESQUEMA unindo as categorias (que seguem ordenadas)."""
+    partes = [p for p in partes if p is not None and not p.empty]
+    if not partes:
+        return pd.DataFrame()
+    if len(partes) == 1:
+        return partes[0]
+
+    colunas = [c for c in ESQUEMA if any(c in p.columns for p in partes)]
+    dados = {}
+    for c in colunas:
+        if ESQUEMA[c] == "category":
+            cats = [p[c] if c in p.columns else pd.Categorical([None] * len(p)) for p in partes]
+            dados[c] = union_categoricals(cats, sort_categories=True)
+        else:
+            dados[c] = np.concatenate([p[c].to_numpy() for p in partes])
+    return pd.DataFrame(dados)
+
+
+def _chaves_linha(df):
+    return pd.util.hash_pandas_object(df[["Loja", "Data", "Hora"]], index=False).to_numpy()
+
+
+def anexar(base, novas):
+    """
+    Acrescenta as partes novas (em ordem) à base. Uma linha (Loja, Data, Hora) de um
+    arquivo mais novo substitui a dos anteriores — reexportações não duplicam fluxo.
+    O resultado volta à ordem (Loja, Data, Hora).
+    """
+    novo = None
+    for p in novas:
+        if p.empty:
+            continue
+        novo = p if novo is None else concatenar([novo[~np.isin(_chaves_linha(novo), _chaves_linha(p))], p])
+    if novo is None:
+        return base
+    if base is None or base.empty:
+        return ordenar(novo)
+    return ordenar(concatenar([base[~np.isin(_chaves_linha(base), _chaves_linha(novo))], novo]))
+
+
+def arquivos_diretorio(diretorio):
+    """[(caminho, digest)] dos arquivos suportados do diretório, em ordem de nome."""
+    nomes = sorted(n for n in os.listdir(diretorio) if os.path.splitext(n)[1].lower() in EXTENSOES)
+    caminhos = [os.path.join(diretorio, n) for n in nomes]
+    return [(c, digest_arquivo(c)) for c in caminhos if os.path.isfile(c)]
+
+
+def _manifesto_path(diretorio):
+    return os.path.join(CACHE_DIR, f"manifesto-{digest(os.path.abspath(diretorio).encode('utf-8'))}.json")
+
+
+def carregar_diretorio(diretorio, trabalhadores=None):
+    """
+    Dataset de um diretório de exportações. O manifesto guarda os arquivos já
+    ingeridos (nome + hash) e a chave do dataset combinado: se só chegaram
+    arquivos novos, apenas eles passam pelo parsing e são anexados ao Parquet
+    existente. Arquivo alterado/removido força reconstrução (com os Parquet por arquivo).
+    Arquivos ilegíveis ficam fora do manifesto: são relidos (e avisados) a cada carga.
+    Retorna (df, erros).
+    """
+    arquivos = arquivos_diretorio(diretorio)
+    chave = chave_conjunto("dir", [d for _, d in arquivos])
+    man_path = _manifesto_path(diretorio)
+    manifesto = ler_json(man_path)
+    df = ler_parquet(chave)
+    if df is not None:
+        # Arquivos ignorados continuam sendo avisados enquanto estiverem na pasta
+        return df, manifesto.get("erros", []) if manifesto.get("chave") == chave else []
+
+    anteriores = dict(manifesto.get("arquivos", []))
+    atuais = {os.path.basename(c): d for c, d in arquivos}
+
+    base = None
+    if anteriores and all(atuais.get(n) == d for n, d in anteriores.items()):
+        base = ler_parquet(manifesto.get("chave", ""))
+    pendentes = arquivos if base is None else [(c, d) for c, d in arquivos if os.path.basename(c) not in anteriores]
+
+    resultado = ler_em_paralelo([(os.path.basename(c), c, d) for c, d in pendentes], trabalhadores)
+    df = anexar(base, [p for _, p, _ in resultado])
+    if df is None:
+        df = pd.DataFrame()
+
+    falhas = {n for n, _, e in resultado if e}
+    erros = [f"{n}: {e}" for n, _, e in resultado if e]
+    gravar_parquet(chave, df)
+    ingeridos = [[os.path.basename(c), d] for c, d in arquivos if os.path.basename(c) not in falhas]
+    gravar_json(man_path, {"arquivos": ingeridos, "chave": chave, "erros": erros})
+    return df, erros
+
+
+def carregar_arquivos(arquivos, trabalhadores=None):
+    """
+    Vários arquivos em memória (uploads): [(nome, bytes, digest)] em ordem.
+    Cada arquivo tem seu Parquet; só os ainda não convertidos passam pelo parsing.
+    Retorna (df, erros).
+    """
+    chave = chave_conjunto("uploads", [d for _, _, d in arquivos])
+    df = ler_parquet(chave)
+    if df is not None:
+        return df, []
+
+    resultado = ler_em_paralelo(list(arquivos), trabalhadores)
+    df = anexar(None, [p for _, p, _ in resultado])
+    if df is None:
+        df = pd.DataFrame()
+    gravar_parquet(chave, df)
+    return df, [f"{n}: {e}" for n, _, e in resultado if e]
+
+
+# ---------- Fontes ----------
+def fonte_caminho(caminho, tipo=None):
+    """
+    (chave, tipo, origem) de uma fonte em disco: diretório de exportações, CSV
+    limpo ou Excel. None se o caminho não existe ou não tem arquivos suportados.
+    """
+    if os.path.isdir(caminho):
+        arquivos = arquivos_diretorio(caminho)
+        if not arquivos:
+            return None
+        return chave_conjunto("dir", [d for _, d in arquivos]), "diretorio", caminho
+    if not os.path.isfile(caminho):
+        return None
+    tipo = tipo or EXTENSOES.get(os.path.splitext(caminho)[1].lower(), "excel")
+    return chave_fonte(tipo, digest_arquivo(caminho)), tipo, caminho
+
+
+def carregar(chave, tipo, origem, trabalhadores=None):
+    """
+    Carrega qualquer fonte resolvida (ver fonte_caminho) e devolve (df, erros).
+    `df.attrs["chave"]` identifica o conteúdo para os caches derivados (cubo etc.).
+    """
+    erros = []
+    if tipo == "diretorio":
+        df, erros = carregar_diretorio(origem, trabalhadores)
+    elif tipo == "uploads":
+        df, erros = carregar_arquivos(origem, trabalhadores)
+    else:
+        try:
+            df = carregar_fonte(chave, tipo, origem)
+        except ErroIngestao as e:
+            df, erros = pd.DataFrame(), [str(e)]
+    df.attrs["chave"] = chave
+    return df, erros
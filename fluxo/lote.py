@@ -0,0 +1,61 @@
+"""
+Pré-cálculo em lote (sem Streamlit): ranking, alertas e perfil horário de
+todas as lojas gravados em arquivos, com o mesmo código que o dashboard usa.
+"""
+import os
+import json
+from datetime import datetime
+
+import pandas as pd
+
+from fluxo.alertas import (
+    baseline_alertas, classificar_alertas, filtrar_alertas, filtrar_sequencias, sequencias_zero,
+)
+from fluxo.cubo import montar_cubo, recortar, kpis, ranking_lojas, serie_diaria, soma_loja_hora
+from fluxo.exportar import FORMATOS_EXPORT, gerar_export
+
+
+def precalcular(df, saida, formato="Parquet", janela=7, x=20, y=40, inicio=None, fim=None, minimo_zero=4):
+    """
+    Grava em `saida` ranking, alertas, perfil_horario e zero_prolongado (todas as lojas e horas,
+    período [inicio, fim] — a base inteira por padrão) + resumo.json com os
+    parâmetros e KPIs. Retorna o resumo.
+    """
+    cubo = montar_cubo(df)
+    inicio = pd.Timestamp(inicio) if inicio else cubo.datas[0]
+    fim = pd.Timestamp(fim) if fim else cubo.datas[-1]
+    lojas = cubo.lojas.tolist()
+    rec = recortar(cubo, inicio, fim, lojas, (0, 23))
+
+    # O baseline usa o histórico anterior ao período, como no dashboard
+    alertas = classificar_alertas(filtrar_alertas(baseline_alertas(cubo, janela), inicio, fim, lojas), x, y)
+    tabelas = {
+        "ranking": ranking_lojas(rec),
+        "alertas": alertas,
+        "perfil_horario": soma_loja_hora(rec),
+        "zero_prolongado": filtrar_sequencias(sequencias_zero(cubo, minimo_zero), inicio, fim, lojas),
+    }
+
+    os.makedirs(saida, exist_ok=True)
+    ext, _ = FORMATOS_EXPORT[formato]
+    arquivos = {}
+    for nome, t in tabelas.items():
+        arquivos[nome] = os.path.join(saida, f"{nome}{ext}")
+        with open(arquivos[nome], "wb") as f:
+            f.write(gerar_export(t, formato))
+
+    k = kpis(serie_diaria(rec))
+    resumo = {
+        "fonte": df.attrs.get("chave"),
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "periodo": [inicio.date().isoformat(), fim.date().isoformat()],
+        "parametros": {"janela": janela, "alerta_pct": x, "critico_pct": y, "minimo_zero": minimo_zero},
+        "lojas": len(lojas),
+        "fluxo_total": k["total"],
+        "media_dia": float(k["media_dia"]),
+        "alertas": alertas["Status"].value_counts().to_dict(),
+        "arquivos": arquivos,
+    }
+    with open(os.path.join(saida, "resumo.json"), "w", encoding="utf-8") as f:
+        json.dump(resumo, f, ensure_ascii=False, indent=2)
+    return resumo
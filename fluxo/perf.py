@@ -0,0 +1,121 @@
+"""
+Instrumentação opcional de um rerun: tempo por seção, RSS do processo,
+tamanho dos frames intermediários e cProfile.
+"""
+import io
+import time
+import marshal
+import pstats
+import cProfile
+import threading
+
+import pandas as pd
+import psutil
+
+from fluxo.cache import tamanho
+
+
+class Medidor:
+    """
+    Seções sequenciais: etapa(nome) fecha a seção corrente e abre a próxima;
+    fim() fecha a última. Inativo, todos os métodos são no-op (custo zero fora do debug).
+    O cProfile só enxerga a thread que o liga: o que roda em outras threads entra
+    no perfil embrulhado por tarefa(fn).
+    """
+
+    def __init__(self, ativo=True, perfilar=False):
+        self.ativo = ativo
+        self.secoes = []   # (nome, segundos)
+        self.frames = []   # (nome, forma, bytes)
+        self.total = 0.0
+        self._atual = None
+        self._perfil = None
+        self._perfis_tarefas = []  # um cProfile por tarefa de outra thread
+        self._lock = threading.Lock()
+        self._fechado = False
+        if not ativo:
+            return
+        self._processo = psutil.Process()
+        self.rss_inicio = self.rss_fim = self._processo.memory_info().rss
+        self._t0 = self._marca = time.perf_counter()
+        if perfilar:
+            self._perfil = cProfile.Profile()
+            self._perfil.enable()
+
+    def etapa(self, nome):
+        if not self.ativo or self._fechado:
+            return
+        agora = time.perf_counter()
+        if self._atual is not None:
+            self.secoes.append((self._atual, agora - self._marca))
+        self._atual, self._marca = nome, agora
+
+    def tarefa(self, fn):
+        """fn embrulhada para rodar com cProfile na thread que a executar (pool); fn se não há perfil."""
+        if self._perfil is None:
+            return fn
+
+        def perfilada():
+            perfil = cProfile.Profile()
+            try:
+                return perfil.runcall(fn)
+            finally:
+                with self._lock:
+                    self._perfis_tarefas.append(perfil)
+        return perfilada
+
+    def frame(self, nome, obj):
+        """Registra o tamanho em memória de um intermediário (DataFrame, array, Cubo...)."""
+        if not self.ativo or obj is None:
+            return
+        forma = getattr(obj, "shape", None) or getattr(getattr(obj, "valores", None), "shape", None)
+        self.frames.append((nome, forma, tamanho(obj)))
+
+    def fim(self):
+        if not self.ativo or self._fechado:
+            return
+        if self._perfil is not None:
+            self._perfil.disable()
+        self.etapa(None)
+        self._fechado = True
+        self.total = time.perf_counter() - self._t0
+        self.rss_fim = self._processo.memory_info().rss
+
+    def tabela_secoes(self):
+        t = pd.DataFrame(self.secoes, columns=["Seção", "s"])
+        t = t.groupby("Seção", sort=False, as_index=False)["s"].sum()
+        return pd.DataFrame({
+            "Seção": t["Seção"],
+            "ms": (t["s"] * 1000).round(1),
+            "%": (t["s"] / self.total * 100).round(1) if self.total else 0.0,
+        })
+
+    def tabela_frames(self):
+        return pd.DataFrame({
+            "Frame": [n for n, _, _ in self.frames],
+            "Forma": ["×".join(map(str, f)) if f else "—" for _, f, _ in self.frames],
+            "MB": [round(b / 2**20, 2) for _, _, b in self.frames],
+        }).sort_values("MB", ascending=False, kind="stable")
+
+    def _estatisticas(self, stream=None):
+        """pstats da thread principal somado ao das tarefas perfiladas que já terminaram."""
+        stats = pstats.Stats(self._perfil, stream=stream)
+        with self._lock:
+            tarefas = list(self._perfis_tarefas)
+        if tarefas:
+            stats.add(*tarefas)
+        return stats
+
+    def perfil_texto(self, linhas=25):
+        """Top funções por tempo acumulado (pstats), ou '' sem cProfile."""
+        if self._perfil is None:
+            return ""
+        buf = io.StringIO()
+        self._estatisticas(buf).sort_stats("cumulative").print_stats(linhas)
+        return buf.getvalue()
+
+    def perfil_bytes(self):
+        """Dump no formato .prof (o mesmo de pstats.dump_stats), ou None sem cProfile."""
+        if self._perfil is None:
+            return None
+        return marshal.dumps(self._estatisticas().stats)
@@ -0,0 +1,81 @@
+"""Séries longas: buckets de tempo (dia/semana/mês) e LTTB."""
+import numpy as np
+import pandas as pd
+
+# (frequência pandas, dias aproximados por ponto, sufixo do título do eixo)
+RESOLUCOES = {
+    "Dia": ("D", 1, "diária"),
+    "Semana": ("W-MON", 7, "semanal"),
+    "Mês": ("MS", 30, "mensal"),
+}
+
+
+def lttb(x, y, alvo):
+    """
+    Largest-Triangle-Three-Buckets: índices de `alvo` pontos que preservam a forma
+    da série (primeiro e último sempre entram). Pontos escolhidos são valores reais.
+    """
+    n = len(x)
+    if alvo >= n or alvo < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    bordas = (np.arange(alvo - 1) * (n - 2) / (alvo - 2)).astype(np.int64) + 1
+    bordas[-1] = n - 1
+
+    idx = np.empty(alvo, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(alvo - 2):
+        ini, fim = bordas[i], bordas[i + 1]
+        # Vértice C = média do próximo bucket (ou o último ponto)
+        prox_fim = bordas[i + 2] if i + 2 < len(bordas) else n
+        cx, cy = x[fim:prox_fim].mean(), y[fim:prox_fim].mean()
+        area = np.abs((x[a] - cx) * (y[ini:fim] - y[a]) - (x[a] - x[ini:fim]) * (cy - y[a]))
+        a = ini + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+
+def escolher_resolucao(n_dias, alvo):
+    """Resolução mais fina cujo nº de pontos cabe no alvo."""
+    for nome, (_, dias, _) in RESOLUCOES.items():
+        if n_dias / dias <= alvo:
+            return nome
+    return "Mês"
+
+
+def reamostrar_serie(df, modo="Automática", alvo=500, por=None, col="Fluxo"):
+    """
+    Reduz uma série diária (colunas Data/col, opcionalmente uma por `por`) para o gráfico.
+    - Dia/Semana/Mês: soma por bucket + Fim/Dias/Mín./Máx. diários para o tooltip;
+    - LTTB: mantém `alvo` dias reais por série;
+    - Automática: bucket mais fino que caiba em `alvo` pontos.
+    Retorna (df_plot, sufixo_do_titulo).
+    """
+    if df.empty:
+        return df, "diária"
+    grupos = [por] if por else []
+
+    if modo == "LTTB":
+        partes = []
+        for _, g in (df.groupby(por, observed=True, sort=False) if por else [(None, df)]):
+            g = g.sort_values("Data")
+            partes.append(g.iloc[lttb(g["Data"].to_numpy().view("int64"), g[col].to_numpy(), alvo)])
+        return pd.concat(partes, ignore_index=True), "diária"
+
+    if modo == "Automática":
+        n_dias = (df["Data"].max() - df["Data"].min()).days + 1
+        modo = escolher_resolucao(n_dias, alvo)
+    freq, _, sufixo = RESOLUCOES[modo]
+    if modo == "Dia":
+        return df, sufixo
+
+    t = (
+        df.groupby(grupos + [pd.Grouper(key="Data", freq=freq, label="left", closed="left")], observed=True)[col]
+          .agg(["sum", "count", "min", "max"])
+          .reset_index()
+          .rename(columns={"sum": col, "count": "Dias", "min": "Mín. dia", "max": "Máx. dia"})
+    )
+    t["Fim"] = t["Data"] + pd.tseries.frequencies.to_offset(freq) - pd.Timedelta(days=1)
+    return t, sufixo
@@ -0,0 +1,81 @@
+"""
+Gerador de dados sintéticos no formato das exportações (Company, Loja, ID_Loja,
+Data, Hora, Fluxo) — para benchmarks e testes de escala sem dados reais.
+
+Cada loja tem horário de funcionamento próprio, nível de movimento, perfil
+horário com picos de almoço e fim de tarde, efeito do dia da semana e
+sazonalidade anual. Há dias fechados (fluxo 0 o dia todo) e falhas de sensor
+(sequências de horas com fluxo 0).
+"""
+import numpy as np
+import pandas as pd
+
+from fluxo.ingest import ESQUEMA
+
+# Multiplicador por dia da semana (segunda..domingo)
+FATOR_SEMANA = np.array([0.85, 0.90, 0.95, 1.00, 1.10, 1.35, 1.20])
+
+
+def _perfil_horario():
+    h = np.arange(24)
+    return np.exp(-((h - 12.5) ** 2) / 6.0) + 0.8 * np.exp(-((h - 18) ** 2) / 5.0) + 0.25
+
+
+def gerar(lojas=50, dias=90, inicio="2024-01-01", semente=0, company="SEED",
+          prob_fechado=0.01, prob_falha=0.03, lojas_por_bloco=250):
+    """
+    DataFrame no ESQUEMA compacto com uma linha por loja/dia/hora de funcionamento.
+    `prob_fechado`: chance de um dia fechado por loja; `prob_falha`: chance de um
+    dia ter uma falha de sensor (2 a 8 horas seguidas com fluxo 0).
+    Gerado em blocos de lojas para limitar a memória intermediária.
+    """
+    rng = np.random.default_rng(semente)
+    datas = pd.date_range(inicio, periods=dias, freq="D")
+    dia_ano = datas.dayofyear.to_numpy()
+    fator_dia = FATOR_SEMANA[datas.dayofweek.to_numpy()] * (1 + 0.15 * np.sin(2 * np.pi * (dia_ano - 80) / 365.25))
+    perfil = _perfil_horario()
+    horas = np.arange(24)
+
+    abre = rng.integers(8, 11, lojas)     # primeira hora aberta
+    fecha = rng.integers(20, 23, lojas)   # última hora aberta
+    nivel = rng.lognormal(np.log(25), 0.6, lojas)
+
+    partes = {"li": [], "di": [], "hi": [], "fluxo": []}
+    for ini in range(0, lojas, lojas_por_bloco):
+        b = slice(ini, min(lojas, ini + lojas_por_bloco))
+        n = b.stop - b.start
+        lam = nivel[b, None, None] * fator_dia[None, :, None] * perfil[None, None, :]
+        fluxo = rng.poisson(lam).astype(np.int32)
+
+        fluxo[rng.random((n, dias)) < prob_fechado] = 0
+        falha = rng.random((n, dias)) < prob_falha
+        comeco = rng.integers(abre[b, None], fecha[b, None] + 1, (n, dias))
+        duracao = rng.integers(2, 9, (n, dias))
+        em_falha = falha[..., None] & (horas >= comeco[..., None]) & (horas < (comeco + duracao)[..., None])
+        fluxo[em_falha] = 0
+
+        aberta = (horas >= abre[b, None]) & (horas <= fecha[b, None])
+        li, di, hi = np.nonzero(np.broadcast_to(aberta[:, None, :], fluxo.shape))
+        partes["li"].append((li + b.start).astype(np.int32))
+        partes["di"].append(di.astype(np.int32))
+        partes["hi"].append(hi.astype(np.int8))
+        partes["fluxo"].append(fluxo[li, di, hi])
+
+    li, di, hi, fluxo = (np.concatenate(partes[c]) for c in ["li", "di", "hi", "fluxo"])
+    largura = len(str(lojas - 1))
+    nomes = [f"Loja {i:0{largura}d}" for i in range(lojas)]
+    ids = [f"ID{i:0{largura}d}" for i in range(lojas)]
+    df = pd.DataFrame({
+        "Company": pd.Categorical.from_codes(np.zeros(len(li), dtype=np.int8), categories=[company]),
+        "Loja": pd.Categorical.from_codes(li, categories=nomes),
+        "ID_Loja": pd.Categorical.from_codes(li, categories=ids),
+        "Data": datas.to_numpy()[di],
+        "Hora": hi,
+        "Fluxo": fluxo,
+    })
+    return df.astype({c: t for c, t in ESQUEMA.items() if t != "category"})
+
+
+def gravar_csv(df, caminho):
+    """Grava no formato do CSV limpo (Data dd/mm/aaaa), como fluxo_seed_limpo.csv."""
+    df.to_csv(caminho, index=False, date_format="%d/%m/%Y")
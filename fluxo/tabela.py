@@ -0,0 +1,87 @@
+"""Linhas filtradas e a ordem/paginação da tabela interativa."""
+import numpy as np
+import pandas as pd
+
+from fluxo.ingest import ESQUEMA
+
+
+def filtrar_linhas(df, inicio, fim, lojas_sel, horas, indice=None):
+    """
+    Linhas do filtro (período, lojas, faixa de horas). Com o índice por loja/dia
+    (fluxo.indice), lê só as faixas das lojas selecionadas e testa a hora nelas;
+    sem índice, máscara sobre todas as linhas.
+    """
+    if indice is not None:
+        pos = indice.posicoes(inicio, fim, lojas_sel)
+        h = df["Hora"].to_numpy()[pos]
+        return df.iloc[pos[(h >= horas[0]) & (h <= horas[1])]]
+    mask = (
+        (df["Data"].between(inicio, fim)) &
+        (df["Loja"].isin(lojas_sel)) &
+        (df["Hora"].between(horas[0], horas[1]))
+    )
+    return df.loc[mask].copy()
+
+
+def linhas_do_recorte(rec, empresas=None):
+    """
+    Linhas do recorte do cubo (células com registro), em ordem (Loja, Data, Hora)
+    e no ESQUEMA — a tabela do modo ao vivo, que não guarda a base de linhas.
+    ID_Loja e Company (`empresas`, Series por loja) são um por loja.
+    """
+    n_dias, n_horas = rec.valores.shape[1:]
+    plano = np.flatnonzero(rec.presenca)                    # ordem: loja, dia, hora
+    li, resto = np.divmod(plano, n_dias * n_horas)
+    di, hi = np.divmod(resto, n_horas)
+
+    def por_loja(valores):
+        # category montada sobre as lojas e expandida pelos códigos (sem fatorar as linhas)
+        cat = pd.Categorical(valores)
+        return pd.Categorical.from_codes(cat.codes[li], categories=cat.categories)
+
+    colunas = {}
+    if empresas is not None:
+        colunas["Company"] = por_loja(empresas.reindex(rec.lojas).to_numpy())
+    colunas["Loja"] = pd.Categorical.from_codes(li, categories=rec.lojas)
+    colunas["ID_Loja"] = por_loja(rec.id_lojas)
+    colunas["Data"] = rec.datas.to_numpy()[di]
+    colunas["Hora"] = rec.horas.astype(ESQUEMA["Hora"])[hi]
+    colunas["Fluxo"] = rec.valores.reshape(-1)[plano].astype(ESQUEMA["Fluxo"], copy=False)
+    # Colunas recém-criadas: o DataFrame não precisa copiá-las
+    return pd.DataFrame(colunas, copy=False)
+
+
+def _contem(col, texto):
+    """Máscara 'contém texto' (sem diferenciar maiúsculas); em category testa só os rótulos."""
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        ok = col.cat.categories.astype(str).str.contains(texto, case=False, regex=False)
+        codigos = col.cat.codes.to_numpy()
+        return np.append(ok, False)[codigos]  # código -1 (vazio) cai no False final
+    return col.astype(str).str.contains(texto, case=False, regex=False).to_numpy()
+
+
+def ordem_grid(df_f, coluna, crescente=True, texto=""):
+    """Posições (iloc) das linhas de df_f filtradas por texto e ordenadas (ordenação estável)."""
+    pos = np.arange(len(df_f))
+    if texto:
+        mask = np.zeros(len(df_f), dtype=bool)
+        for c in ["Loja", "ID_Loja"]:
+            if c in df_f.columns:
+                mask |= _contem(df_f[c], texto)
+        pos = pos[mask]
+
+    col = df_f[coluna]
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        chave = col.cat.codes.to_numpy()  # categorias já ordenadas
+    elif pd.api.types.is_datetime64_any_dtype(col):
+        chave = col.to_numpy().view("int64")
+    else:
+        chave = col.to_numpy()
+    chave = chave[pos].astype(np.int64) if chave.dtype.kind in "iub" else chave[pos]
+    return pos[np.argsort(chave if crescente else -chave, kind="stable")]
+
+
+def pagina(df_f, ordem, tamanho, numero):
+    """Linhas da página `numero` (1-based) na ordem dada e a posição da primeira."""
+    ini = (numero - 1) * tamanho
+    return df_f.iloc[ordem[ini:ini + tamanho]], ini
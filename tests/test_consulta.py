@@ -0,0 +1,26 @@
+"""Regressões do backend DuckDB (fluxo.consulta)."""
+import os
+
+import pytest
+
+from fluxo import consulta, ingest
+
+pytest.importorskip("duckdb")
+
+
+def test_csv_convertido_em_pasta_com_aspas(tmp_path, monkeypatch):
+    cache = tmp_path / "cache d'arquivos"
+    monkeypatch.setattr(ingest, "CACHE_DIR", str(cache))
+    fonte = tmp_path / "fluxo.csv"
+    fonte.write_text("Company,Loja,ID_Loja,Data,Hora,Fluxo\nC,Loja 1,1,01/01/2024,10,5\nC,Loja 2,2,02/01/2024,9,3\n")
+    base = consulta.BaseDuckDB(str(fonte))
+    assert base.contar(*base.dominio()[:3], (0, 23)) == 2
+    assert not [n for n in os.listdir(cache) if n.endswith(".tmp")]
+
+
+def test_csv_sem_coluna_obrigatoria(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "CACHE_DIR", str(tmp_path / "cache"))
+    fonte = tmp_path / "fluxo.csv"
+    fonte.write_text("Loja,Data,Hora,Fluxo\nLoja 1,01/01/2024,10,5\n")
+    with pytest.raises(ingest.ErroIngestao, match="ID_Loja"):
+        consulta.BaseDuckDB(str(fonte))
@@ -0,0 +1,51 @@
+"""Regressões da ingestão (fluxo.ingest)."""
+import io
+
+import openpyxl
+
+from fluxo import ingest
+
+
+def _planilha(linhas):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for linha in linhas:
+        ws.append(linha)
+    buf = io.BytesIO()
+    wb.save(buf)
+    return io.BytesIO(buf.getvalue())
+
+
+def test_excel_com_linha_em_branco_apos_o_cabecalho():
+    origem = _planilha([
+        ["Company", "Loja", "ID_Loja", "Data", "Hora", "Fluxo"],
+        ["C", "Loja 1", "1", "01/01/2024", 10, 5],
+        [],
+        ["C", "Loja 1", "1", "01/01/2024", 11, 7],
+        ["C", "Loja 2", "2", "02/01/2024", 9, 3],
+    ])
+    df = ingest.compactar(ingest.ler_excel(origem))
+    assert len(df) == 3
+    assert df["Fluxo"].sum() == 15
+
+
+def test_diretorio_continua_avisando_arquivo_ilegivel(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "CACHE_DIR", str(tmp_path / "cache"))
+    pasta = tmp_path / "dados"
+    pasta.mkdir()
+    cabecalho = "Company,Loja,ID_Loja,Data,Hora,Fluxo\n"
+    (pasta / "a.csv").write_text(cabecalho + "C,Loja 1,1,01/01/2024,10,5\n")
+    (pasta / "c.csv").write_text("x,y\n1,2\n")
+    _, erros = ingest.carregar_diretorio(str(pasta), trabalhadores=1)
+    assert [e.split(":")[0] for e in erros] == ["c.csv"]
+
+    # Arquivo novo anexado: o ilegível continua sendo avisado, na carga e no cache
+    (pasta / "d.csv").write_text(cabecalho + "C,Loja 2,2,01/01/2024,11,7\n")
+    for _ in range(2):
+        df, erros = ingest.carregar_diretorio(str(pasta), trabalhadores=1)
+        assert len(df) == 2
+        assert [e.split(":")[0] for e in erros] == ["c.csv"]
+
+    (pasta / "c.csv").unlink()
+    df, erros = ingest.carregar_diretorio(str(pasta), trabalhadores=1)
+    assert len(df) == 2 and erros == []